@@ -0,0 +1,5 @@
+"""Headless entry point, see python -m core --help"""
+
+from .cli import main
+
+main()
@@ -0,0 +1,171 @@
+"""Species base stats kept as one (species, 6) uint8 array"""
+
+import csv
+from pathlib import Path
+import numpy as np
+
+STAT_NAMES = ("HP", "Atk", "Def", "SpA", "SpD", "Spe")
+# bytes per entry of the gen 6 personal tables, personal_xy and personal_ao
+XY_PERSONAL_ENTRY_SIZE = 0x40
+ORAS_PERSONAL_ENTRY_SIZE = 0x50
+PERSONAL_ENTRY_SIZES = (XY_PERSONAL_ENTRY_SIZE, ORAS_PERSONAL_ENTRY_SIZE)
+# personal tables store hp, atk, def, spe, spa, spd
+PERSONAL_ORDER = (0, 1, 2, 4, 5, 3)
+
+# species commonly searched for in XY and ORAS, full tables are loaded from a
+# personal dump or a csv with BaseStatTable.load
+BUNDLED = """\
+Bulbasaur 45 49 49 65 65 45
+Charmander 39 52 43 60 50 65
+Squirtle 44 48 65 50 64 43
+Lapras 130 85 80 85 95 60
+Eevee 55 55 50 45 65 55
+Omanyte 35 40 100 90 55 35
+Kabuto 30 80 90 55 45 55
+Aerodactyl 80 105 65 60 75 130
+Snorlax 160 110 65 65 110 30
+Articuno 90 85 100 95 125 85
+Zapdos 90 90 85 125 90 100
+Moltres 90 100 90 125 85 90
+Mewtwo 106 110 90 154 90 130
+Raikou 90 85 75 115 100 115
+Entei 115 115 85 90 75 100
+Suicune 100 75 115 90 115 85
+Lugia 106 90 130 90 154 110
+Ho-Oh 106 130 90 110 154 90
+Lileep 66 41 77 61 87 23
+Anorith 45 95 50 40 50 75
+Castform 70 70 70 70 70 70
+Beldum 40 55 80 35 60 30
+Regirock 80 100 200 50 100 50
+Regice 80 50 100 100 200 50
+Registeel 80 75 150 75 150 50
+Latias 80 80 90 110 130 110
+Latios 80 90 80 130 110 110
+Kyogre 100 100 90 150 140 90
+Groudon 100 150 140 100 90 90
+Rayquaza 105 150 90 150 90 95
+Deoxys 50 150 50 150 50 150
+Cranidos 67 125 40 30 30 58
+Shieldon 30 42 118 42 88 30
+Uxie 75 75 130 75 130 95
+Mesprit 80 105 105 105 105 80
+Azelf 75 125 70 125 70 115
+Dialga 100 120 120 150 100 90
+Palkia 90 120 100 150 120 100
+Heatran 91 90 106 130 106 77
+Regigigas 110 160 110 80 110 100
+Giratina 150 100 120 100 120 90
+Cresselia 120 70 120 75 130 85
+Tirtouga 54 78 103 53 45 22
+Archen 55 112 45 74 45 70
+Tornadus 79 115 70 125 80 111
+Thundurus 79 115 70 125 80 111
+Reshiram 100 120 100 150 120 90
+Zekrom 100 150 120 120 100 90
+Landorus 89 125 90 115 80 101
+Kyurem 125 130 90 130 90 95
+Tyrunt 58 89 77 45 45 48
+Amaura 77 59 50 67 63 46
+Xerneas 126 131 95 131 98 99
+Yveltal 126 131 95 131 98 99
+Zygarde 108 100 121 81 95 95
+"""
+
+
+def personal_entry_size(length: int) -> int:
+    """Entry size of a personal dump from its length in bytes"""
+    sizes = [size for size in PERSONAL_ENTRY_SIZES if length and length % size == 0]
+    if len(sizes) != 1:
+        raise ValueError(
+            f"Cannot tell the personal table of a {length} byte dump, give its "
+            f"entry size ({XY_PERSONAL_ENTRY_SIZE:#x} for XY, "
+            f"{ORAS_PERSONAL_ENTRY_SIZE:#x} for ORAS)"
+        )
+    return sizes[0]
+
+
+class BaseStatTable:
+    """Base stats by species, HP, Atk, Def, SpA, SpD, Spe per row, six bytes
+    per species so a full dex with forms stays a few kilobytes"""
+
+    def __init__(self, names: list[str], base_stats: np.ndarray) -> None:
+        self.names = names
+        self.base_stats = np.asarray(base_stats, np.uint8).reshape(-1, 6)
+        self.indices = {name.lower(): index for index, name in enumerate(names)}
+
+    @classmethod
+    def from_text(cls, text: str) -> "BaseStatTable":
+        """Table from lines of a name followed by its six base stats"""
+        rows = [line.rsplit(maxsplit=6) for line in text.splitlines() if line]
+        return cls(
+            [row[0] for row in rows], np.array([row[1:] for row in rows], np.uint8)
+        )
+
+    @classmethod
+    def from_csv(cls, path) -> "BaseStatTable":
+        """Table from a csv of name,hp,atk,def,spa,spd,spe rows, a header row
+        is skipped"""
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = [
+                row
+                for row in csv.reader(f)
+                if len(row) >= 7 and row[1].strip().isdigit()
+            ]
+        return cls(
+            [row[0] for row in rows], np.array([row[1:7] for row in rows], np.uint8)
+        )
+
+    @classmethod
+    def from_personal(
+        cls, data: bytes, names: list[str] = None, entry_size: int = None
+    ) -> "BaseStatTable":
+        """Table from a game's personal data, species are named by their
+        index unless names are given, the entry size is taken from the length
+        of the data unless given"""
+        if entry_size is None:
+            entry_size = personal_entry_size(len(data))
+        entries = np.frombuffer(
+            data, np.uint8, len(data) // entry_size * entry_size
+        ).reshape(-1, entry_size)
+        base_stats = entries[:, PERSONAL_ORDER]
+        if names is None:
+            names = [str(index) for index in range(len(entries))]
+        return cls(names[: len(entries)], base_stats[: len(names)])
+
+    @classmethod
+    def load(cls, path, entry_size: int = None) -> "BaseStatTable":
+        """Table from a csv file or a personal dump, a names.txt of one
+        species per line next to a personal dump names its entries"""
+        path = Path(path)
+        if path.suffix.lower() == ".csv":
+            return cls.from_csv(path)
+        names_path = path.with_name("names.txt")
+        names = (
+            names_path.read_text(encoding="utf-8").splitlines()
+            if names_path.exists()
+            else None
+        )
+        return cls.from_personal(path.read_bytes(), names, entry_size)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def index(self, species) -> int:
+        """Row of a species by name or index"""
+        if isinstance(species, str) and not species.isdigit():
+            try:
+                return self.indices[species.lower()]
+            except KeyError:
+                raise ValueError(f"Unknown species {species!r}") from None
+        index = int(species)
+        if not 0 <= index < len(self.names):
+            raise ValueError(f"Unknown species {species!r}")
+        return index
+
+    def lookup(self, species) -> np.ndarray:
+        """Base stats of a species by name or index"""
+        return self.base_stats[self.index(species)]
+
+
+BASE_STATS = BaseStatTable.from_text(BUNDLED)
@@ -0,0 +1,291 @@
+"""Benchmarks of the search kernels, host verifiers and GUI startup
+
+Kernel cases run an engine's first chunk capped to a fixed seed slice,
+including result readback and host verification, so they work on any OpenCL
+device including PoCL on a cpu. Verifier cases time the numba functions on a
+fixed candidate set. Startup cases time fresh interpreters importing and
+showing the main window.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+import numpy as np
+import pyopencl as cl
+
+from .cache import cache_dir, atomic_write
+from .shaders.autotune import device_key
+from .shaders.engine import SearchEngine
+from .shaders.iv_search import IVSearch, test_seed, test_seeds
+from .shaders.multi_iv_search import MultiIVSearch
+from .shaders.pokemon_blink import (
+    PokemonBlinkSearch,
+    find_matching_advances,
+    find_matching_advances_batch,
+)
+from .shaders.soaring_fidget import SoaringFidgetSearch
+from .shaders.unique_hash import UniqueHashBatchSearch, UniqueHashSearch
+
+# higher is better for rates, lower is better for times
+METRICS = {
+    "seeds_per_second": 1,
+    "candidates_per_second": 1,
+    "time_to_first_result": -1,
+    "startup_time": -1,
+}
+
+# code run in a fresh interpreter, timing up to the end of the snippet
+STARTUP_CASES = {
+    "import": "from core.window.main_window import MainWindow",
+    "startup": "\n".join(
+        (
+            "from qtpy.QtWidgets import QApplication",
+            "from core.window.main_window import MainWindow",
+            "app = QApplication([])",
+            "window = MainWindow()",
+            "app.processEvents()",
+        )
+    ),
+}
+
+
+class ElidedIVSearch(IVSearch):
+    """IV search forced onto the state-eliding kernels, which are otherwise
+    not used on cpus"""
+
+    def kernel_name(self, device: cl.Device) -> str:
+        """Name of the kernel used on a device"""
+        return super().kernel_name(device).removesuffix("_elided") + "_elided"
+
+
+# fixed specs with few enough candidates per slice to never fill result buffers
+KERNEL_CASES: dict[str, tuple[type[SearchEngine], dict]] = {
+    "iv": (
+        IVSearch,
+        {
+            "ivs_1": [31, 0, 31, 0, 31, 0],
+            "ivs_2": [0, 31, 0, 31, 0, 31],
+            "advance_range_1": [600, 800],
+            "advance_range_2": [0, 10],
+        },
+    ),
+    "iv_range": (
+        IVSearch,
+        {
+            "ivs_1": [30] * 6,
+            "ivs_max_1": [31] * 6,
+            "advance_range_1": [0, 50],
+        },
+    ),
+    "iv_range_elided": (
+        ElidedIVSearch,
+        {
+            "ivs_1": [30] * 6,
+            "ivs_max_1": [31] * 6,
+            "advance_range_1": [0, 50],
+        },
+    ),
+    "multi_iv": (
+        MultiIVSearch,
+        {
+            "targets": [
+                {
+                    "ivs_1": [(target * 7 + stat * 3) % 32 for stat in range(6)],
+                    "ivs_2": [(target * 5 + stat * 11) % 32 for stat in range(6)],
+                    "advance_range_1": [600, 800],
+                    "advance_range_2": [0, 10],
+                }
+                for target in range(16)
+            ]
+        },
+    ),
+    "blink": (
+        PokemonBlinkSearch,
+        {
+            "blinks": [120, 60, 200, 10, 90],
+            "leeway": 5,
+            "advance_range": [0, 30],
+            "search_type": "partial",
+        },
+    ),
+    "fidget": (
+        SoaringFidgetSearch,
+        {"gaps": [2, 4, 2, 3, 21, 4, 0, 0], "advance_range": [0, 5]},
+    ),
+    "unique_hash": (UniqueHashSearch, {"low": 0, "high": 0}),
+    "unique_hash_batch": (
+        UniqueHashBatchSearch,
+        {
+            "targets": [
+                {"low": target, "high": target * 0x9E3779B1 % (1 << 32)}
+                for target in range(64)
+            ]
+        },
+    ),
+}
+
+
+def benchmark_kernel(
+    engine_class: type[SearchEngine],
+    spec: dict,
+    device: cl.Device,
+    seeds: int,
+    repeats: int,
+) -> dict:
+    """Time one chunk of a search capped to a slice of seeds"""
+    start = perf_counter()
+    engine = engine_class.from_spec([device], spec)
+    state = engine.setup_device(device)
+    try:
+        state.seed_limit = seeds
+        chunk = engine.chunks()[0]
+        engine.verify_chunk(
+            engine.collect_chunk(state, engine.enqueue_chunk(state, chunk))
+        )
+        time_to_first_result = perf_counter() - start
+
+        # best of the repeats, slower runs are noise from the rest of the system
+        elapsed = float("inf")
+        for _ in range(repeats):
+            start = perf_counter()
+            results = engine.collect_chunk(state, engine.enqueue_chunk(state, chunk))
+            engine.verify_chunk(results)
+            elapsed = min(elapsed, perf_counter() - start)
+    finally:
+        state.release()
+    return {
+        "seeds_per_second": engine.launched_seeds(state) / elapsed,
+        "candidates_per_second": len(results) / elapsed,
+        "time_to_first_result": time_to_first_result,
+    }
+
+
+def benchmark_startup(code: str, repeats: int) -> dict:
+    """Time a snippet in fresh interpreters, offscreen so no display is needed"""
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    timed = (
+        "import time\nstart = time.perf_counter()\n"
+        f"{code}\nprint(time.perf_counter() - start)"
+    )
+    elapsed = float("inf")
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", timed],
+            cwd=Path(__file__).parent.parent,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        elapsed = min(elapsed, float(output.split()[-1]))
+    return {"startup_time": elapsed}
+
+
+def benchmark_verifier(function, candidates: int, repeats: int) -> dict:
+    """Time a host verifier over a number of candidates, the first call
+    includes numba compilation"""
+    start = perf_counter()
+    function()
+    time_to_first_result = perf_counter() - start
+    elapsed = float("inf")
+    for _ in range(repeats):
+        start = perf_counter()
+        function()
+        elapsed = min(elapsed, perf_counter() - start)
+    return {
+        "candidates_per_second": candidates / elapsed,
+        "time_to_first_result": time_to_first_result,
+    }
+
+
+def verifier_cases(candidates: int) -> dict:
+    """Verifier functions to time, each over a fixed set of candidates"""
+    seeds = np.arange(0x12345678, 0x12345678 + candidates, dtype=np.uint32)
+    single_seeds = seeds[: max(candidates >> 4, 1)]
+    blinks = np.array([120, 60, 200, 10, 90], np.int64)
+    ivs = (31 << 25) | (31 << 15) | (31 << 5)
+    return {
+        "test_seed": (
+            lambda: [test_seed(seed, ivs, ivs, 600, 800) for seed in single_seeds],
+            len(single_seeds),
+        ),
+        "test_seeds": (lambda: test_seeds(seeds, ivs, ivs, 600, 800), len(seeds)),
+        "find_matching_advances": (
+            lambda: [
+                find_matching_advances(seed, blinks, 5, 0, 30) for seed in single_seeds
+            ],
+            len(single_seeds),
+        ),
+        "find_matching_advances_batch": (
+            lambda: find_matching_advances_batch(seeds, blinks, 5, 0, 30),
+            len(seeds),
+        ),
+    }
+
+
+def run_benchmarks(
+    devices: list[cl.Device],
+    seeds: int = 1 << 20,
+    candidates: int = 1 << 14,
+    repeats: int = 5,
+    cases: list[str] = None,
+):
+    """Run the benchmark cases, yielding (case, metrics) as each completes
+
+    Startup cases run first in their own interpreters, then verifiers so
+    their numba compilation is timed by their own cases. Kernel cases are
+    named "<case>@<device index>"
+    """
+    for case, code in STARTUP_CASES.items():
+        if cases and case not in cases:
+            continue
+        yield case, benchmark_startup(code, repeats)
+    for case, (function, count) in verifier_cases(candidates).items():
+        if cases and case not in cases:
+            continue
+        yield case, benchmark_verifier(function, count, repeats)
+    for index, device in enumerate(devices):
+        for case, (engine_class, spec) in KERNEL_CASES.items():
+            if cases and case not in cases:
+                continue
+            yield f"{case}@{index}", benchmark_kernel(
+                engine_class, spec, device, seeds, repeats
+            )
+
+
+def baseline_path(devices: list[cl.Device]):
+    """Default baseline path for a set of devices"""
+    key = "-".join(device_key(device) for device in devices)
+    return cache_dir("benchmarks") / f"{key}.json"
+
+
+def load_baseline(path) -> dict:
+    """Load stored benchmark results, empty if there are none"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(path, results: dict) -> None:
+    """Store benchmark results as the baseline"""
+    atomic_write(path, json.dumps(results, indent=2).encode())
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> dict:
+    """Relative change of each metric against the baseline, positive is
+    better, with the metrics that regressed by more than the tolerance"""
+    changes = {}
+    regressions = []
+    for metric, direction in METRICS.items():
+        if not baseline.get(metric) or metric not in metrics:
+            continue
+        change = (metrics[metric] / baseline[metric]) ** direction - 1
+        changes[metric] = change
+        if change < -tolerance:
+            regressions.append(metric)
+    return {"change": changes, "regressions": regressions}
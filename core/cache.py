@@ -0,0 +1,43 @@
+"""Locations for data persisted between runs"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+import numpy as np
+
+
+def cache_dir(*parts: str) -> Path:
+    """Get (and create) a per-user cache directory for gen6-gpu-tools
+
+    Respects GEN6_GPU_TOOLS_CACHE_DIR if set
+    """
+    if "GEN6_GPU_TOOLS_CACHE_DIR" in os.environ:
+        base = Path(os.environ["GEN6_GPU_TOOLS_CACHE_DIR"])
+    elif sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home())) / "gen6-gpu-tools"
+    else:
+        base = (
+            Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+            / "gen6-gpu-tools"
+        )
+    path = base.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Write a file by replacing it atomically so readers never see partial data"""
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def to_json(value):
+    """JSON encoder fallback for numpy values"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,434 @@
+"""Headless command line interface for the search engines"""
+
+import argparse
+import asyncio
+import json
+import sys
+import pyopencl as cl
+
+from .benchmark import (
+    baseline_path,
+    compare,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+from .base_stats import BASE_STATS, BaseStatTable
+from .cache import to_json
+from .iv_calculator import invert_jobs
+from .service import DEFAULT_PORT, JobService, request
+from .shaders.autotune import autotune
+from .shaders.engine import SearchEngine, get_devices, split_device
+from .shaders.iv_search import IVSearch
+from .shaders.multi_iv_search import MultiIVSearch
+from .shaders.pokemon_blink import PokemonBlinkSearch
+from .shaders.soaring_fidget import SoaringFidgetSearch
+from .shaders.unique_hash import UniqueHashBatchSearch, UniqueHashSearch
+from .shaders.verifiers import build, warm_up
+
+SEARCHES: dict[str, type[SearchEngine]] = {
+    engine.name: engine
+    for engine in (
+        IVSearch,
+        MultiIVSearch,
+        PokemonBlinkSearch,
+        SoaringFidgetSearch,
+        UniqueHashSearch,
+        UniqueHashBatchSearch,
+    )
+}
+
+
+def load_job(job: str, overrides: list[str]) -> dict:
+    """Load a job spec from a JSON string, @file or - for stdin, then apply
+    key=value overrides where value is parsed as JSON when possible"""
+    spec = {}
+    if job == "-":
+        spec = json.load(sys.stdin)
+    elif job is not None and job.startswith("@"):
+        with open(job[1:], "r", encoding="utf-8") as f:
+            spec = json.load(f)
+    elif job is not None:
+        spec = json.loads(job)
+    for override in overrides:
+        key, _, value = override.partition("=")
+        try:
+            spec[key] = json.loads(value)
+        except json.JSONDecodeError:
+            spec[key] = value
+    return spec
+
+
+def list_devices(_args: argparse.Namespace) -> None:
+    """Print available OpenCL platforms and devices as JSON lines"""
+    for platform_index, platform in enumerate(cl.get_platforms()):
+        for device_index, device in enumerate(platform.get_devices()):
+            print(
+                json.dumps(
+                    {
+                        "platform": platform_index,
+                        "device": device_index,
+                        "platform_name": platform.name,
+                        "device_name": device.name,
+                    }
+                )
+            )
+
+
+def create_engine(args: argparse.Namespace) -> SearchEngine:
+    """Construct the selected search on the selected devices"""
+    devices = get_devices(args.platform, args.device)
+    if args.fission:
+        devices = [
+            sub_device
+            for device in devices
+            for sub_device in split_device(device, args.fission)
+        ]
+    return SEARCHES[args.search].from_spec(devices, load_job(args.job, args.overrides))
+
+
+def run_search(args: argparse.Namespace) -> None:
+    """Run a search and stream its events as JSON lines"""
+    engine = create_engine(args)
+    warm_up()
+    engine.resume = args.resume
+    engine.trace_path = args.trace
+    if args.max_results is not None:
+        engine.max_results = args.max_results
+    if not args.resume and engine.has_checkpoint():
+        print(
+            json.dumps(
+                {
+                    "event": "log",
+                    "value": "A checkpoint of this search exists, "
+                    "pass --resume to continue from it",
+                }
+            )
+        )
+    try:
+        for event, value in engine.run():
+            if args.results_only and event != "results":
+                continue
+            print(json.dumps({"event": event, "value": value}, default=to_json))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        engine.request_interruption()
+
+
+def run_autotune(args: argparse.Namespace) -> None:
+    """Tune the launch profile of a search's kernel on each selected device,
+    printing each saved profile as a JSON line"""
+    engine = create_engine(args)
+    log = (lambda message: print(message, file=sys.stderr)) if args.verbose else None
+    for device in dict.fromkeys(engine.devices):
+        profile = autotune(engine, device, log)
+        print(
+            json.dumps(
+                {
+                    "device_name": device.name,
+                    "kernel": engine.profile_key(device),
+                    "profile": profile.to_json(),
+                }
+            )
+        )
+    engine.profiles.clear()
+    estimate = engine.estimate_runtime()
+    if estimate is not None:
+        print(json.dumps({"estimated_runtime": estimate}))
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    """Run the benchmark suite, printing each case as a JSON line with its
+    change against the baseline, exiting non-zero on regressions"""
+    devices = get_devices(args.platform, args.device)
+    path = args.baseline or baseline_path(devices)
+    baseline = {} if args.save_baseline else load_baseline(path)
+    results = {}
+    regressed = False
+    for case, metrics in run_benchmarks(
+        devices, args.seeds, args.candidates, args.repeats, args.cases
+    ):
+        results[case] = metrics
+        line = {"case": case, **metrics}
+        if case in baseline:
+            line["baseline"] = compare(metrics, baseline[case], args.tolerance)
+            regressed |= bool(line["baseline"]["regressions"])
+        print(json.dumps(line))
+        sys.stdout.flush()
+    if args.save_baseline:
+        save_baseline(path, results)
+    if regressed:
+        sys.exit(1)
+
+
+def run_service(args: argparse.Namespace) -> None:
+    """Serve search jobs from local clients until interrupted"""
+    service = JobService(get_devices(args.platform, args.device), SEARCHES)
+    print(
+        json.dumps(
+            {
+                "event": "log",
+                "value": f"Serving on {args.host}:{args.port} with "
+                + ", ".join(device.name for device in service.devices),
+            }
+        )
+    )
+    sys.stdout.flush()
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def submit_job(args: argparse.Namespace) -> None:
+    """Submit a job to a running service and stream its events as JSON lines"""
+    message = (
+        {"command": "status"}
+        if args.search is None
+        else {
+            "search": args.search,
+            "job": load_job(args.job, args.overrides),
+            "priority": args.priority,
+            "max_results": args.max_results,
+        }
+    )
+
+    async def stream():
+        async for reply in request(message, args.host, args.port):
+            if args.results_only and reply.get("event") != "results":
+                continue
+            print(json.dumps(reply))
+            sys.stdout.flush()
+
+    try:
+        asyncio.run(stream())
+    except KeyboardInterrupt:
+        # closing the connection cancels the job
+        pass
+
+
+def calculate_ivs(args: argparse.Namespace) -> None:
+    """Invert JSON lines of stat line jobs all at once, printing each job's
+    iv range as a JSON line in input order"""
+    table = BASE_STATS
+    if args.base_stats is not None:
+        table = BaseStatTable.load(args.base_stats, args.entry_size)
+    if args.input == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    jobs = [json.loads(line) for line in lines if line.strip()]
+    for result in invert_jobs(jobs, table):
+        print(json.dumps(result))
+
+
+def build_verifiers(args: argparse.Namespace) -> None:
+    """Compile the host verifiers ahead of time, printing the module path"""
+    print(build(args.output_dir))
+
+
+def add_search_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments selecting a search, its devices and its job spec"""
+    parser.add_argument("search", choices=SEARCHES)
+    parser.add_argument(
+        "--platform", default="0", help="comma separated platform indices or all"
+    )
+    parser.add_argument(
+        "--device",
+        default="0",
+        help="comma separated device indices or all, the search is sharded "
+        "across every selected device",
+    )
+    parser.add_argument(
+        "--fission",
+        type=int,
+        metavar="COMPUTE_UNITS",
+        help="split each device into sub-devices of this many compute units",
+    )
+    parser.add_argument("--job", help="job spec as a JSON string, @file or - for stdin")
+    parser.add_argument(
+        "overrides", nargs="*", metavar="key=value", help="job spec fields"
+    )
+
+
+def main(argv: list[str] = None) -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(prog="python -m core")
+    subparsers = parser.add_subparsers(required=True)
+
+    devices_parser = subparsers.add_parser("devices", help="list OpenCL devices")
+    devices_parser.set_defaults(func=list_devices)
+
+    search_parser = subparsers.add_parser(
+        "search",
+        help="run a search",
+        description="Run a search, streaming events as JSON lines. "
+        "Advance ranges are inclusive [min, max] pairs and seeds may be hex strings.",
+    )
+    add_search_arguments(search_parser)
+    search_parser.add_argument(
+        "--results-only", action="store_true", help="only print result events"
+    )
+    search_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue from the checkpoint of an unfinished run of the same search",
+    )
+    search_parser.add_argument(
+        "--max-results",
+        type=int,
+        metavar="N",
+        help="stop the search as soon as N results have been found",
+    )
+    search_parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="write a Chrome trace (chrome://tracing, Perfetto) of the kernel, "
+        "transfer and verification time of every chunk to PATH",
+    )
+    search_parser.set_defaults(func=run_search)
+
+    autotune_parser = subparsers.add_parser(
+        "autotune",
+        help="tune kernel launch profiles",
+        description="Sweep local size, work per item and launch size of a "
+        "search's kernel on each device, saving the fastest profile which later "
+        "searches load automatically. Tune with a representative job spec, "
+        "kernel speed depends on it.",
+    )
+    add_search_arguments(autotune_parser)
+    autotune_parser.add_argument(
+        "--verbose", action="store_true", help="log every measurement to stderr"
+    )
+    autotune_parser.set_defaults(func=run_autotune)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="benchmark kernels, verifiers and startup",
+        description="Benchmark each kernel over a fixed seed slice and the host "
+        "verifiers over fixed candidates, and the GUI import and startup time, "
+        "printing seeds/s, candidates/s, time to first result and startup time "
+        "as JSON lines compared against the stored baseline.",
+    )
+    benchmark_parser.add_argument(
+        "cases", nargs="*", help="only run these cases, kernel cases by name"
+    )
+    benchmark_parser.add_argument(
+        "--platform", default="0", help="comma separated platform indices or all"
+    )
+    benchmark_parser.add_argument(
+        "--device", default="0", help="comma separated device indices or all"
+    )
+    benchmark_parser.add_argument(
+        "--seeds", type=int, default=1 << 20, help="seeds per kernel run"
+    )
+    benchmark_parser.add_argument(
+        "--candidates", type=int, default=1 << 14, help="candidates per verifier run"
+    )
+    benchmark_parser.add_argument(
+        "--repeats", type=int, default=5, help="timed runs per case, the best is kept"
+    )
+    benchmark_parser.add_argument(
+        "--baseline", help="baseline file, defaults to one per device set"
+    )
+    benchmark_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store this run as the baseline instead of comparing",
+    )
+    benchmark_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as a regression",
+    )
+    benchmark_parser.set_defaults(func=run_benchmark)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="run a local search job service",
+        description="Keep the selected devices warm and run search jobs "
+        "submitted by local clients, one job per device at a time by priority. "
+        "Queued iv searches over the same seeds are run as one multi-target "
+        "search.",
+    )
+    serve_parser.add_argument(
+        "--platform", default="0", help="comma separated platform indices or all"
+    )
+    serve_parser.add_argument(
+        "--device", default="0", help="comma separated device indices or all"
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to bind")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.set_defaults(func=run_service)
+
+    submit_parser = subparsers.add_parser(
+        "submit",
+        help="submit a job to a running service",
+        description="Submit a search job to a running service, streaming its "
+        "events as JSON lines. Without a search the service's queued and "
+        "running jobs are printed. Interrupting cancels the job.",
+    )
+    submit_parser.add_argument("search", nargs="?", choices=SEARCHES)
+    submit_parser.add_argument(
+        "--job", help="job spec as a JSON string, @file or - for stdin"
+    )
+    submit_parser.add_argument(
+        "overrides", nargs="*", metavar="key=value", help="job spec fields"
+    )
+    submit_parser.add_argument(
+        "--priority", type=int, default=0, help="higher priority jobs run first"
+    )
+    submit_parser.add_argument(
+        "--max-results",
+        type=int,
+        metavar="N",
+        help="stop the job as soon as N results have been found",
+    )
+    submit_parser.add_argument(
+        "--results-only", action="store_true", help="only print result events"
+    )
+    submit_parser.add_argument("--host", default="127.0.0.1")
+    submit_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    submit_parser.set_defaults(func=submit_job)
+
+    ivs_parser = subparsers.add_parser(
+        "ivs",
+        help="calculate ivs from stats",
+        description="Invert stat lines to iv ranges. Each input line is a JSON "
+        'job {"species" or "base_stats", "nature", "level" or "levels", '
+        '"stats": [[hp, atk, def, spa, spd, spe], ...]} with one stats row per '
+        "level. Each output line holds the job's ivs_1 and ivs_max_1, usable "
+        "as an iv search spec.",
+    )
+    ivs_parser.add_argument(
+        "--input", default="-", help="file of JSON lines or - for stdin"
+    )
+    ivs_parser.add_argument(
+        "--base-stats",
+        metavar="PATH",
+        help="species table as a name,hp,atk,def,spa,spd,spe csv or a gen 6 "
+        "personal dump, defaults to the bundled species",
+    )
+    ivs_parser.add_argument(
+        "--entry-size",
+        type=lambda value: int(value, 0),
+        help="bytes per entry of a personal dump, 0x40 for XY or 0x50 for ORAS, "
+        "defaults to the one the dump's length fits",
+    )
+    ivs_parser.set_defaults(func=calculate_ivs)
+
+    build_parser = subparsers.add_parser(
+        "build-verifiers",
+        help="compile the host verifiers ahead of time",
+        description="Compile the numba host verifiers into an extension module "
+        "so searches do not wait on jit compilation for their first results.",
+    )
+    build_parser.add_argument(
+        "--output-dir", help="directory of the module, defaults to core/shaders"
+    )
+    build_parser.set_defaults(func=build_verifiers)
+
+    args = parser.parse_args(argv)
+    args.func(args)
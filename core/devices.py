@@ -0,0 +1,156 @@
+"""OpenCL device discovery off the startup path with a cached snapshot
+
+Loading the OpenCL ICDs and enumerating platforms can take seconds with some
+drivers, so the GUI lists devices from the snapshot saved by the previous run
+while a background thread enumerates the real ones
+"""
+
+import json
+import threading
+
+from .cache import cache_dir, atomic_write
+
+
+def snapshot_path():
+    """Path of the saved device snapshot"""
+    return cache_dir() / "devices.json"
+
+
+def load_snapshot() -> list[dict]:
+    """Platforms and devices seen by the previous run, empty if unknown or
+    saved without device ids"""
+    try:
+        snapshot = json.loads(snapshot_path().read_text(encoding="utf-8"))
+        if all(
+            "id" in device for platform in snapshot for device in platform["devices"]
+        ):
+            return snapshot
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return []
+
+
+def pci_location(device) -> str:
+    """PCI domain:bus:device.function of a device if its driver reports one"""
+    # pylint: disable-next=import-outside-toplevel
+    import pyopencl as cl
+
+    try:
+        info = device.pci_bus_info_khr
+        return (
+            f"{info.pci_domain:04x}:{info.pci_bus:02x}:"
+            f"{info.pci_device:02x}.{info.pci_function:x}"
+        )
+    except (cl.Error, AttributeError):
+        pass
+    try:
+        return f"{device.pci_bus_id_nv:02x}:{device.pci_slot_id_nv:02x}"
+    except (cl.Error, AttributeError):
+        pass
+    try:
+        topology = device.topology_amd
+        return f"{topology.bus:02x}:{topology.device:02x}.{topology.function:x}"
+    except (cl.Error, AttributeError):
+        return None
+
+
+def device_ids(platforms: list) -> list[list[str]]:
+    """Stable id of every device of (platform, devices) pairs
+
+    Ids are built from the platform, vendor and device names and the device's
+    PCI location, so they survive platforms or devices being reordered.
+    Identical devices without a PCI location are told apart by their order
+    """
+    seen: dict[str, int] = {}
+    ids = []
+    for platform, devices in platforms:
+        ids.append([])
+        for device in devices:
+            location = pci_location(device)
+            device_id = "/".join(
+                [platform.name, device.vendor, device.name]
+                + ([location] if location else [])
+            )
+            seen[device_id] = seen.get(device_id, 0) + 1
+            if seen[device_id] > 1:
+                device_id += f"#{seen[device_id]}"
+            ids[-1].append(device_id)
+    return ids
+
+
+def take_snapshot(platforms: list) -> list[dict]:
+    """Names, ids and capabilities of every platform and device"""
+    return [
+        {
+            "name": platform.name,
+            "devices": [
+                {
+                    "id": device_id,
+                    "name": device.name,
+                    "compute_units": device.max_compute_units,
+                    "global_mem_size": device.global_mem_size,
+                    "max_work_group_size": device.max_work_group_size,
+                    "driver_version": device.driver_version,
+                }
+                for device, device_id in zip(devices, ids)
+            ],
+        }
+        for (platform, devices), ids in zip(platforms, device_ids(platforms))
+    ]
+
+
+class DeviceDiscovery:
+    """Enumerates OpenCL platforms and devices on a background thread,
+    refreshing the saved snapshot"""
+
+    def __init__(self, on_done=None) -> None:
+        self.on_done = on_done
+        self.done = threading.Event()
+        # (platform, devices) pairs once enumerated
+        self.platforms: list = None
+        self.snapshot: list[dict] = None
+        self.error: Exception = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        """Thread work"""
+        try:
+            # pylint: disable-next=import-outside-toplevel
+            import pyopencl as cl
+
+            self.platforms = [
+                (platform, platform.get_devices()) for platform in cl.get_platforms()
+            ]
+            self.snapshot = take_snapshot(self.platforms)
+            atomic_write(snapshot_path(), json.dumps(self.snapshot, indent=2).encode())
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            self.platforms = []
+            self.snapshot = []
+            self.error = error
+        self.done.set()
+        if self.on_done is not None:
+            self.on_done(self.snapshot)
+
+    def wait(self) -> list:
+        """Wait for enumeration to finish, returning the (platform, devices) pairs"""
+        self.done.wait()
+        return self.platforms
+
+    def get_devices(self, ids: list[str]) -> list:
+        """Devices by their snapshot ids, waiting for enumeration
+
+        Raises LookupError if a device is no longer present
+        """
+        platforms = self.wait()
+        devices = {
+            device_id: device
+            for (_, platform_devices), platform_ids in zip(
+                platforms, device_ids(platforms)
+            )
+            for device, device_id in zip(platform_devices, platform_ids)
+        }
+        missing = [device_id for device_id in ids if device_id not in devices]
+        if missing:
+            raise LookupError(f"Devices no longer available: {', '.join(missing)}")
+        return [devices[device_id] for device_id in ids]
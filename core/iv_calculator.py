@@ -0,0 +1,153 @@
+"""Vectorized stat calculation and iv inversion
+
+Every stat a pokemon can have is precomputed into one lookup table indexed by
+(stat kind, base stat, level, iv), so inverting any number of stat lines over
+every iv is a single gather and compare
+"""
+
+from functools import cache
+import numpy as np
+
+from .base_stats import BASE_STATS, BaseStatTable
+
+MAX_LEVEL = 100
+# stat kinds of the lookup table
+HP, NEUTRAL, BOOSTED, HINDERED = range(4)
+# stat of each nature's boost and decrease (atk, def, spe, spa, spd) for the
+# HP, Atk, Def, SpA, SpD, Spe order, None for hp
+NATURE_STATS = (None, 0, 1, 3, 4, 2)
+
+
+def nature_kinds() -> np.ndarray:
+    """(25, 6) stat kinds of each nature"""
+    kinds = np.full((25, 6), NEUTRAL, np.uint8)
+    kinds[:, 0] = HP
+    for nature in range(25):
+        boost, decrease = divmod(nature, 5)
+        if boost == decrease:
+            continue
+        kinds[nature, NATURE_STATS.index(boost)] = BOOSTED
+        kinds[nature, NATURE_STATS.index(decrease)] = HINDERED
+    return kinds
+
+
+NATURE_KINDS = nature_kinds()
+
+
+@cache
+def stat_table() -> np.ndarray:
+    """(stat kind, base stat, level, iv) uint16 table of every stat value"""
+    base = np.arange(256, dtype=np.int32)[:, None, None]
+    level = np.arange(MAX_LEVEL + 1, dtype=np.int32)[None, :, None]
+    iv = np.arange(32, dtype=np.int32)[None, None, :]
+    stat = (2 * base + iv) * level // 100
+    table = np.empty((4, 256, MAX_LEVEL + 1, 32), np.uint16)
+    table[HP] = stat + level + 10
+    table[NEUTRAL] = stat + 5
+    table[BOOSTED] = (stat + 5) * 11 // 10
+    table[HINDERED] = (stat + 5) * 9 // 10
+    return table
+
+
+def calc_stats(base_stats, ivs, levels, natures) -> np.ndarray:
+    """(..., 6) stats from (..., 6) base stats and ivs at the given levels and
+    natures, all broadcast together"""
+    base_stats = np.asarray(base_stats, np.intp)
+    ivs = np.asarray(ivs, np.intp)
+    levels = np.asarray(levels, np.intp)[..., None]
+    kinds = NATURE_KINDS[np.asarray(natures, np.intp)]
+    return stat_table()[kinds, base_stats, levels, ivs]
+
+
+def possible_ivs(base_stats, stats, levels, natures) -> np.ndarray:
+    """(..., 6, 32) mask of the ivs matching every row of stat lines
+
+    stats is (..., rows, 6) with levels (..., rows), base_stats (..., 6) and
+    natures (...) are shared by all of a line's rows
+    """
+    stats = np.asarray(stats, np.uint16)
+    levels = np.asarray(levels, np.intp)
+    base_stats = np.asarray(base_stats, np.intp)[..., None, :]
+    kinds = NATURE_KINDS[np.asarray(natures, np.intp)][..., None, :]
+    candidates = stat_table()[kinds, base_stats, levels[..., None]]
+    return (candidates == stats[..., None]).all(axis=-3)
+
+
+def iv_bounds(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(..., 6) minimum and maximum possible ivs of a mask, the minimum is 32
+    and the maximum -1 where no iv is possible"""
+    valid = mask.any(axis=-1)
+    minimum = np.where(valid, mask.argmax(axis=-1), 32)
+    maximum = np.where(valid, 31 - mask[..., ::-1].argmax(axis=-1), -1)
+    return minimum, maximum
+
+
+def invert(base_stats, stats, levels, natures) -> tuple[np.ndarray, np.ndarray]:
+    """(..., 6) iv ranges of stat lines, see possible_ivs and iv_bounds"""
+    return iv_bounds(possible_ivs(base_stats, stats, levels, natures))
+
+
+def stat_lines(text: str, level: int) -> tuple[np.ndarray, np.ndarray]:
+    """(rows, 6) stats and (rows,) levels of the calculator's text format,
+    the first row's stats followed by a row of stat gains per level up"""
+    rows = np.array(
+        [list(map(int, row.split())) for row in text.splitlines() if row.strip()],
+        np.int32,
+    ).reshape(-1, 6)
+    return np.cumsum(rows, axis=0), level + np.arange(len(rows))
+
+
+def invert_jobs(jobs: list[dict], table: BaseStatTable = BASE_STATS) -> list[dict]:
+    """Invert many stat line jobs, each grouped with the jobs of the same
+    number of rows into one vectorized call
+
+    A job has "species" (name or index in table) or "base_stats", "nature"
+    (name or index), "stats" as one [hp, atk, def, spa, spd, spe] row per level
+    and "level" of the first row, or "levels" of every row. The ivs_1 and
+    ivs_max_1 of each job's result are ready to use in an iv search spec
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from numba_pokemon_prngs.data import NATURES_EN
+
+    natures = {name.lower(): index for index, name in enumerate(NATURES_EN)}
+    groups: dict[int, list[int]] = {}
+    parsed = []
+    for index, job in enumerate(jobs):
+        stats = np.asarray(job["stats"], np.int64).reshape(-1, 6)
+        levels = np.asarray(
+            job.get("levels", job.get("level", 1) + np.arange(len(stats))), np.int64
+        )
+        if len(levels) != len(stats):
+            raise ValueError("Each stat row needs a level")
+        if (levels < 1).any() or (levels > MAX_LEVEL).any():
+            raise ValueError(f"Levels must be from 1 to {MAX_LEVEL}")
+        nature = job["nature"]
+        if isinstance(nature, str) and not nature.isdigit():
+            if nature.lower() not in natures:
+                raise ValueError(f"Unknown nature {nature!r}")
+            nature = natures[nature.lower()]
+        if not 0 <= int(nature) < 25:
+            raise ValueError(f"Unknown nature {nature!r}")
+        base_stats = np.asarray(
+            job["base_stats"] if "base_stats" in job else table.lookup(job["species"]),
+            np.int64,
+        )
+        if base_stats.shape != (6,) or ((base_stats < 0) | (base_stats > 255)).any():
+            raise ValueError("Base stats must be six values from 0 to 255")
+        parsed.append((base_stats, np.clip(stats, 0, 0xFFFF), levels, int(nature)))
+        groups.setdefault(len(stats), []).append(index)
+    results = [None] * len(jobs)
+    for members in groups.values():
+        minimum, maximum = invert(
+            *(
+                np.array([parsed[index][field] for index in members])
+                for field in range(4)
+            )
+        )
+        for index, ivs_1, ivs_max_1 in zip(members, minimum, maximum):
+            results[index] = {
+                "ivs_1": ivs_1.tolist(),
+                "ivs_max_1": ivs_max_1.tolist(),
+                "valid": bool((ivs_1 <= ivs_max_1).all()),
+            }
+    return results
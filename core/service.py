@@ -0,0 +1,348 @@
+"""Local job service sharing warm devices between many search clients
+
+Clients connect over TCP and send one JSON line, either a job
+{"search": name, "job": spec, "priority": n, "max_results": n} whose events are
+streamed back as JSON lines tagged with the job id until a "done" or "error"
+event, or a command {"command": "status"} / {"command": "cancel", "job": id}.
+Closing the connection cancels its job.
+
+Every device runs one job at a time, taking the highest priority job that has
+waited longest, so concurrent clients share the devices fairly. Queued iv
+searches over the same seeds are coalesced into one multi-target search
+"""
+
+import asyncio
+import itertools
+import json
+from collections.abc import AsyncIterator
+import pyopencl as cl
+
+from .cache import to_json
+from .shaders.engine import SearchEngine
+from .shaders.iv_search import IVSearch
+from .shaders.multi_iv_search import IVTarget, MultiIVSearch
+from .shaders.sessions import sessions
+from .shaders.verifiers import warm_up
+
+DEFAULT_PORT = 8737
+# most iv searches coalesced into one multi-target search
+MAX_BATCH = 64
+
+
+class Job:
+    """A submitted search and the queue of events streamed to its client"""
+
+    def __init__(
+        self,
+        job_id: int,
+        search: SearchEngine,
+        priority: int = 0,
+        max_results: int = None,
+    ) -> None:
+        self.id = job_id
+        # constructed without devices, rebuilt on the device the job runs on
+        self.search = search
+        self.priority = priority
+        self.max_results = max_results
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.found = 0
+        self.done = False
+        # engine running the job, shared by every job of a coalesced batch
+        self.engine: SearchEngine = None
+        self.device: int = None
+
+    def describe(self) -> dict:
+        """JSON summary for the status command"""
+        return {
+            "job": self.id,
+            "search": self.search.name,
+            "priority": self.priority,
+            "device": self.device,
+            "found": self.found,
+        }
+
+    def emit(self, event: str, value: object) -> None:
+        """Queue an event for the client, dropped once the job is done"""
+        if self.done:
+            return
+        self.events.put_nowait((event, value))
+        if event == "results":
+            self.found += 1
+            if self.max_results is not None and self.found >= self.max_results:
+                self.finish()
+
+    def finish(self, event: str = "done", value: object = None) -> None:
+        """End the job's event stream"""
+        if self.done:
+            return
+        self.events.put_nowait((event, value))
+        self.done = True
+
+
+def coalesce_key(job: Job) -> tuple[int, int]:
+    """Seeds searched by an iv job, jobs with the same key can share a pass,
+    None for jobs that run alone"""
+    if type(job.search) is not IVSearch:
+        return None
+    return (job.search.start, job.search.chunk_count)
+
+
+class JobService:
+    """Queue of jobs run on a fixed set of devices"""
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        searches: dict[str, type[SearchEngine]],
+        max_batch: int = MAX_BATCH,
+    ) -> None:
+        self.devices = devices
+        self.searches = searches
+        self.max_batch = max_batch
+        self.job_ids = itertools.count(1)
+        self.pending: list[Job] = []
+        self.running: dict[int, list[Job]] = {}
+        self.jobs: dict[int, Job] = {}
+        self.changed: asyncio.Condition = None
+
+    def submit(
+        self, search: str, spec: dict, priority: int = 0, max_results: int = None
+    ) -> Job:
+        """Queue a job, the spec is checked before it is accepted"""
+        if search not in self.searches:
+            raise ValueError(f"Unknown search {search!r}")
+        job = Job(
+            next(self.job_ids),
+            self.searches[search].from_spec([], spec),
+            priority,
+            max_results,
+        )
+        self.jobs[job.id] = job
+        self.pending.append(job)
+        self.notify()
+        return job
+
+    def cancel(self, job: Job) -> None:
+        """Drop a queued job or stop a running one, a coalesced search only
+        stops once all of its jobs are done"""
+        job.finish("error", "Cancelled")
+        self.jobs.pop(job.id, None)
+        if job in self.pending:
+            self.pending.remove(job)
+        self.interrupt_if_done(job)
+
+    def interrupt_if_done(self, job: Job) -> None:
+        """Stop the engine of a job once none of its jobs need more results"""
+        if job.engine is None or job.device is None:
+            return
+        if all(other.done for other in self.running.get(job.device, ())):
+            job.engine.request_interruption()
+
+    def notify(self) -> None:
+        """Wake the device workers"""
+
+        async def wake():
+            async with self.changed:
+                self.changed.notify_all()
+
+        if self.changed is not None:
+            asyncio.ensure_future(wake())
+
+    def take_batch(self) -> list[Job]:
+        """Remove the next job from the queue along with the queued iv jobs
+        it can be coalesced with, in priority then submission order"""
+        self.pending.sort(key=lambda job: (-job.priority, job.id))
+        first = self.pending[0]
+        key = coalesce_key(first)
+        batch = [first]
+        if key is not None:
+            for job in self.pending[1:]:
+                if len(batch) >= self.max_batch:
+                    break
+                if coalesce_key(job) != key:
+                    continue
+                try:
+                    self.coalesced_engine(batch + [job], [])
+                except ValueError:
+                    # too many candidates per chunk, left for a later pass
+                    continue
+                batch.append(job)
+        for job in batch:
+            self.pending.remove(job)
+        return batch
+
+    @staticmethod
+    def coalesced_engine(batch: list[Job], devices: list[cl.Device]) -> MultiIVSearch:
+        """Multi-target search finding every iv job's results, target i is
+        batch[i]"""
+        start, chunks = coalesce_key(batch[0])
+        return MultiIVSearch(
+            devices, [IVTarget.from_search(job.search) for job in batch], start, chunks
+        )
+
+    def run_batch(
+        self, device: cl.Device, batch: list[Job], loop: asyncio.AbstractEventLoop
+    ) -> None:
+        """Run a batch of jobs on a device, called from a worker thread with
+        events handed back to the event loop"""
+        if len(batch) == 1:
+            job = batch[0]
+            engine = type(job.search).from_spec([device], job.search.spec())
+            # keep an engine's own limit, a unique hash search stops at its hit
+            if job.max_results is not None:
+                engine.max_results = (
+                    job.max_results
+                    if engine.max_results is None
+                    else min(engine.max_results, job.max_results)
+                )
+        else:
+            engine = self.coalesced_engine(batch, [device])
+        # nothing resumes a service job, so cancelled or failed jobs must not
+        # leave checkpoints behind
+        engine.checkpointing = False
+        for job in batch:
+            job.engine = engine
+        # a job may have been cancelled before its engine was set
+        loop.call_soon_threadsafe(self.interrupt_if_done, batch[0])
+        for event, value in engine.run():
+            if event == "results" and len(batch) > 1:
+                target, *result = value
+                loop.call_soon_threadsafe(
+                    self.deliver, batch[target], event, tuple(result)
+                )
+            else:
+                for job in batch:
+                    loop.call_soon_threadsafe(self.deliver, job, event, value)
+
+    def deliver(self, job: Job, event: str, value: object) -> None:
+        """Pass an engine event to a job, stopping the engine once the job
+        and every job coalesced with it have enough results"""
+        job.emit(event, value)
+        if job.done:
+            self.interrupt_if_done(job)
+
+    async def worker(self, index: int, device: cl.Device) -> None:
+        """Run queued jobs on a device one batch at a time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.pending)
+                batch = self.take_batch()
+            self.running[index] = batch
+            for job in batch:
+                job.device = index
+                job.emit("log", f"Running on device {index}: {device.name}")
+                if len(batch) > 1:
+                    job.emit("log", f"Coalesced with {len(batch) - 1} iv searches")
+            try:
+                await asyncio.to_thread(self.run_batch, device, batch, loop)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                for job in batch:
+                    job.finish("error", str(error))
+            for job in batch:
+                job.finish()
+                self.jobs.pop(job.id, None)
+            del self.running[index]
+
+    def status(self) -> dict:
+        """Queued and running jobs and the devices they run on"""
+        return {
+            "devices": [device.name for device in self.devices],
+            "running": [
+                job.describe()
+                for batch in self.running.values()
+                for job in batch
+                if not job.done
+            ],
+            "queued": [
+                job.describe()
+                for job in sorted(self.pending, key=lambda job: (-job.priority, job.id))
+            ],
+        }
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve one client connection"""
+
+        def send(message: dict) -> None:
+            writer.write(json.dumps(message, default=to_json).encode() + b"\n")
+
+        job = None
+        try:
+            message = json.loads(await reader.readline())
+            command = message.get("command")
+            if command == "status":
+                send(self.status())
+            elif command == "cancel":
+                if message.get("job") in self.jobs:
+                    self.cancel(self.jobs[message["job"]])
+                send({"job": message.get("job"), "event": "cancelled"})
+            else:
+                job = self.submit(
+                    message["search"],
+                    message.get("job") or {},
+                    int(message.get("priority", 0)),
+                    message.get("max_results"),
+                )
+                send({"job": job.id, "event": "queued", "value": len(self.pending)})
+                # the client closing its end cancels the job
+                disconnected = asyncio.ensure_future(reader.read())
+                while True:
+                    next_event = asyncio.ensure_future(job.events.get())
+                    await asyncio.wait(
+                        (next_event, disconnected),
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    if not next_event.done():
+                        next_event.cancel()
+                        break
+                    event, value = next_event.result()
+                    send({"job": job.id, "event": event, "value": value})
+                    await writer.drain()
+                    if event in ("done", "error"):
+                        break
+                disconnected.cancel()
+            await writer.drain()
+        except KeyError as error:
+            send({"event": "error", "value": f"Missing field {error}"})
+        except (ValueError, TypeError) as error:
+            send({"event": "error", "value": str(error)})
+        except ConnectionError:
+            pass
+        finally:
+            if job is not None and not job.done:
+                self.cancel(job)
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+        """Warm up every device and serve clients until cancelled"""
+        self.changed = asyncio.Condition()
+        warm_up()
+        for device in self.devices:
+            sessions.release(await asyncio.to_thread(sessions.acquire, device))
+        workers = [
+            asyncio.ensure_future(self.worker(index, device))
+            for index, device in enumerate(self.devices)
+        ]
+        server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+async def request(
+    message: dict, host: str = "127.0.0.1", port: int = DEFAULT_PORT
+) -> AsyncIterator[dict]:
+    """Send a job or command to a running service, yielding each reply"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        while line := await reader.readline():
+            yield json.loads(line)
+    finally:
+        writer.close()
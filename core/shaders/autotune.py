@@ -0,0 +1,204 @@
+"""Per-device autotuning of kernel launch geometry with persisted profiles"""
+
+import hashlib
+import json
+import threading
+import time
+import pyopencl as cl
+
+from ..cache import cache_dir, atomic_write
+
+WORK_PER_ITEM_CHOICES = (1, 2, 4, 8)
+LAUNCH_SIZE_CHOICES = (1 << 18, 1 << 20, 1 << 22)
+# seeds searched per measurement while tuning, launches are capped to this
+SAMPLE_SEEDS = 1 << 22
+
+profiles_lock = threading.Lock()
+
+
+class LaunchProfile:
+    """Launch geometry for one kernel on one device
+
+    local_size of None leaves the work-group size to the driver and
+    launch_size of None launches each chunk as a single kernel
+    """
+
+    def __init__(
+        self,
+        local_size: int = None,
+        launch_size: int = None,
+        work_per_item: int = 1,
+        seeds_per_second: float = None,
+        private_mem_size: int = None,
+        preferred_multiple: int = None,
+    ) -> None:
+        self.local_size = local_size
+        self.launch_size = launch_size
+        self.work_per_item = work_per_item
+        self.seeds_per_second = seeds_per_second
+        self.private_mem_size = private_mem_size
+        self.preferred_multiple = preferred_multiple
+
+    def build_options(self) -> list[str]:
+        """Program build options needed for this profile"""
+        return [f"-D WORK_PER_ITEM={self.work_per_item}"]
+
+    def to_json(self) -> dict:
+        """Serialize the profile"""
+        return dict(vars(self))
+
+    @classmethod
+    def from_json(cls, data: dict) -> "LaunchProfile":
+        """Deserialize a profile, ignoring unknown keys"""
+        profile = cls()
+        for key, value in data.items():
+            if hasattr(profile, key):
+                setattr(profile, key, value)
+        return profile
+
+    def __repr__(self) -> str:
+        return f"LaunchProfile({self.to_json()})"
+
+
+def device_key(device: cl.Device) -> str:
+    """Key identifying a device and driver, sub-devices are told apart by size"""
+    m = hashlib.sha256()
+    for part in (
+        device.platform.name,
+        device.name,
+        device.driver_version,
+        str(device.max_compute_units),
+    ):
+        m.update(part.encode())
+        m.update(b"\0")
+    return m.hexdigest()[:16]
+
+
+def profile_path(device: cl.Device):
+    """Path of the JSON file holding a device's launch profiles"""
+    return cache_dir("profiles") / f"{device_key(device)}.json"
+
+
+def load_profiles(device: cl.Device) -> dict[str, LaunchProfile]:
+    """Load every saved launch profile of a device by kernel key"""
+    try:
+        data = json.loads(profile_path(device).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {
+        key: LaunchProfile.from_json(profile)
+        for key, profile in data.get("kernels", {}).items()
+    }
+
+
+def load_profile(device: cl.Device, key: str) -> LaunchProfile:
+    """Load the saved launch profile of a kernel, the default if not tuned"""
+    return load_profiles(device).get(key, LaunchProfile())
+
+
+def save_profile(device: cl.Device, key: str, profile: LaunchProfile) -> None:
+    """Save the launch profile of a kernel, keeping the device's other profiles"""
+    with profiles_lock:
+        profiles = load_profiles(device)
+        profiles[key] = profile
+        data = {
+            "device": device.name,
+            "platform": device.platform.name,
+            "driver_version": device.driver_version,
+            "kernels": {key: profile.to_json() for key, profile in profiles.items()},
+        }
+        atomic_write(profile_path(device), json.dumps(data, indent=2).encode())
+
+
+def kernel_info(kernel: cl.Kernel, device: cl.Device) -> tuple[int, int, int]:
+    """Private memory size, preferred work-group multiple and maximum
+    work-group size of a built kernel"""
+    return (
+        kernel.get_work_group_info(cl.kernel_work_group_info.PRIVATE_MEM_SIZE, device),
+        kernel.get_work_group_info(
+            cl.kernel_work_group_info.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, device
+        ),
+        min(
+            kernel.get_work_group_info(
+                cl.kernel_work_group_info.WORK_GROUP_SIZE, device
+            ),
+            device.max_work_group_size,
+        ),
+    )
+
+
+def local_size_choices(preferred_multiple: int, max_size: int) -> list[int]:
+    """Work-group sizes to try, powers of two times the preferred multiple"""
+    choices = []
+    local_size = max(preferred_multiple, 1)
+    while local_size <= max_size:
+        choices.append(local_size)
+        local_size <<= 1
+    return choices
+
+
+def measure(
+    engine, device: cl.Device, profile: LaunchProfile, repeats: int = 2
+) -> tuple[float, object]:
+    """Seeds per second of the engine's first chunk on a device with a profile,
+    along with the (released) device state used"""
+    engine.profiles[device] = profile
+    state = engine.setup_device(device)
+    try:
+        state.seed_limit = SAMPLE_SEEDS
+        chunk = engine.chunks()[0]
+        # first run includes any lazy driver compilation
+        engine.collect_chunk(state, engine.enqueue_chunk(state, chunk))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            engine.collect_chunk(state, engine.enqueue_chunk(state, chunk))
+        elapsed = time.perf_counter() - start
+    finally:
+        state.release()
+    return engine.launched_seeds(state) * repeats / elapsed, state
+
+
+def autotune(engine, device: cl.Device, log=None) -> LaunchProfile:
+    """Sweep local size, work per item and launch size for the engine's kernel
+    on a device one at a time, saving and returning the fastest profile"""
+    log = log or (lambda _message: None)
+    key = engine.profile_key(device)
+    saved_profile = engine.profiles.pop(device, None)
+
+    best = LaunchProfile()
+
+    def consider(profile: LaunchProfile) -> None:
+        nonlocal best
+        launch_size = min(profile.launch_size or engine.chunk_seeds, SAMPLE_SEEDS)
+        if profile.local_size and (
+            launch_size // profile.work_per_item % profile.local_size
+        ):
+            return
+        profile.seeds_per_second, _ = measure(engine, device, profile)
+        log(f"{key} {profile.to_json()}")
+        if profile.seeds_per_second > best.seeds_per_second:
+            best = profile
+
+    try:
+        best.seeds_per_second, state = measure(engine, device, best)
+        _, preferred_multiple, max_size = kernel_info(state.kernel, device)
+        for local_size in local_size_choices(preferred_multiple, max_size):
+            consider(LaunchProfile(local_size, best.launch_size, best.work_per_item))
+        for work_per_item in WORK_PER_ITEM_CHOICES[1:]:
+            consider(LaunchProfile(best.local_size, best.launch_size, work_per_item))
+        for launch_size in LAUNCH_SIZE_CHOICES:
+            if launch_size >= SAMPLE_SEEDS or engine.chunk_seeds % launch_size:
+                continue
+            consider(LaunchProfile(best.local_size, launch_size, best.work_per_item))
+        engine.profiles[device] = best
+        state = engine.setup_device(device)
+        state.release()
+        best.private_mem_size, best.preferred_multiple, _ = kernel_info(
+            state.kernel, device
+        )
+    finally:
+        engine.profiles.pop(device, None)
+        if saved_profile is not None:
+            engine.profiles[device] = saved_profile
+    save_profile(device, key, best)
+    return best
@@ -0,0 +1,88 @@
+"""Search progress persisted so long searches can be resumed"""
+
+import hashlib
+import json
+import time
+
+from ..cache import cache_dir, atomic_write, to_json
+
+
+def checkpoint_key(name: str, spec: dict) -> str:
+    """Key identifying a search by its name and job parameters"""
+    return hashlib.sha256(
+        json.dumps(
+            {"search": name, "spec": spec}, sort_keys=True, default=to_json
+        ).encode()
+    ).hexdigest()
+
+
+class Checkpoint:
+    """Completed chunks and results of a search, periodically written to an
+    atomically replaced file unless it is not persistent"""
+
+    def __init__(
+        self, name: str, spec: dict, interval: float = 10.0, persistent: bool = True
+    ) -> None:
+        self.name = name
+        self.spec = spec
+        self.interval = interval
+        self.persistent = persistent
+        self.path = cache_dir("checkpoints") / f"{checkpoint_key(name, spec)}.json"
+        self.completed: list = []
+        self.results: list = []
+        self.last_write = time.monotonic()
+        self.finished = False
+
+    def exists(self) -> bool:
+        """Check if a checkpoint of this search has been written"""
+        return self.path.exists()
+
+    def load(self) -> bool:
+        """Load the completed chunks and results, False if there is no
+        readable checkpoint of this search"""
+        if not self.persistent:
+            return False
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if data.get("search") != self.name:
+            return False
+        self.completed = data["completed"]
+        # results are stored as JSON, tuples come back as lists
+        self.results = [
+            tuple(result) if isinstance(result, list) else result
+            for result in data["results"]
+        ]
+        return True
+
+    def add(self, chunk, results: list) -> None:
+        """Record a completed chunk, writing the checkpoint if due"""
+        self.completed.append(chunk)
+        self.results.extend(results)
+        if time.monotonic() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self) -> None:
+        """Write the checkpoint unless the search has finished"""
+        if self.finished or not self.persistent:
+            return
+        self.last_write = time.monotonic()
+        atomic_write(
+            self.path,
+            json.dumps(
+                {
+                    "search": self.name,
+                    "spec": self.spec,
+                    "completed": self.completed,
+                    "results": self.results,
+                },
+                default=to_json,
+            ).encode(),
+        )
+
+    def finish(self) -> None:
+        """Mark the search as done, removing its checkpoint"""
+        self.finished = True
+        if self.persistent:
+            self.path.unlink(missing_ok=True)
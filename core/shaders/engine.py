@@ -0,0 +1,413 @@
+"""Qt-free base for search engines"""
+
+import threading
+from collections.abc import Iterator
+from datetime import timedelta
+import numpy as np
+import pyopencl as cl
+
+from .autotune import LaunchProfile, load_profile
+from .checkpoint import Checkpoint
+from .program_cache import RUNTIME_ARGS
+from .scheduler import ChunkScheduler
+from .sessions import sessions
+
+
+def parse_int(value) -> int:
+    """Parse an int from a job spec, accepting hex strings"""
+    if isinstance(value, str):
+        return int(value, 16)
+    return int(value)
+
+
+def parse_range(value) -> range:
+    """Parse an inclusive [min, max] advance range from a job spec"""
+    if value is None:
+        return None
+    minimum, maximum = value
+    return range(int(minimum), int(maximum) + 1)
+
+
+def format_range(value: range) -> list[int]:
+    """Format an advance range as an inclusive [min, max] job spec pair"""
+    if value is None:
+        return None
+    return [value.start, value.stop - 1]
+
+
+def get_devices(platforms: str = "0", devices: str = "0") -> list[cl.Device]:
+    """Get OpenCL devices by comma separated platform/device indices or "all" """
+    all_platforms = cl.get_platforms()
+    if platforms == "all":
+        platforms = ",".join(map(str, range(len(all_platforms))))
+    selected = []
+    for platform_index in platforms.split(","):
+        platform_devices = all_platforms[int(platform_index)].get_devices()
+        if devices == "all":
+            selected.extend(platform_devices)
+        else:
+            selected.extend(
+                platform_devices[int(device_index)]
+                for device_index in devices.split(",")
+            )
+    return selected
+
+
+def split_device(device: cl.Device, compute_units: int) -> list[cl.Device]:
+    """Partition a device into sub-devices of compute_units each (device fission)"""
+    return device.create_sub_devices(
+        [cl.device_partition_property.EQUALLY, compute_units]
+    )
+
+
+class DeviceState:
+    """OpenCL objects owned by the host thread driving one device
+
+    Kernels run on queue while readbacks go through transfer_queue so that
+    reading one chunk's results does not wait for the next chunk's kernel.
+    The context, queues, kernels and buffers are leased from the device's
+    pooled session and returned to it by release()
+    """
+
+    def __init__(self, device: cl.Device, profile: LaunchProfile = None) -> None:
+        self.device = device
+        self.profile = profile or LaunchProfile()
+        # cap on seeds launched per chunk, used when benchmarking
+        self.seed_limit: int = None
+        self.kernel: cl.Kernel = None
+        self.session = sessions.acquire(device)
+        self.ctx = self.session.ctx
+        self.queue = self.session.queue
+        self.transfer_queue = self.session.transfer_queue
+        self.slots: list[ResultSlot] = []
+        self.next_slot = 0
+        # ("kernel" or "transfer", event) queued since the last take_events()
+        self.events: list[tuple[str, cl.Event]] = []
+
+    def record(self, kind: str, event: cl.Event) -> None:
+        """Keep a queued "kernel" or "transfer" event for the chunk's timings"""
+        self.events.append((kind, event))
+
+    def take_events(self) -> list[tuple[str, cl.Event]]:
+        """Events recorded since the last call"""
+        events, self.events = self.events, []
+        return events
+
+    def release(self) -> None:
+        """Return the session to the pool once queued work is done"""
+        if self.session is not None:
+            sessions.release(self.session)
+            self.session = None
+
+    def build_kernel(self, source: str, options: list[str], name: str) -> cl.Kernel:
+        """A kernel of a program, built once per session"""
+        return self.session.kernel(source, options, name)
+
+    def buffer(self, size: int) -> cl.Buffer:
+        """A pooled device buffer of at least size bytes"""
+        return self.session.buffer(size)
+
+    def upload(self, array: np.ndarray) -> cl.Buffer:
+        """A pooled read only device buffer holding a copy of array"""
+        array = np.ascontiguousarray(array)
+        buffer = self.session.buffer(array.nbytes, cl.mem_flags.READ_ONLY)
+        cl.enqueue_copy(self.queue, buffer, array)
+        return buffer
+
+    def pinned_array(self, shape, dtype) -> np.ndarray:
+        """A pooled host array backed by pinned (ALLOC_HOST_PTR) memory"""
+        return self.session.pinned_array(shape, dtype)
+
+    def allocate_slots(self, depth: int, capacity: int) -> None:
+        """Allocate one result slot per chunk that can be in flight"""
+        self.slots = [ResultSlot(self, capacity) for _ in range(depth)]
+
+    def take_slot(self) -> "ResultSlot":
+        """Get the next result slot, slots are reused in the order chunks are collected"""
+        slot = self.slots[self.next_slot]
+        self.next_slot = (self.next_slot + 1) % len(self.slots)
+        return slot
+
+
+class ResultSlot:
+    """Device result count/buffer pair with pinned host mirrors for one chunk
+
+    Results are width uint words each, read back as rows when width > 1
+    """
+
+    def __init__(self, state: DeviceState, capacity: int, width: int = 1) -> None:
+        self.device_count = state.buffer(4)
+        self.device_results = state.buffer(capacity * width * 4)
+        self.host_count = state.pinned_array((1,), np.uint32)
+        self.host_results = state.pinned_array(
+            (capacity,) if width == 1 else (capacity, width), np.uint32
+        )
+        self.kernel_event: cl.Event = None
+        self.count_event: cl.Event = None
+
+    def reset(self, queue: cl.CommandQueue) -> None:
+        """Zero the device result count before a kernel is enqueued"""
+        cl.enqueue_fill_buffer(queue, self.device_count, np.uint32(0), 0, 4)
+
+    def enqueue_count(self, state: DeviceState, kernel_event: cl.Event) -> None:
+        """Queue a non-blocking read of only the result count after a kernel"""
+        self.kernel_event = kernel_event
+        self.count_event = cl.enqueue_copy(
+            state.transfer_queue,
+            self.host_count,
+            self.device_count,
+            wait_for=[kernel_event],
+            is_blocking=False,
+        )
+        state.record("transfer", self.count_event)
+
+    @property
+    def capacity(self) -> int:
+        """Most results the slot holds"""
+        return len(self.host_results)
+
+    def wait_count(self) -> int:
+        """Wait for the result count, raising if the kernel found more results
+        than the slot holds since the rest were dropped"""
+        self.count_event.wait()
+        count = int(self.host_count[0])
+        if count > self.capacity:
+            raise RuntimeError(
+                f"A chunk found {count} candidates but its result buffer holds "
+                f"{self.capacity}, narrow the search"
+            )
+        return count
+
+    def read(self, state: DeviceState) -> np.ndarray:
+        """Wait for the count then read back only the results written"""
+        count = self.wait_count()
+        if count:
+            state.record(
+                "transfer",
+                cl.enqueue_copy(
+                    state.transfer_queue,
+                    self.host_results[:count],
+                    self.device_results,
+                    wait_for=[self.kernel_event],
+                ),
+            )
+        return self.host_results[:count].copy()
+
+
+class SearchEngine:
+    """Qt-free search over chunks of the seed space
+
+    run() yields (event, value) pairs where event is one of
+    "init_progress_bar", "started", "progress", "results", "result_batch",
+    "log" or "throughput", a dict of the measured seeds_per_second and eta in
+    seconds
+    """
+
+    name: str = None
+    # chunks kept queued on each device at once
+    pipeline_depth: int = 1
+    # seeds (work items at one seed per item) in each chunk
+    chunk_seeds: int = 0x1000000
+
+    def __init__(self, devices: list[cl.Device]) -> None:
+        self.devices = devices
+        self.interruption_requested = threading.Event()
+        self.scheduler: ChunkScheduler = None
+        # launch profiles by device, loaded from the autotuner's files if unset
+        self.profiles: dict[cl.Device, LaunchProfile] = {}
+        # stop once this many results have been found, None to search everything
+        self.max_results: int = None
+        # continue from the checkpoint of a previous run with the same spec
+        self.resume = False
+        # write checkpoints at all, off for searches nothing will resume
+        self.checkpointing = True
+        self.checkpoint: Checkpoint = None
+        # write a Chrome trace of the chunk timings here once the search ends
+        self.trace_path: str = None
+        # yield each chunk's results as one numpy "result_batch" instead of
+        # a "results" event per result
+        self.batch_results = False
+
+    @classmethod
+    def from_spec(cls, devices: list[cl.Device], spec: dict) -> "SearchEngine":
+        """Construct the search from a JSON job spec"""
+        raise NotImplementedError()
+
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        raise NotImplementedError()
+
+    def has_checkpoint(self) -> bool:
+        """Check if a previous run of this search left a checkpoint"""
+        return Checkpoint(self.name, self.spec()).exists()
+
+    def request_interruption(self) -> None:
+        """Ask a running search to stop as soon as possible"""
+        self.interruption_requested.set()
+
+    def is_interruption_requested(self) -> bool:
+        """Check if the search has been asked to stop"""
+        return self.interruption_requested.is_set()
+
+    def chunks(self) -> list[int]:
+        """Chunks of the search in the order they should be searched"""
+        raise NotImplementedError()
+
+    def profile_key(self, _device: cl.Device) -> str:
+        """Key of the kernel a device runs in its saved launch profiles"""
+        return self.name
+
+    def launch_profile(self, device: cl.Device) -> LaunchProfile:
+        """Launch profile of a device, autotuned if a profile has been saved"""
+        if device not in self.profiles:
+            self.profiles[device] = load_profile(device, self.profile_key(device))
+        return self.profiles[device]
+
+    def create_state(self, device: cl.Device) -> DeviceState:
+        """Device state using the device's launch profile"""
+        return DeviceState(device, self.launch_profile(device))
+
+    def build_options(self, state: DeviceState) -> list[str]:
+        """Program build options for a device state"""
+        return RUNTIME_ARGS + state.profile.build_options()
+
+    def launch_size(self, state: DeviceState) -> int:
+        """Seeds searched per kernel launch"""
+        launch_size = state.profile.launch_size or self.chunk_seeds
+        if state.seed_limit is not None:
+            launch_size = min(launch_size, state.seed_limit)
+        return launch_size
+
+    def launched_seeds(self, state: DeviceState) -> int:
+        """Seeds searched per chunk by enqueue_launches"""
+        return min(state.seed_limit or self.chunk_seeds, self.chunk_seeds)
+
+    def enqueue_launches(self, state: DeviceState, offset, *args) -> cl.Event:
+        """Queue state.kernel over a chunk as launches shaped by the launch
+        profile, returning the event of the last launch"""
+        profile = state.profile
+        launch_size = self.launch_size(state)
+        local_size = None if profile.local_size is None else (profile.local_size,)
+        event = None
+        for launch in range(self.launched_seeds(state) // launch_size):
+            event = state.kernel(
+                state.queue,
+                (launch_size // profile.work_per_item,),
+                local_size,
+                offset,
+                *args,
+                global_offset=(launch * launch_size,),
+            )
+            state.record("kernel", event)
+        return event
+
+    def estimate_runtime(self, chunk_count: int = None) -> float:
+        """Estimated seconds to search chunk_count (default every) chunks from
+        the devices' tuned throughput, None if any device has not been tuned"""
+        rates = [
+            self.launch_profile(device).seeds_per_second for device in self.devices
+        ]
+        if not all(rates):
+            return None
+        if chunk_count is None:
+            chunk_count = len(self.chunks())
+        return chunk_count * self.chunk_seeds / sum(rates)
+
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device, the
+        state is released once the device is done"""
+        raise NotImplementedError()
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> object:
+        """Queue the device work for one chunk without waiting on it"""
+        raise NotImplementedError()
+
+    def collect_chunk(self, state: DeviceState, pending: object) -> list:
+        """Wait for a queued chunk and read back its candidates"""
+        raise NotImplementedError()
+
+    def verify_chunk(self, candidates: list) -> list:
+        """Host-side verification of a chunk's candidates, run off the device thread"""
+        return candidates
+
+    def yield_results(self, results) -> Iterator[tuple[str, object]]:
+        """Yield results one by one, or as one batch if batch_results is set"""
+        if not self.batch_results:
+            for result in results:
+                yield "results", result
+        elif len(results):
+            yield "result_batch", np.asarray(results)
+
+    def search(self) -> Iterator[tuple[str, object]]:
+        """Search every chunk across all devices, yielding results as each
+        chunk is verified
+
+        Stops early once max_results results are found or on interruption.
+        Progress is checkpointed as chunks complete, the checkpoint is removed
+        once the search is done. Each chunk's timings are logged along with
+        the measured throughput
+        """
+        chunks = self.chunks()
+        self.checkpoint = Checkpoint(
+            self.name, self.spec(), persistent=self.checkpointing
+        )
+        if self.resume:
+            self.checkpoint.load()
+        completed_chunks = set(self.checkpoint.completed)
+        remaining = [chunk for chunk in chunks if chunk not in completed_chunks]
+        completed = len(chunks) - len(remaining)
+        yield "init_progress_bar", len(chunks)
+        estimate = self.estimate_runtime(len(remaining))
+        if estimate is not None:
+            yield "log", f"Estimated runtime: {timedelta(seconds=round(estimate))}"
+        yield "started", None
+        if completed:
+            yield "log", f"Resuming from {completed} completed chunks"
+            yield "progress", completed
+        yield from self.yield_results(self.checkpoint.results)
+        found = len(self.checkpoint.results)
+        if self.max_results is not None and found >= self.max_results:
+            self.checkpoint.finish()
+            return
+        self.scheduler = ChunkScheduler(
+            self,
+            remaining,
+            None
+            if estimate is None
+            else [
+                self.launch_profile(device).seeds_per_second
+                for device in self.devices
+            ],
+        )
+        telemetry = self.scheduler.telemetry
+        try:
+            for chunk, results, timing in self.scheduler.run():
+                completed += 1
+                found += len(results)
+                self.checkpoint.add(chunk, results)
+                yield from self.yield_results(results)
+                yield "progress", completed
+                yield "log", timing.describe()
+                yield "throughput", telemetry.throughput(
+                    (len(chunks) - completed) * self.chunk_seeds
+                )
+                # leaving the loop stops the scheduler, waiting only on the
+                # chunks already in flight
+                if self.is_interruption_requested() or (
+                    self.max_results is not None and found >= self.max_results
+                ):
+                    break
+            yield "log", telemetry.summary()
+        finally:
+            if self.trace_path is not None:
+                telemetry.dump(self.trace_path)
+            if completed == len(chunks) or (
+                self.max_results is not None and found >= self.max_results
+            ):
+                self.checkpoint.finish()
+            else:
+                self.checkpoint.write()
+
+    def run(self) -> Iterator[tuple[str, object]]:
+        """Search work"""
+        yield from self.search()
@@ -14,7 +14,7 @@ inline void mt_shuffle(struct mersenne_twister *rng) {
         rng->state[i] = rng->state[i - 227] ^ (y>>1) ^ (0x9908b0df * (y & 1));
     }
     uint y = (rng->state[623] & 0x80000000) | (rng->state[0] & 0x7fffffff);
-    rng->state[623] ^= (y>>1) ^ (0x9908b0df * (y & 1));
+    rng->state[623] = rng->state[396] ^ (y>>1) ^ (0x9908b0df * (y & 1));
 }
 
 inline void advance(struct mersenne_twister *rng, uint advances) {
@@ -26,11 +26,7 @@ inline void advance(struct mersenne_twister *rng, uint advances) {
     rng->index = advance;
 }
 
-inline uint next_uint(struct mersenne_twister *rng) {
-    if (rng->index == 624) {
-        mt_shuffle(rng);
-    }
-    uint y = rng->state[rng->index++];
+inline uint temper(uint y) {
     y ^= y >> 11;
     y ^= (y << 7) & 0x9d2c5680;
     y ^= (y << 15) & 0xefc60000;
@@ -38,6 +34,13 @@ inline uint next_uint(struct mersenne_twister *rng) {
     return y;
 }
 
+inline uint next_uint(struct mersenne_twister *rng) {
+    if (rng->index == 624) {
+        mt_shuffle(rng);
+    }
+    return temper(rng->state[rng->index++]);
+}
+
 inline uchar next_32(struct mersenne_twister *rng) {
     return next_uint(rng) >> 27;
 }
@@ -51,6 +54,134 @@ inline void init(struct mersenne_twister *rng, uint seed) {
     }
 }
 
+// words of the first twist before 623 can be computed without the state array:
+// new[i] = twist(init[i - 227k], init[i - 227k + 1]) for k = 0..i/227
+//          ^ init[i % 227 + 397]
+// so the elided twister walks the init recurrence in a handful of registers
+#define ELIDED_MAX_INDEX 622
+
+struct init_chain {
+    uint value; // init[index]
+    uint next;  // init[index + 1]
+    uint index;
+};
+
+inline uint init_step(uint previous, uint index) {
+    return 0x6C078965 * (previous ^ (previous >> 30)) + index;
+}
+
+inline void chain_start(struct init_chain *chain, uint value, uint index) {
+    chain->value = value;
+    chain->next = init_step(value, index + 1);
+    chain->index = index;
+}
+
+inline void chain_step(struct init_chain *chain) {
+    chain->index++;
+    chain->value = chain->next;
+    chain->next = init_step(chain->next, chain->index + 1);
+}
+
+inline uint twist(uint upper, uint lower) {
+    uint y = (upper & 0x80000000) | (lower & 0x7fffffff);
+    return (y>>1) ^ (0x9908b0df * (y & 1));
+}
+
+inline uint next_stop(uint i, uint target, uint stop) {
+    return (target > i && target < stop) ? target : stop;
+}
+
+struct elided_twister {
+    struct init_chain twists[3];
+    struct init_chain tail;
+    uint seed;
+    uint init_397;
+    uint index;
+};
+
+inline void elided_init(struct elided_twister *rng, uint seed, uint index) {
+    rng->seed = seed;
+    rng->index = index;
+    // single pass over the init recurrence, starting each chain as it passes
+    uint tail_index = index % 227 + 397;
+    uint last = max(index, tail_index);
+    uint value = seed;
+    uint i = 0;
+    while (true) {
+        if (i == index) {
+            chain_start(&rng->twists[0], value, i);
+        }
+        if (i + 227 == index) {
+            chain_start(&rng->twists[1], value, i);
+        }
+        if (i + 454 == index) {
+            chain_start(&rng->twists[2], value, i);
+        }
+        if (i == tail_index) {
+            chain_start(&rng->tail, value, i);
+        }
+        if (i == 397) {
+            rng->init_397 = value;
+        }
+        if (i == last) {
+            break;
+        }
+        // walk straight to the next word any chain starts at
+        uint stop = last;
+        stop = next_stop(i, index, stop);
+        stop = next_stop(i, index - 227, stop);
+        stop = next_stop(i, index - 454, stop);
+        stop = next_stop(i, tail_index, stop);
+        stop = next_stop(i, 397, stop);
+        while (i < stop) {
+            i++;
+            value = init_step(value, i);
+        }
+    }
+}
+
+inline uint elided_next_uint(struct elided_twister *rng) {
+    uint index = rng->index++;
+    uint y = rng->tail.value ^ twist(rng->twists[0].value, rng->twists[0].next);
+    if (index >= 227) {
+        y ^= twist(rng->twists[1].value, rng->twists[1].next);
+    }
+    if (index >= 454) {
+        y ^= twist(rng->twists[2].value, rng->twists[2].next);
+    }
+    chain_step(&rng->twists[0]);
+    if (rng->index == 227) {
+        chain_start(&rng->twists[1], rng->seed, 0);
+    } else if (rng->index > 227) {
+        chain_step(&rng->twists[1]);
+    }
+    if (rng->index == 454) {
+        chain_start(&rng->twists[2], rng->seed, 0);
+    } else if (rng->index > 454) {
+        chain_step(&rng->twists[2]);
+    }
+    if (rng->index % 227 == 0) {
+        chain_start(&rng->tail, rng->init_397, 397);
+    } else {
+        chain_step(&rng->tail);
+    }
+    return temper(y);
+}
+
+inline uchar elided_next_32(struct elided_twister *rng) {
+    return elided_next_uint(rng) >> 27;
+}
+
+#ifndef WORK_PER_ITEM
+#define WORK_PER_ITEM 1
+#endif
+
+#ifdef RUNTIME_ARGS
+#define SEARCH_ARGS , const uint IVS, const uint IVS_MAX, const int MIN_ADVANCE, const int MAX_ADVANCE
+#define SEARCH_ARG_NAMES , IVS, IVS_MAX, MIN_ADVANCE, MAX_ADVANCE
+#else
+#define SEARCH_ARGS
+#define SEARCH_ARG_NAMES
 #ifndef MIN_ADVANCE
 #define MIN_ADVANCE 0
 #endif
@@ -63,21 +194,34 @@ inline void init(struct mersenne_twister *rng, uint seed) {
 #ifndef IVS_MAX
 #define IVS_MAX 0
 #endif
-#define IV_MIN_0 (IVS & 31)
-#define IV_MIN_1 ((IVS >> 5) & 31)
-#define IV_MIN_2 ((IVS >> 10) & 31)
-#define IV_MIN_3 ((IVS >> 15) & 31)
-#define IV_MIN_4 ((IVS >> 20) & 31)
-#define IV_MIN_5 (IVS >> 25)
-#define IV_MAX_0 (IVS_MAX & 31)
-#define IV_MAX_1 ((IVS_MAX >> 5) & 31)
-#define IV_MAX_2 ((IVS_MAX >> 10) & 31)
-#define IV_MAX_3 ((IVS_MAX >> 15) & 31)
-#define IV_MAX_4 ((IVS_MAX >> 20) & 31)
-#define IV_MAX_5 (IVS_MAX >> 25)
-
-__kernel void find_initial_seeds(const uint offset, __global uint *cnt, __global uint *res_g) {
-    uint seed = get_global_id(0) + offset;
+#endif
+// swar range check of the six packed 5 bit ivs: lanes 0, 2 and 4 are checked
+// together with the 5 free bits above each lane as a guard, then lanes 1, 3
+// and 5 shifted down into the same positions. Setting the guard bit before
+// subtracting keeps each lane's result non-negative, so the guard survives
+// exactly where the lane is >= the value subtracted
+#define IV_LANES 0x01F07C1Fu
+#define IV_GUARDS 0x02008020u
+
+inline uint iv_lanes_in_range(uint ivs, uint ivs_min, uint ivs_max) {
+    return ((ivs | IV_GUARDS) - ivs_min) & ((ivs_max | IV_GUARDS) - ivs);
+}
+
+inline bool ivs_in_range(uint ivs, uint ivs_min, uint ivs_max) {
+    uint even = iv_lanes_in_range(ivs & IV_LANES, ivs_min & IV_LANES, ivs_max & IV_LANES);
+    uint odd = iv_lanes_in_range((ivs >> 5) & IV_LANES, (ivs_min >> 5) & IV_LANES, (ivs_max >> 5) & IV_LANES);
+    return (even & odd & IV_GUARDS) == IV_GUARDS;
+}
+
+// writes past capacity are dropped, the host sees the count overflow
+inline void emit_seed(__global uint *cnt, __global uint *res_g, uint capacity, uint seed) {
+    uint i = atomic_inc(&cnt[0]);
+    if (i < capacity) {
+        res_g[i] = seed;
+    }
+}
+
+inline void find_initial_seeds_seed(uint seed, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) {
     struct mersenne_twister rng;
     init(&rng, seed);
     advance(&rng, MIN_ADVANCE + 63);
@@ -95,15 +239,14 @@ __kernel void find_initial_seeds(const uint offset, __global uint *cnt, __global
     ivs |= next_32(&rng);
     for (int adv = MIN_ADVANCE; adv < MAX_ADVANCE; adv++) {
         if ((ivs & 0x3fffffff) == IVS) {
-            res_g[atomic_inc(&cnt[0])] = seed;
+            emit_seed(cnt, res_g, capacity, seed);
         }
         ivs <<= 5;
         ivs |= next_32(&rng);
     }
 }
 
-__kernel void find_initial_seeds_range(const uint offset, __global uint *cnt, __global uint *res_g) {
-    uint seed = get_global_id(0) + offset;
+inline void find_initial_seeds_range_seed(uint seed, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) {
     struct mersenne_twister rng;
     init(&rng, seed);
     advance(&rng, MIN_ADVANCE + 63);
@@ -120,28 +263,193 @@ __kernel void find_initial_seeds_range(const uint offset, __global uint *cnt, __
     ivs <<= 5;
     ivs |= next_32(&rng);
     for (int adv = MIN_ADVANCE; adv < MAX_ADVANCE; adv++) {
-        uchar iv;
-        iv = ivs & 31;
-        if (IV_MIN_0 <= iv && IV_MAX_0 >= iv) {
-            iv = (ivs >> 5) & 31;
-            if (IV_MIN_1 <= iv && IV_MAX_1 >= iv) {
-                iv = (ivs >> 10) & 31;
-                if (IV_MIN_2 <= iv && IV_MAX_2 >= iv) {
-                    iv = (ivs >> 15) & 31;
-                    if (IV_MIN_3 <= iv && IV_MAX_3 >= iv) {
-                        iv = (ivs >> 20) & 31;
-                        if (IV_MIN_4 <= iv && IV_MAX_4 >= iv) {
-                            iv = (ivs >> 25) & 31;
-                            if (IV_MIN_5 <= iv && IV_MAX_5 >= iv) {
-                                res_g[atomic_inc(&cnt[0])] = seed;
-                            }
-                        }
-                    }
+        if (ivs_in_range(ivs, IVS, IVS_MAX)) {
+            emit_seed(cnt, res_g, capacity, seed);
+        }
+
+        ivs <<= 5;
+        ivs |= next_32(&rng);
+    }
+}
+
+// same searches on the elided twister, only valid while
+// MAX_ADVANCE + 67 <= ELIDED_MAX_INDEX
+inline void find_initial_seeds_elided_seed(uint seed, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) {
+    struct elided_twister rng;
+    elided_init(&rng, seed, MIN_ADVANCE + 63);
+    uint ivs = 0;
+    for (int i = 0; i < 6; i++) {
+        ivs <<= 5;
+        ivs |= elided_next_32(&rng);
+    }
+    for (int adv = MIN_ADVANCE; adv < MAX_ADVANCE; adv++) {
+        if ((ivs & 0x3fffffff) == IVS) {
+            emit_seed(cnt, res_g, capacity, seed);
+        }
+        if (adv + 1 < MAX_ADVANCE) {
+            ivs <<= 5;
+            ivs |= elided_next_32(&rng);
+        }
+    }
+}
+
+inline void find_initial_seeds_range_elided_seed(uint seed, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) {
+    struct elided_twister rng;
+    elided_init(&rng, seed, MIN_ADVANCE + 63);
+    uint ivs = 0;
+    for (int i = 0; i < 6; i++) {
+        ivs <<= 5;
+        ivs |= elided_next_32(&rng);
+    }
+    for (int adv = MIN_ADVANCE; adv < MAX_ADVANCE; adv++) {
+        if (ivs_in_range(ivs, IVS, IVS_MAX)) {
+            emit_seed(cnt, res_g, capacity, seed);
+        }
+        if (adv + 1 < MAX_ADVANCE) {
+            ivs <<= 5;
+            ivs |= elided_next_32(&rng);
+        }
+    }
+}
+
+// each work item searches WORK_PER_ITEM seeds strided by the global size
+#define SEED_KERNEL(name) \
+__kernel void name(const uint offset, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) { \
+    for (uint item = 0; item < WORK_PER_ITEM; item++) { \
+        name##_seed(get_global_id(0) + item * get_global_size(0) + offset, cnt, res_g, capacity SEARCH_ARG_NAMES); \
+    } \
+}
+
+SEED_KERNEL(find_initial_seeds)
+SEED_KERNEL(find_initial_seeds_range)
+SEED_KERNEL(find_initial_seeds_elided)
+SEED_KERNEL(find_initial_seeds_range_elided)
+
+// stage two of full searches, the first advance in [MIN_ADVANCE, MAX_ADVANCE)
+// whose ivs are in range, -1 if there is none
+inline int first_advance(uint seed SEARCH_ARGS) {
+    struct mersenne_twister rng;
+    init(&rng, seed);
+    advance(&rng, MIN_ADVANCE + 63);
+    uint ivs = 0;
+    for (int i = 0; i < 6; i++) {
+        ivs <<= 5;
+        ivs |= next_32(&rng);
+    }
+    for (int adv = MIN_ADVANCE; adv < MAX_ADVANCE; adv++) {
+        if (ivs_in_range(ivs & 0x3fffffff, IVS, IVS_MAX)) {
+            return adv;
+        }
+        ivs <<= 5;
+        ivs |= next_32(&rng);
+    }
+    return -1;
+}
+
+inline int first_advance_elided(uint seed SEARCH_ARGS) {
+    struct elided_twister rng;
+    elided_init(&rng, seed, MIN_ADVANCE + 63);
+    uint ivs = 0;
+    for (int i = 0; i < 6; i++) {
+        ivs <<= 5;
+        ivs |= elided_next_32(&rng);
+    }
+    for (int adv = MIN_ADVANCE; adv < MAX_ADVANCE; adv++) {
+        if (ivs_in_range(ivs & 0x3fffffff, IVS, IVS_MAX)) {
+            return adv;
+        }
+        if (adv + 1 < MAX_ADVANCE) {
+            ivs <<= 5;
+            ivs |= elided_next_32(&rng);
+        }
+    }
+    return -1;
+}
+
+// filters the candidates a stage one kernel compacted into cnt_in/res_in, one
+// work item per slot of the candidate buffer, keeping (seed, advance) of the
+// candidates that pass so only full matches are read back
+#define VERIFY_KERNEL(name, first) \
+__kernel void name(__global const uint *cnt_in, __global const uint *res_in, __global uint *cnt, __global uint2 *res_g SEARCH_ARGS) { \
+    uint i = get_global_id(0); \
+    if (i >= min(cnt_in[0], (uint)get_global_size(0))) { \
+        return; \
+    } \
+    uint seed = res_in[i]; \
+    int adv = first(seed SEARCH_ARG_NAMES); \
+    if (adv >= 0) { \
+        res_g[atomic_inc(&cnt[0])] = (uint2)(seed, (uint)adv); \
+    } \
+}
+
+VERIFY_KERNEL(verify_candidates, first_advance)
+VERIFY_KERNEL(verify_candidates_elided, first_advance_elided)
+
+// multi-target searches check every 30 bit iv window in
+// [min_advance, max_advance) against many targets at once: a binary search
+// of the sorted exact targets, skipped unless the window's top 16 bits are
+// set in a bitmap of the targets' top bits, then a swar check of each range
+// target. Every
+// target only matches within its own advance window. Candidates are
+// (seed, entry) pairs, entries index the exact targets then the ranges, and
+// writes past capacity are dropped, the host sees the count overflow
+inline void emit_candidate(__global uint *cnt, __global uint2 *res_g, uint capacity, uint seed, uint entry) {
+    uint i = atomic_inc(&cnt[0]);
+    if (i < capacity) {
+        res_g[i] = (uint2)(seed, entry);
+    }
+}
+
+#define MULTI_ARGS , __global uint *cnt, __global uint2 *res_g, const uint capacity, \
+    __global const uint *exact_filter, __global const uint *exact_ivs, \
+    __global const int2 *exact_windows, const uint exact_count, \
+    __global const uint4 *ranges, const uint range_count, const int min_advance, const int max_advance
+#define MULTI_ARG_NAMES , cnt, res_g, capacity, exact_filter, exact_ivs, exact_windows, exact_count, \
+    ranges, range_count, min_advance, max_advance
+
+inline void find_initial_seeds_multi_seed(uint seed MULTI_ARGS) {
+    struct mersenne_twister rng;
+    init(&rng, seed);
+    advance(&rng, min_advance + 63);
+    uint ivs = 0;
+    for (int i = 0; i < 6; i++) {
+        ivs <<= 5;
+        ivs |= next_32(&rng);
+    }
+    for (int adv = min_advance; adv < max_advance; adv++) {
+        ivs &= 0x3fffffff;
+        if ((exact_filter[ivs >> 19] >> ((ivs >> 14) & 31)) & 1) {
+            // first exact target >= ivs
+            uint low = 0;
+            uint high = exact_count;
+            while (low < high) {
+                uint mid = (low + high) >> 1;
+                if (exact_ivs[mid] < ivs) {
+                    low = mid + 1;
+                } else {
+                    high = mid;
+                }
+            }
+            for (uint entry = low; entry < exact_count && exact_ivs[entry] == ivs; entry++) {
+                int2 window = exact_windows[entry];
+                if (adv >= window.x && adv < window.y) {
+                    emit_candidate(cnt, res_g, capacity, seed, entry);
                 }
             }
         }
-
+        for (uint range = 0; range < range_count; range++) {
+            uint4 target = ranges[range];
+            if (adv >= (int)target.z && adv < (int)target.w && ivs_in_range(ivs, target.x, target.y)) {
+                emit_candidate(cnt, res_g, capacity, seed, exact_count + range);
+            }
+        }
         ivs <<= 5;
         ivs |= next_32(&rng);
     }
 }
+
+__kernel void find_initial_seeds_multi(const uint offset MULTI_ARGS) {
+    for (uint item = 0; item < WORK_PER_ITEM; item++) {
+        find_initial_seeds_multi_seed(get_global_id(0) + item * get_global_size(0) + offset MULTI_ARG_NAMES);
+    }
+}
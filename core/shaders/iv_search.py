@@ -5,152 +5,313 @@ import importlib.resources
 import numpy as np
 import pyopencl as cl
 import numba
-from numba_pokemon_prngs.mersenne_twister import MersenneTwister
-from qtpy.QtCore import QThread, Signal
+from .engine import (
+    SearchEngine,
+    DeviceState,
+    ResultSlot,
+    format_range,
+    parse_int,
+    parse_range,
+)
+from .prngs import mt_init, mt_advance, mt_next
+from .verifiers import verifier
 from .. import shaders
 
 SHADER_CODE = importlib.resources.read_text(shaders, "iv_search.cl")
+# the elided kernels compute words of the first twist straight from the init
+# recurrence, which works up to word 622 (MAX_ADVANCE + 67)
+ELIDED_MAX_ADVANCE = 622 - 67
 
 
-@numba.njit
-def test_seed(seed, target_ivs_min, target_ivs_max, min_advance, max_advance) -> int:
-    """Test if a seed contains the target ivs within the given range"""
-    mt = MersenneTwister(seed)
-    mt.advance(min_advance + 63)
-    ivs = np.uint32(0)
-    ivs |= mt.next_rand(32)
-    ivs <<= 5
-    ivs |= mt.next_rand(32)
-    ivs <<= 5
-    ivs |= mt.next_rand(32)
-    ivs <<= 5
-    ivs |= mt.next_rand(32)
-    ivs <<= 5
-    ivs |= mt.next_rand(32)
-    ivs <<= 5
-    ivs |= mt.next_rand(32)
+def use_elided_kernel(device: cl.Device, advance_range: range) -> bool:
+    """Check if the state-eliding kernels apply to a device and advance range
+
+    Only worth it where a 624 word private array spills, cpus keep it in cache
+    """
+    return (
+        advance_range.stop <= ELIDED_MAX_ADVANCE
+        and not device.type & cl.device_type.CPU
+    )
+
+
+# lanes 0, 2 and 4 of six packed 5 bit ivs, and the free bit above each lane
+IV_LANES = np.uint64(0x01F07C1F)
+IV_GUARDS = np.uint64(0x02008020)
+
+
+@numba.njit(nogil=True)
+def ivs_in_range(ivs, ivs_min, ivs_max) -> bool:
+    """Branch-free check that all six packed ivs are within packed minimums and
+    maximums, the same swar check as the range kernels"""
+    even = ((ivs & IV_LANES) | IV_GUARDS) - (ivs_min & IV_LANES)
+    even &= ((ivs_max & IV_LANES) | IV_GUARDS) - (ivs & IV_LANES)
+    ivs >>= np.uint64(5)
+    ivs_min >>= np.uint64(5)
+    ivs_max >>= np.uint64(5)
+    odd = ((ivs & IV_LANES) | IV_GUARDS) - (ivs_min & IV_LANES)
+    odd &= ((ivs_max & IV_LANES) | IV_GUARDS) - (ivs & IV_LANES)
+    return (even & odd & IV_GUARDS) == IV_GUARDS
+
+
+@numba.njit(nogil=True)
+def test_seed_state(
+    state, seed, target_ivs_min, target_ivs_max, min_advance, max_advance
+) -> int:
+    """Test a seed using a preallocated MT state buffer, -1 if not found"""
+    target_ivs_min = np.uint64(target_ivs_min)
+    target_ivs_max = np.uint64(target_ivs_max)
+    index = mt_init(state, seed)
+    index = mt_advance(state, index, min_advance + 63)
+    ivs = np.uint64(0)
+    for _ in range(6):
+        value, index = mt_next(state, index)
+        ivs = (ivs << np.uint64(5)) | (value >> np.uint64(27))
     for adv in range(min_advance, max_advance):
-        valid = True
-        for i in range(6):
-            if not (
-                (target_ivs_min >> i * 5) & 31
-                <= (ivs >> i * 5) & 31
-                <= (target_ivs_max >> i * 5) & 31
-            ):
-                valid = False
-                break
-        if valid:
+        if ivs_in_range(ivs, target_ivs_min, target_ivs_max):
             return adv
-        ivs <<= 5
-        ivs |= mt.next_rand(32)
-    return None
-
-
-class SearchIVThread(QThread):
-    """Interface for iv_search shader"""
-
-    finished = Signal()
-    log = Signal(str)
-    results = Signal(object)
-    init_progress_bar = Signal(int)
-    progress = Signal(int)
-    started = Signal()
-
-    def __init__(self, *args) -> None:
-        super().__init__()
-        self.args = args
-
-    def run(self) -> None:
-        """Thread work"""
-        (
-            platform,
-            device,
-            ivs_1,
-            ivs_2,
-            ivs_max_1,
-            advance_range_1,
-            advance_range_2,
-            start,
-            chunks,
-        ) = self.args
-        ctx = cl.Context(
-            dev_type=cl.device_type.ALL,
-            properties=[(cl.context_properties.PLATFORM, platform)],
+        value, index = mt_next(state, index)
+        ivs = ((ivs << np.uint64(5)) | (value >> np.uint64(27))) & np.uint64(
+            0x3FFFFFFF
         )
-        queue = cl.CommandQueue(ctx, device)
-        program = cl.Program(ctx, SHADER_CODE).build(
-            shaders.build_shader_constants(
-                ivs=reduce(lambda x, y: (x << 5) | y, ivs_1),
-                ivs_max=(
-                    reduce(lambda x, y: (x << 5) | y, ivs_max_1) if ivs_max_1 else 0
-                ),
-                min_advance=advance_range_1.start,
-                max_advance=advance_range_1.stop,
+    return -1
+
+
+@numba.njit(nogil=True)
+def test_seed(seed, target_ivs_min, target_ivs_max, min_advance, max_advance) -> int:
+    """Test if a seed contains the target ivs within the given range"""
+    adv = test_seed_state(
+        np.empty(624, np.uint32),
+        seed,
+        target_ivs_min,
+        target_ivs_max,
+        min_advance,
+        max_advance,
+    )
+    return adv if adv != -1 else None
+
+
+@numba.njit(nogil=True)
+def seed_advances(seeds, advances) -> np.ndarray:
+    """(seed, advance) array of the seeds with an advance found"""
+    matches = np.flatnonzero(advances != -1)
+    results = np.empty((len(matches), 2), np.int64)
+    for i, match in enumerate(matches):
+        results[i, 0] = seeds[match]
+        results[i, 1] = advances[match]
+    return results
+
+
+@numba.njit(parallel=True, nogil=True)
+def test_seeds(
+    seeds, target_ivs_min, target_ivs_max, min_advance, max_advance
+) -> np.ndarray:
+    """Test every candidate seed, returning a (seed, advance) array of matches"""
+    advances = np.empty(len(seeds), np.int64)
+    blocks = min(numba.get_num_threads(), len(seeds))
+    for block in numba.prange(blocks):
+        # one state buffer per block, reused for each of its candidates
+        state = np.empty(624, np.uint32)
+        for i in range(block, len(seeds), blocks):
+            advances[i] = test_seed_state(
+                state,
+                seeds[i],
+                target_ivs_min,
+                target_ivs_max,
+                min_advance,
+                max_advance,
             )
+    return seed_advances(seeds, advances)
+
+
+@numba.njit(nogil=True)
+def test_seeds_serial(
+    seeds, target_ivs_min, target_ivs_max, min_advance, max_advance
+) -> np.ndarray:
+    """test_seeds on one thread, ahead-of-time compilation has no parallel support"""
+    advances = np.empty(len(seeds), np.int64)
+    state = np.empty(624, np.uint32)
+    for i in range(len(seeds)):
+        advances[i] = test_seed_state(
+            state,
+            seeds[i],
+            target_ivs_min,
+            target_ivs_max,
+            min_advance,
+            max_advance,
+        )
+    return seed_advances(seeds, advances)
+
+
+class IVSearch(SearchEngine):
+    """Search for initial seeds that generate target ivs"""
+
+    name = "iv"
+    pipeline_depth = 2
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        ivs_1: list[int],
+        ivs_2: list[int],
+        ivs_max_1: list[int],
+        advance_range_1: range,
+        advance_range_2: range,
+        start: int,
+        chunks: int,
+    ) -> None:
+        super().__init__(devices)
+        self.ivs_1 = ivs_1
+        self.ivs_2 = ivs_2
+        self.ivs_max_1 = ivs_max_1
+        self.advance_range_1 = advance_range_1
+        self.advance_range_2 = advance_range_2
+        self.start = start
+        self.chunk_count = chunks
+        self.target_ivs_1 = reduce(lambda x, y: (x << 5) | y, ivs_1)
+        self.target_ivs_max_1 = (
+            reduce(lambda x, y: (x << 5) | y, ivs_max_1) if ivs_max_1 else 0
         )
-        target_ivs = None
-        if ivs_2 is not None:
-            target_ivs = reduce(lambda x, y: (x << 5) | y, ivs_2)
-
-        find_initial_seeds = (
-            program.find_initial_seeds
-            if ivs_max_1 is None
-            else program.find_initial_seeds_range
+        self.target_ivs_2 = (
+            reduce(lambda x, y: (x << 5) | y, ivs_2) if ivs_2 is not None else None
         )
 
-        host_results = np.zeros(
-            round(4 * (advance_range_1.stop - advance_range_1.start) * 1.5), np.uint32
+    @classmethod
+    def from_spec(cls, devices: list[cl.Device], spec: dict) -> "IVSearch":
+        """Construct the search from a JSON job spec
+
+        A full search is run when ivs_2 is given, otherwise a partial search
+        starting from base_seed using ivs_1 and ivs_max_1 as the iv range
+        """
+        full_search = spec.get("ivs_2") is not None
+        return cls(
+            devices,
+            spec["ivs_1"],
+            spec.get("ivs_2"),
+            None if full_search else spec.get("ivs_max_1", [31] * 6),
+            parse_range(spec["advance_range_1"]),
+            parse_range(spec.get("advance_range_2")),
+            0 if full_search else parse_int(spec.get("base_seed", 0)),
+            parse_int(spec.get("chunks", 0x100 if full_search else 0x4)),
         )
-        host_count = np.zeros(1, np.int32)
-
-        device_results = cl.Buffer(ctx, cl.mem_flags.READ_WRITE, host_results.nbytes)
-        device_count = cl.Buffer(ctx, cl.mem_flags.READ_WRITE, host_count.nbytes)
-
-        cl.enqueue_copy(queue, device_results, host_results)
-        cl.enqueue_copy(queue, device_count, host_count)
-        # TODO: custom step count/chunk size
-        self.init_progress_bar.emit(chunks)
-        self.started.emit()
-        last_count = 0
-        for chunk in range(chunks):
-            if self.isInterruptionRequested():
-                break
-            find_initial_seeds(
-                queue,
-                (0x1000000,),
+
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        return {
+            "ivs_1": self.ivs_1,
+            "ivs_2": self.ivs_2,
+            "ivs_max_1": self.ivs_max_1,
+            "advance_range_1": format_range(self.advance_range_1),
+            "advance_range_2": format_range(self.advance_range_2),
+            "base_seed": self.start,
+            "chunks": self.chunk_count,
+        }
+
+    def chunks(self) -> list[int]:
+        """Chunks of 2^24 seeds from the starting seed"""
+        return list(range(self.chunk_count))
+
+    def kernel_name(self, device: cl.Device) -> str:
+        """Name of the kernel used on a device"""
+        kernel_name = (
+            "find_initial_seeds"
+            if self.ivs_max_1 is None
+            else "find_initial_seeds_range"
+        )
+        if use_elided_kernel(device, self.advance_range_1):
+            kernel_name += "_elided"
+        return kernel_name
+
+    def verify_kernel_name(self, device: cl.Device) -> str:
+        """Name of the stage two kernel a full search uses on a device"""
+        if use_elided_kernel(device, self.advance_range_2):
+            return "verify_candidates_elided"
+        return "verify_candidates"
+
+    def profile_key(self, device: cl.Device) -> str:
+        """Key of the kernel a device runs in its saved launch profiles"""
+        return f"{self.name}.{self.kernel_name(device)}"
+
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device"""
+        state = self.create_state(device)
+        state.kernel = state.build_kernel(
+            SHADER_CODE, self.build_options(state), self.kernel_name(device)
+        )
+        state.search_args = (
+            np.uint32(self.target_ivs_1),
+            np.uint32(self.target_ivs_max_1),
+            np.int32(self.advance_range_1.start),
+            np.int32(self.advance_range_1.stop),
+        )
+        capacity = round(
+            4 * (self.advance_range_1.stop - self.advance_range_1.start) * 1.5
+        )
+        state.allocate_slots(self.pipeline_depth, capacity)
+        if self.target_ivs_2 is not None:
+            # full searches check pokemon 2 on the device over each chunk's
+            # stage one candidates, reading back only (seed, advance) matches
+            state.verify_kernel = state.build_kernel(
+                SHADER_CODE, self.build_options(state), self.verify_kernel_name(device)
+            )
+            state.verify_args = (
+                np.uint32(self.target_ivs_2),
+                np.uint32(self.target_ivs_2),
+                np.int32(self.advance_range_2.start),
+                np.int32(self.advance_range_2.stop),
+            )
+            for slot in state.slots:
+                slot.verified = ResultSlot(state, capacity, 2)
+        return state
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> ResultSlot:
+        """Queue the kernels and result count readback for one chunk"""
+        slot = state.take_slot()
+        slot.reset(state.queue)
+        kernel_event = self.enqueue_launches(
+            state,
+            np.uint32(self.start + (chunk << 24)),
+            slot.device_count,
+            slot.device_results,
+            np.uint32(slot.capacity),
+            *state.search_args,
+        )
+        # full searches still read back the stage one count to catch overflow
+        slot.enqueue_count(state, kernel_event)
+        if self.target_ivs_2 is not None:
+            slot.verified.reset(state.queue)
+            verify_event = state.verify_kernel(
+                state.queue,
+                (slot.capacity,),
                 None,
-                np.uint32(start + (chunk << 24)),
-                device_count,
-                device_results,
+                slot.device_count,
+                slot.device_results,
+                slot.verified.device_count,
+                slot.verified.device_results,
+                *state.verify_args,
             )
-            cl.enqueue_copy(queue, host_results, device_results)
-            cl.enqueue_copy(queue, host_count, device_count)
-            for i in range(last_count, host_count[0]):
-                # partial search
-                if target_ivs is None:
-                    self.results.emit(
-                        (
-                            host_results[i],
-                            test_seed(
-                                host_results[i],
-                                reduce(lambda x, y: (x << 5) | y, ivs_1),
-                                reduce(lambda x, y: (x << 5) | y, ivs_max_1),
-                                advance_range_1.start,
-                                advance_range_1.stop,
-                            ),
-                        )
-                    )
-                # full search
-                elif (
-                    test_seed(
-                        host_results[i],
-                        target_ivs,
-                        target_ivs,
-                        advance_range_2.start,
-                        advance_range_2.stop,
-                    )
-                    is not None
-                ):
-                    self.results.emit(host_results[i])
-            last_count = host_count[0]
-            self.progress.emit(chunk + 1)
+            state.record("kernel", verify_event)
+            slot.verified.enqueue_count(state, verify_event)
+        state.queue.flush()
+        state.transfer_queue.flush()
+        return slot
+
+    def collect_chunk(self, state: DeviceState, pending: ResultSlot) -> np.ndarray:
+        """Wait for a queued chunk and read back its candidate seeds, or the
+        (seed, advance) pairs verified on the device for full searches"""
+        if self.target_ivs_2 is None:
+            return pending.read(state)
+        pending.wait_count()
+        return pending.verified.read(state)
+
+    def verify_chunk(self, candidates: np.ndarray) -> np.ndarray:
+        """Re-test candidate seeds of partial searches on the cpu, returning a
+        (seed, advance) array, full searches are verified on the device"""
+        if self.target_ivs_2 is not None:
+            return candidates.astype(np.int64)
+        return verifier("test_seeds")(
+            candidates,
+            self.target_ivs_1,
+            self.target_ivs_max_1,
+            self.advance_range_1.start,
+            self.advance_range_1.stop,
+        )
@@ -0,0 +1,264 @@
+"""Kernel interface for iv searches of many targets in one pass"""
+
+from functools import reduce
+import numpy as np
+import pyopencl as cl
+from .engine import (
+    SearchEngine,
+    DeviceState,
+    ResultSlot,
+    format_range,
+    parse_int,
+    parse_range,
+)
+from .iv_search import SHADER_CODE, IVSearch
+from .verifiers import verifier
+
+# candidates a chunk may hold across every target, wider targets are rejected
+MAX_CAPACITY = 1 << 22
+# exact targets are prefiltered by a bitmap of the top bits of their 30 bits
+FILTER_BITS = 16
+
+
+def pack_ivs(ivs: list[int]) -> int:
+    """Six ivs packed into 5 bit lanes, hp in the top lane"""
+    return reduce(lambda x, y: (x << 5) | y, ivs)
+
+
+class IVTarget:
+    """One query of a multi-target search
+
+    Pokemon 1's ivs, exact or from ivs_1 to ivs_max_1, are searched for on
+    the device within advance_range_1. If ivs_2 is given the candidates are
+    then checked for pokemon 2's exact ivs within advance_range_2 on the host
+    """
+
+    def __init__(
+        self,
+        ivs_1: list[int],
+        ivs_max_1: list[int],
+        advance_range_1: range,
+        ivs_2: list[int] = None,
+        advance_range_2: range = None,
+    ) -> None:
+        self.ivs_1 = ivs_1
+        self.ivs_max_1 = ivs_max_1
+        self.advance_range_1 = advance_range_1
+        self.ivs_2 = ivs_2
+        self.advance_range_2 = advance_range_2
+        self.target_ivs_1 = pack_ivs(ivs_1)
+        self.target_ivs_max_1 = pack_ivs(ivs_max_1 or ivs_1)
+        self.target_ivs_2 = pack_ivs(ivs_2) if ivs_2 is not None else None
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "IVTarget":
+        """Construct the target from its part of a JSON job spec, exact unless
+        ivs_max_1 is given"""
+        return cls(
+            spec["ivs_1"],
+            spec.get("ivs_max_1"),
+            parse_range(spec["advance_range_1"]),
+            spec.get("ivs_2"),
+            parse_range(spec.get("advance_range_2")),
+        )
+
+    @classmethod
+    def from_search(cls, search: IVSearch) -> "IVTarget":
+        """Target finding the same results as a single iv search"""
+        return cls(
+            search.ivs_1,
+            search.ivs_max_1,
+            search.advance_range_1,
+            search.ivs_2,
+            search.advance_range_2,
+        )
+
+    def spec(self) -> dict:
+        """JSON job spec of the target, the inverse of from_spec"""
+        return {
+            "ivs_1": self.ivs_1,
+            "ivs_max_1": self.ivs_max_1,
+            "advance_range_1": format_range(self.advance_range_1),
+            "ivs_2": self.ivs_2,
+            "advance_range_2": format_range(self.advance_range_2),
+        }
+
+    @property
+    def exact(self) -> bool:
+        """Check if pokemon 1's ivs are a single value rather than a range"""
+        return self.target_ivs_1 == self.target_ivs_max_1
+
+    def expected_candidates(self, seeds: int) -> float:
+        """Expected device candidates from a number of seeds"""
+        if self.ivs_max_1 is None:
+            chance = 1 / 32**6
+        else:
+            chance = np.prod(
+                [
+                    (maximum - minimum + 1) / 32
+                    for minimum, maximum in zip(self.ivs_1, self.ivs_max_1)
+                ]
+            )
+        return float(chance) * len(self.advance_range_1) * seeds
+
+    def verify(self, seeds: np.ndarray) -> np.ndarray:
+        """(seed, advance) array of the candidate seeds that match, the
+        advance is pokemon 2's if ivs_2 is given"""
+        test_seeds = verifier("test_seeds")
+        if self.target_ivs_2 is not None:
+            return test_seeds(
+                seeds,
+                self.target_ivs_2,
+                self.target_ivs_2,
+                self.advance_range_2.start,
+                self.advance_range_2.stop,
+            )
+        return test_seeds(
+            seeds,
+            self.target_ivs_1,
+            self.target_ivs_max_1,
+            self.advance_range_1.start,
+            self.advance_range_1.stop,
+        )
+
+
+class MultiIVSearch(SearchEngine):
+    """Search for initial seeds of many iv targets in one pass over the seeds
+
+    Results are (target index, seed, advance)
+    """
+
+    name = "multi_iv"
+    pipeline_depth = 2
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        targets: list[IVTarget],
+        start: int = 0,
+        chunks: int = 0x100,
+    ) -> None:
+        super().__init__(devices)
+        self.targets = targets
+        self.start = start
+        self.chunk_count = chunks
+        # device entries are the exact targets sorted by ivs, then the ranges
+        exact = sorted(
+            (index for index, target in enumerate(targets) if target.exact),
+            key=lambda index: targets[index].target_ivs_1,
+        )
+        ranges = [index for index, target in enumerate(targets) if not target.exact]
+        self.entry_targets = np.array(exact + ranges, np.int64)
+        self.exact_count = len(exact)
+        self.capacity = sum(
+            round(2 * target.expected_candidates(self.chunk_seeds)) + 64
+            for target in targets
+        )
+        if self.capacity > MAX_CAPACITY:
+            raise ValueError(
+                "Targets would find too many candidates per chunk, "
+                "narrow their ivs or advance ranges"
+            )
+
+    @classmethod
+    def from_spec(cls, devices: list[cl.Device], spec: dict) -> "MultiIVSearch":
+        """Construct the search from a JSON job spec
+
+        targets is a list of single iv search specs, searched together from
+        base_seed over chunks chunks of 2^24 seeds (every seed by default)
+        """
+        return cls(
+            devices,
+            [IVTarget.from_spec(target) for target in spec["targets"]],
+            parse_int(spec.get("base_seed", 0)),
+            parse_int(spec.get("chunks", 0x100)),
+        )
+
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        return {
+            "targets": [target.spec() for target in self.targets],
+            "base_seed": self.start,
+            "chunks": self.chunk_count,
+        }
+
+    def chunks(self) -> list[int]:
+        """Chunks of 2^24 seeds from the starting seed"""
+        return list(range(self.chunk_count))
+
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device"""
+        state = self.create_state(device)
+        state.kernel = state.build_kernel(
+            SHADER_CODE, self.build_options(state), "find_initial_seeds_multi"
+        )
+        targets = [self.targets[index] for index in self.entry_targets]
+        exact, ranges = targets[: self.exact_count], targets[self.exact_count :]
+        # buffers hold at least one (unused) entry
+        exact_ivs = np.zeros(max(len(exact), 1), np.uint32)
+        exact_windows = np.zeros((max(len(exact), 1), 2), np.int32)
+        for i, target in enumerate(exact):
+            exact_ivs[i] = target.target_ivs_1
+            exact_windows[i] = (
+                target.advance_range_1.start,
+                target.advance_range_1.stop,
+            )
+        exact_filter = np.zeros(1 << FILTER_BITS, np.bool_)
+        exact_filter[exact_ivs[: len(exact)] >> (30 - FILTER_BITS)] = True
+        range_targets = np.zeros((max(len(ranges), 1), 4), np.uint32)
+        for i, target in enumerate(ranges):
+            range_targets[i] = (
+                target.target_ivs_1,
+                target.target_ivs_max_1,
+                target.advance_range_1.start,
+                target.advance_range_1.stop,
+            )
+        state.search_args = (
+            np.uint32(self.capacity),
+            state.upload(np.packbits(exact_filter, bitorder="little")),
+            state.upload(exact_ivs),
+            state.upload(exact_windows),
+            np.uint32(len(exact)),
+            state.upload(range_targets),
+            np.uint32(len(ranges)),
+            np.int32(min(target.advance_range_1.start for target in self.targets)),
+            np.int32(max(target.advance_range_1.stop for target in self.targets)),
+        )
+        state.slots = [
+            ResultSlot(state, self.capacity, 2) for _ in range(self.pipeline_depth)
+        ]
+        return state
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> ResultSlot:
+        """Queue the kernel and result count readback for one chunk"""
+        slot = state.take_slot()
+        slot.reset(state.queue)
+        slot.enqueue_count(
+            state,
+            self.enqueue_launches(
+                state,
+                np.uint32(self.start + (chunk << 24)),
+                slot.device_count,
+                slot.device_results,
+                *state.search_args,
+            ),
+        )
+        state.queue.flush()
+        state.transfer_queue.flush()
+        return slot
+
+    def collect_chunk(self, state: DeviceState, pending: ResultSlot) -> np.ndarray:
+        """Wait for a queued chunk and read back its (seed, entry) candidates"""
+        return pending.read(state)
+
+    def verify_chunk(self, candidates: np.ndarray) -> list[tuple[int, int, int]]:
+        """Re-test each target's candidate seeds on the cpu"""
+        results = []
+        for entry in np.unique(candidates[:, 1]):
+            target = int(self.entry_targets[entry])
+            seeds = np.unique(candidates[candidates[:, 1] == entry, 0])
+            results.extend(
+                (target, int(seed), int(advance))
+                for seed, advance in self.targets[target].verify(seeds)
+            )
+        return results
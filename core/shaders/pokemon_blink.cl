@@ -1,9 +1,28 @@
+#ifndef WORK_PER_ITEM
+#define WORK_PER_ITEM 1
+#endif
+
+// blink values are next_uint scaled to [0, 240)
+#define BLINK_VALUES 240
+// blinks matched by the sliding window, any further blinks are checked by
+// re-simulating the few starts that match these
+#define WINDOW_BLINKS 64
+
+#ifdef RUNTIME_ARGS
+#define SEARCH_ARGS , __constant short *BLINKS, __constant ulong *BLINK_MASKS, const int BLINK_COUNT, const short LEEWAY, const int BASE_ADVANCE, const int MAX_ADVANCE
+#define SEARCH_ARG_NAMES , BLINKS, BLINK_MASKS, BLINK_COUNT, LEEWAY, BASE_ADVANCE, MAX_ADVANCE
+#else
+#define SEARCH_ARGS
+#define SEARCH_ARG_NAMES
 #ifndef BLINK_COUNT
 #define BLINK_COUNT 0
 #endif
 #ifndef BLINK_DATA
 #define BLINK_DATA
 #endif
+#ifndef BLINK_MASK_DATA
+#define BLINK_MASK_DATA
+#endif
 #ifndef BASE_ADVANCE
 #define BASE_ADVANCE 0
 #endif
@@ -14,6 +33,8 @@
 #define LEEWAY 0
 #endif
 __constant short BLINKS[BLINK_COUNT] = { BLINK_DATA };
+__constant ulong BLINK_MASKS[BLINK_VALUES] = { BLINK_MASK_DATA };
+#endif
 
 struct tinymt {
   uint state[4];
@@ -61,33 +82,73 @@ inline void init(struct tinymt *rng, unsigned int seed) {
   }
 }
 
-__kernel void find_initial_seeds(const uint offset, __global uint *cnt, __global uint *res_g) {
-  uint seed = get_global_id(0) + offset;
+// check every blink from a start advance by re-simulating it
+inline bool matches_from(uint seed, int start SEARCH_ARGS) {
+  struct tinymt rng;
+  init(&rng, seed);
+  for (int i = 0; i < start; i++) {
+    advance(&rng);
+  }
+  for (int i = 0; i < BLINK_COUNT; i++) {
+    short blink = next_blink(&rng);
+    if (!((BLINKS[i] - LEEWAY) <= blink && blink <= (BLINKS[i] + LEEWAY))) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// writes past capacity are dropped, the host sees the count overflow
+inline void emit_seed(__global uint *cnt, __global uint *res_g, uint capacity, uint seed) {
+  uint i = atomic_inc(&cnt[0]);
+  if (i < capacity) {
+    res_g[i] = seed;
+  }
+}
+
+// shift-and matcher: each blink value is generated once and bit i of window is
+// set while the last i + 1 values match the first i + 1 target blinks, so every
+// start advance is tested in O(range + blinks). BLINK_MASKS[value] has bit i
+// set if value is within LEEWAY of blink i
+inline void find_initial_seeds_seed(uint seed, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) {
   struct tinymt rng;
   init(&rng, seed);
   for (int i = 0; i < BASE_ADVANCE; i++) {
     advance(&rng);
   }
 
-  for (int start = BASE_ADVANCE; start <= MAX_ADVANCE; start++) {
-    bool valid = true;
-    struct tinymt test_rng;
-    test_rng.state[0] = rng.state[0];
-    test_rng.state[1] = rng.state[1];
-    test_rng.state[2] = rng.state[2];
-    test_rng.state[3] = rng.state[3];
-    next_uint(&rng);
-    // TODO: better checking algorithm
-    for (int i = 0; i < BLINK_COUNT; i++) {
-      short blink = next_blink(&test_rng);
-      valid = (BLINKS[i] - LEEWAY) <= blink && blink <= (BLINKS[i] + LEEWAY);
-      if (!valid) {
-        break;
-      }
+  const int window_blinks = min(BLINK_COUNT, WINDOW_BLINKS);
+  if (window_blinks == 0) {
+    if (BASE_ADVANCE <= MAX_ADVANCE) {
+      emit_seed(cnt, res_g, capacity, seed);
     }
-    if (valid) {
-      res_g[atomic_inc(&cnt[0])] = seed;
+    return;
+  }
+  const ulong full = 1ul << (window_blinks - 1);
+  ulong window = 0;
+  const int last = MAX_ADVANCE + window_blinks;
+  for (int adv = BASE_ADVANCE + 1; adv <= last; adv++) {
+    // no new starts begin past MAX_ADVANCE, stop once every window has failed
+    const ulong start_bit = adv <= MAX_ADVANCE + 1;
+    if (!start_bit && !window) {
+      break;
+    }
+    window = ((window << 1) | start_bit) & BLINK_MASKS[next_blink(&rng)];
+    if ((window & full)
+        && (BLINK_COUNT <= WINDOW_BLINKS
+            || matches_from(seed, adv - window_blinks SEARCH_ARG_NAMES))) {
+      emit_seed(cnt, res_g, capacity, seed);
       break;
     }
   }
-}
\ No newline at end of file
+}
+
+// each work item searches WORK_PER_ITEM seeds strided by the global size
+#define SEED_KERNEL(name) \
+__kernel void name(const uint offset, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) { \
+  for (uint item = 0; item < WORK_PER_ITEM; item++) { \
+    name##_seed(get_global_id(0) + item * get_global_size(0) + offset, cnt, res_g, capacity SEARCH_ARG_NAMES); \
+  } \
+}
+
+SEED_KERNEL(find_initial_seeds)
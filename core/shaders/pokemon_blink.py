@@ -4,121 +4,228 @@ import importlib.resources
 import numpy as np
 import pyopencl as cl
 import numba
-from qtpy.QtCore import QThread, Signal
-from numba_pokemon_prngs.mersenne_twister import TinyMersenneTwister
+from .engine import (
+    SearchEngine,
+    DeviceState,
+    ResultSlot,
+    format_range,
+    parse_int,
+    parse_range,
+)
+from .prngs import tinymt_init, tinymt_next_state, tinymt_temper
+from .verifiers import verifier
 from .. import shaders
 
 SHADER_CODE = importlib.resources.read_text(shaders, "pokemon_blink.cl")
+BLINK_VALUES = 240
+# blinks matched by the kernel's sliding window, see pokemon_blink.cl
+WINDOW_BLINKS = 64
 
 
-@numba.njit
-def find_matching_advances(
-    seed, target_blinks, leeway, min_advance, max_advance
-) -> int:
-    """Finds advances from a given seed that generates the target blinks"""
-    mt = TinyMersenneTwister(seed)
-    mt.advance(min_advance)
-    test_rng = TinyMersenneTwister(0)
-    results = []
-    for adv in range(min_advance, max_advance):
-        test_rng.state[:] = mt.state
-        mt.next()
+@numba.njit(nogil=True)
+def match_advances(seed, target_blinks, leeway, min_advance, matches) -> None:
+    """Mark the advances from a seed, starting at min_advance, that generate
+    the target blinks"""
+    s0, s1, s2, s3 = tinymt_init(seed)
+    for _ in range(min_advance):
+        s0, s1, s2, s3 = tinymt_next_state(s0, s1, s2, s3)
+    for adv in range(len(matches)):
+        t0, t1, t2, t3 = s0, s1, s2, s3
+        s0, s1, s2, s3 = tinymt_next_state(s0, s1, s2, s3)
         valid = True
         for blink in target_blinks:
-            if not (blink - leeway <= test_rng.next_rand(240) <= blink + leeway):
+            t0, t1, t2, t3 = tinymt_next_state(t0, t1, t2, t3)
+            rand = (tinymt_temper(t0, t2, t3) * np.uint64(240)) >> np.uint64(32)
+            if not (blink - leeway <= np.int64(rand) <= blink + leeway):
                 valid = False
                 break
-        if valid:
-            results.append(adv)
+        matches[adv] = valid
+
+
+@numba.njit(nogil=True)
+def seed_advances(seeds, matches, min_advance) -> np.ndarray:
+    """(seed, advance) array of every marked match"""
+    seed_indices, advances = np.nonzero(matches)
+    results = np.empty((len(seed_indices), 2), np.int64)
+    for i, seed_index in enumerate(seed_indices):
+        results[i, 0] = seeds[seed_index]
+        results[i, 1] = advances[i] + min_advance
     return results
 
 
-class PokemonBlinkFidgetThread(QThread):
-    """Interface for pokemon_blink shader"""
-
-    finished = Signal()
-    log = Signal(str)
-    results = Signal(object)
-    init_progress_bar = Signal(int)
-    progress = Signal(int)
-
-    def __init__(self, *args) -> None:
-        super().__init__()
-        self.args = args
-
-    def run(self) -> None:
-        """Thread work"""
-        (
-            platform,
-            device,
-            blinks,
-            leeway,
-            advance_range,
-            start,
-            chunks,
-            reidentfication,
-        ) = self.args
-        # TODO: cleaner threading impl a la lgpe-item-rng-tool
-        if reidentfication:
-            self.init_progress_bar.emit(1)
-            self.progress.emit(1)
-            self.results.emit(
-                (
-                    find_matching_advances(
-                        start, blinks, leeway, advance_range.start, advance_range.stop
-                    ),
-                )
-            )
-        else:
-            ctx = cl.Context(
-                dev_type=cl.device_type.ALL,
-                properties=[(cl.context_properties.PLATFORM, platform)],
-            )
-            queue = cl.CommandQueue(ctx, device)
-            program = cl.Program(ctx, SHADER_CODE).build(
-                shaders.build_shader_constants(
-                    blink_count=len(blinks),
-                    blink_data=",".join(map(str, blinks)),
-                    leeway=leeway,
-                    base_advance=advance_range.start,
-                    max_advance=advance_range.stop,
-                )
-            )
+@numba.njit(parallel=True, nogil=True)
+def find_matching_advances_batch(
+    seeds, target_blinks, leeway, min_advance, max_advance
+) -> np.ndarray:
+    """Finds advances from each seed that generate the target blinks,
+    returning a (seed, advance) array of every match"""
+    matches = np.zeros((len(seeds), max(max_advance - min_advance, 0)), np.bool_)
+    for i in numba.prange(len(seeds)):
+        match_advances(seeds[i], target_blinks, leeway, min_advance, matches[i])
+    return seed_advances(seeds, matches, min_advance)
 
-            find_initial_seeds = program.find_initial_seeds
 
-            host_results = np.zeros(150, np.uint32)
-            host_count = np.zeros(1, np.int32)
+@numba.njit(nogil=True)
+def find_matching_advances_batch_serial(
+    seeds, target_blinks, leeway, min_advance, max_advance
+) -> np.ndarray:
+    """find_matching_advances_batch on one thread, ahead-of-time compilation
+    has no parallel support"""
+    matches = np.zeros((len(seeds), max(max_advance - min_advance, 0)), np.bool_)
+    for i in range(len(seeds)):
+        match_advances(seeds[i], target_blinks, leeway, min_advance, matches[i])
+    return seed_advances(seeds, matches, min_advance)
 
-            device_results = cl.Buffer(
-                ctx, cl.mem_flags.READ_WRITE, host_results.nbytes
-            )
-            device_count = cl.Buffer(ctx, cl.mem_flags.READ_WRITE, host_count.nbytes)
-
-            cl.enqueue_copy(queue, device_results, host_results)
-            cl.enqueue_copy(queue, device_count, host_count)
-            self.init_progress_bar.emit(chunks)
-            for chunk in range(chunks):
-                find_initial_seeds(
-                    queue,
-                    (0x1000000,),
-                    None,
-                    np.uint32(start + (chunk << 24)),
-                    device_count,
-                    device_results,
-                ).wait()
-                self.progress.emit(chunk + 1)
-            cl.enqueue_copy(queue, host_results, device_results)
-            cl.enqueue_copy(queue, host_count, device_count)
-            self.results.emit(
-                (
-                    host_results[: host_count[0]],
-                    find_matching_advances(
-                        host_results[0],
-                        blinks,
-                        leeway,
-                        advance_range.start,
-                        advance_range.stop,
-                    )[0],
-                )
+
+@numba.njit(nogil=True)
+def find_matching_advances(
+    seed, target_blinks, leeway, min_advance, max_advance
+) -> np.ndarray:
+    """Finds advances from a given seed that generates the target blinks"""
+    matches = np.zeros(max(max_advance - min_advance, 0), np.bool_)
+    match_advances(seed, target_blinks, leeway, min_advance, matches)
+    return np.flatnonzero(matches) + min_advance
+
+
+def blink_masks(blinks: np.ndarray, leeway: int) -> np.ndarray:
+    """Bitmask of the blinks (up to WINDOW_BLINKS) each of the 240 blink values
+    matches, for the kernel's sliding window matcher"""
+    values = np.arange(BLINK_VALUES)[:, None]
+    window = blinks[:WINDOW_BLINKS][None, :]
+    matches = np.abs(values - window) <= leeway
+    return (
+        matches.astype(np.uint64) << np.arange(window.shape[1], dtype=np.uint64)
+    ).sum(axis=1, dtype=np.uint64)
+
+
+class PokemonBlinkSearch(SearchEngine):
+    """Search for initial seeds that generate target blinks"""
+
+    name = "blink"
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        blinks: list[int],
+        leeway: int,
+        advance_range: range,
+        start: int,
+        chunks: int,
+        reidentfication: bool,
+    ) -> None:
+        super().__init__(devices)
+        self.blinks = np.array(blinks, np.int64)
+        self.leeway = leeway
+        self.advance_range = advance_range
+        self.start = start
+        self.chunk_count = chunks
+        self.reidentfication = reidentfication
+
+    @classmethod
+    def from_spec(cls, devices: list[cl.Device], spec: dict) -> "PokemonBlinkSearch":
+        """Construct the search from a JSON job spec
+
+        search_type is one of "full", "partial" or "reidentification",
+        partial searches start from base_seed and reidentification uses it as
+        the seed to find the advance of
+        """
+        search_type = spec.get("search_type", "full")
+        full_search = search_type == "full"
+        return cls(
+            devices,
+            spec["blinks"],
+            parse_int(spec.get("leeway", 10)),
+            parse_range(spec["advance_range"]),
+            0 if full_search else parse_int(spec.get("base_seed", 0)),
+            parse_int(spec.get("chunks", 0x100 if full_search else 0x4)),
+            search_type == "reidentification",
+        )
+
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        return {
+            "blinks": self.blinks.tolist(),
+            "leeway": self.leeway,
+            "advance_range": format_range(self.advance_range),
+            # partial with an explicit base seed and chunk count covers full
+            "search_type": "reidentification" if self.reidentfication else "partial",
+            "base_seed": self.start,
+            "chunks": self.chunk_count,
+        }
+
+    def chunks(self) -> list[int]:
+        """Chunks of 2^24 seeds from the starting seed"""
+        return list(range(self.chunk_count))
+
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device"""
+        state = self.create_state(device)
+        state.kernel = state.build_kernel(
+            SHADER_CODE, self.build_options(state), "find_initial_seeds"
+        )
+        device_blinks = state.upload(np.array(self.blinks, np.int16))
+        device_blink_masks = state.upload(blink_masks(self.blinks, self.leeway))
+        state.search_args = (
+            device_blinks,
+            device_blink_masks,
+            np.int32(len(self.blinks)),
+            np.int16(self.leeway),
+            np.int32(self.advance_range.start),
+            np.int32(self.advance_range.stop),
+        )
+        state.allocate_slots(self.pipeline_depth, 150)
+        return state
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> ResultSlot:
+        """Queue the kernel and result count readback for one chunk"""
+        slot = state.take_slot()
+        slot.reset(state.queue)
+        slot.enqueue_count(
+            state,
+            self.enqueue_launches(
+                state,
+                np.uint32(self.start + (chunk << 24)),
+                slot.device_count,
+                slot.device_results,
+                np.uint32(slot.capacity),
+                *state.search_args,
+            ),
+        )
+        state.queue.flush()
+        state.transfer_queue.flush()
+        return slot
+
+    def collect_chunk(self, state: DeviceState, pending: ResultSlot) -> list:
+        """Wait for a queued chunk and read back its seeds"""
+        return pending.read(state)
+
+    def verify_chunk(self, candidates: np.ndarray) -> list[tuple[int, int]]:
+        """Find the first matching advance of each candidate seed, dropping
+        seeds the kernel matched past the end of the advance range"""
+        matches = verifier("find_matching_advances_batch")(
+            candidates,
+            self.blinks,
+            self.leeway,
+            self.advance_range.start,
+            self.advance_range.stop,
+        )
+        # matches are ordered by seed then advance
+        _, first = np.unique(matches[:, 0], return_index=True)
+        return [(int(seed), int(advance)) for seed, advance in matches[first]]
+
+    def run(self):
+        """Search work, yielding each (seed, starting advance) as it is found"""
+        if self.reidentfication:
+            yield "init_progress_bar", 1
+            yield "progress", 1
+            advances = verifier("find_matching_advances")(
+                self.start,
+                self.blinks,
+                self.leeway,
+                self.advance_range.start,
+                self.advance_range.stop,
             )
+            for advance in advances[: self.max_results]:
+                yield "results", (self.start, int(advance))
+        else:
+            yield from self.search()
@@ -0,0 +1,111 @@
+"""Numba RNG implementations on flat state, allocation free so state buffers can
+be reused across candidates and run in parallel without the GIL"""
+
+import os
+import numpy as np
+import numba
+
+# parallel verifiers run on the scheduler's verification thread, and the tbb
+# threading layer can hang at exit when first launched from a non-main thread
+if "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+MASK_32 = np.uint64(0xFFFFFFFF)
+
+
+@numba.njit(nogil=True)
+def mt_init(state: np.ndarray, seed: int) -> int:
+    """Seed a 624 word MT19937 state buffer, returning the initial index"""
+    value = np.uint64(seed) & MASK_32
+    state[0] = value
+    for i in range(1, 624):
+        value = (
+            np.uint64(0x6C078965) * (value ^ (value >> np.uint64(30))) + np.uint64(i)
+        ) & MASK_32
+        state[i] = value
+    return 624
+
+
+@numba.njit(nogil=True)
+def mt_shuffle(state: np.ndarray) -> None:
+    """Twist a MT19937 state buffer in place"""
+    for i in range(624):
+        y = (np.uint64(state[i]) & np.uint64(0x80000000)) | (
+            np.uint64(state[(i + 1) % 624]) & np.uint64(0x7FFFFFFF)
+        )
+        value = np.uint64(state[(i + 397) % 624]) ^ (y >> np.uint64(1))
+        if y & np.uint64(1):
+            value ^= np.uint64(0x9908B0DF)
+        state[i] = value
+
+
+@numba.njit(nogil=True)
+def mt_advance(state: np.ndarray, index: int, advances: int) -> int:
+    """Advance a MT19937 state buffer, returning the new index"""
+    index += advances
+    while index >= 624:
+        mt_shuffle(state)
+        index -= 624
+    return index
+
+
+@numba.njit(nogil=True)
+def mt_next(state: np.ndarray, index: int) -> tuple[np.uint64, int]:
+    """Get the next tempered MT19937 output and the new index"""
+    if index == 624:
+        mt_shuffle(state)
+        index = 0
+    y = np.uint64(state[index])
+    y ^= y >> np.uint64(11)
+    y ^= (y << np.uint64(7)) & np.uint64(0x9D2C5680)
+    y ^= (y << np.uint64(15)) & np.uint64(0xEFC60000)
+    y ^= y >> np.uint64(18)
+    return y, index + 1
+
+
+@numba.njit(nogil=True)
+def tinymt_next_state(
+    s0: np.uint64, s1: np.uint64, s2: np.uint64, s3: np.uint64
+) -> tuple[np.uint64, np.uint64, np.uint64, np.uint64]:
+    """Step a TinyMT state"""
+    y = s3
+    x = (s0 & np.uint64(0x7FFFFFFF)) ^ s1 ^ s2
+    x = (x ^ (x << np.uint64(1))) & MASK_32
+    y ^= (y >> np.uint64(1)) ^ x
+    odd = y & np.uint64(1)
+    return (
+        s1,
+        s2 ^ (odd * np.uint64(0x8F7011EE)),
+        (x ^ (y << np.uint64(10)) ^ (odd * np.uint64(0xFC78FF1F))) & MASK_32,
+        y,
+    )
+
+
+@numba.njit(nogil=True)
+def tinymt_temper(s0: np.uint64, s2: np.uint64, s3: np.uint64) -> np.uint64:
+    """Output of a freshly stepped TinyMT state"""
+    t1 = (s0 + (s2 >> np.uint64(8))) & MASK_32
+    t0 = s3 ^ t1
+    if t1 & np.uint64(1):
+        t0 ^= np.uint64(0x3793FDFF)
+    return t0
+
+
+@numba.njit(nogil=True)
+def tinymt_init(seed: int) -> tuple[np.uint64, np.uint64, np.uint64, np.uint64]:
+    """Seed a TinyMT state"""
+    state = np.empty(4, np.uint64)
+    state[0] = np.uint64(seed) & MASK_32
+    state[1] = np.uint64(0x8F7011EE)
+    state[2] = np.uint64(0xFC78FF1F)
+    state[3] = np.uint64(0x3793FDFF)
+    for i in range(1, 8):
+        previous = state[(i - 1) & 3]
+        state[i & 3] ^= (
+            np.uint64(0x6C078965) * (previous ^ (previous >> np.uint64(30)))
+            + np.uint64(i)
+        ) & MASK_32
+    s0, s1, s2, s3 = state[0], state[1], state[2], state[3]
+    for _ in range(8):
+        s0, s1, s2, s3 = tinymt_next_state(s0, s1, s2, s3)
+    return s0, s1, s2, s3
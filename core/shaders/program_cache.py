@@ -0,0 +1,48 @@
+"""Persistent on-disk cache of compiled OpenCL programs"""
+
+import hashlib
+import pyopencl as cl
+
+from ..cache import cache_dir, atomic_write
+
+# shaders are built with search parameters as kernel arguments so that one
+# cached binary serves every query
+RUNTIME_ARGS = ["-D RUNTIME_ARGS"]
+
+
+def program_key(device: cl.Device, source: str, options: list[str]) -> str:
+    """Key identifying a program binary for a device, driver, source and options"""
+    m = hashlib.sha256()
+    for part in (
+        device.platform.name,
+        device.platform.version,
+        device.name,
+        device.version,
+        device.driver_version,
+        source,
+        *options,
+    ):
+        m.update(part.encode())
+        m.update(b"\0")
+    return m.hexdigest()
+
+
+def build_program(
+    ctx: cl.Context, device: cl.Device, source: str, options: list[str] = None
+) -> cl.Program:
+    """Build a program for a device, reusing a cached binary when available"""
+    options = list(options or [])
+    path = cache_dir("programs") / f"{program_key(device, source, options)}.bin"
+    if path.exists():
+        try:
+            return cl.Program(ctx, [device], [path.read_bytes()]).build(
+                options, devices=[device]
+            )
+        except (cl.Error, OSError):
+            # stale or corrupt binary, fall back to a source build
+            pass
+    program = cl.Program(ctx, source).build(options, devices=[device])
+    binary = program.binaries[program.devices.index(device)]
+    if binary:
+        atomic_write(path, binary)
+    return program
@@ -0,0 +1,227 @@
+"""Work-stealing scheduler sharding seed space chunks across OpenCL devices"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from collections.abc import Iterator
+import pyopencl as cl
+
+from .telemetry import ChunkTiming, Telemetry
+
+
+class DeviceWorker:
+    """Chunks queued for one device and its measured throughput"""
+
+    def __init__(self, index: int, device: cl.Device, weight: float) -> None:
+        self.index = index
+        self.device = device
+        self.weight = weight
+        self.chunks = deque()
+        self.completed = 0
+        self.busy_time = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Measured chunks per second, None until a chunk has completed"""
+        if self.completed == 0 or self.busy_time == 0:
+            return None
+        return self.completed / self.busy_time
+
+
+class ChunkScheduler:
+    """Shards chunks across devices, one host thread per device plus a shared
+    host verification stage
+
+    Chunks are initially interleaved between devices in proportion to their
+    weights, preserving the engine's chunk order on every device. A device
+    that runs out of work steals from the back of the queue of the device
+    with the most estimated time remaining, taking a share proportional to
+    the measured throughput of the two devices.
+    """
+
+    def __init__(
+        self,
+        engine,
+        chunks: list[int],
+        weights: list[float] = None,
+    ) -> None:
+        self.engine = engine
+        if weights is None:
+            weights = [1.0] * len(engine.devices)
+        self.workers = [
+            DeviceWorker(index, device, weight)
+            for index, (device, weight) in enumerate(zip(engine.devices, weights))
+        ]
+        self.telemetry = Telemetry([device.name for device in engine.devices])
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.distribute(chunks)
+
+    def distribute(self, chunks: list[int]) -> None:
+        """Interleave chunks between workers by weight (smooth weighted round robin)"""
+        total_weight = sum(worker.weight for worker in self.workers)
+        current = [0.0] * len(self.workers)
+        for chunk in chunks:
+            for i, worker in enumerate(self.workers):
+                current[i] += worker.weight
+            i = max(range(len(self.workers)), key=current.__getitem__)
+            current[i] -= total_weight
+            self.workers[i].chunks.append(chunk)
+
+    def stop(self) -> None:
+        """Stop handing out chunks, in-flight chunks still complete"""
+        self.stopped.set()
+
+    def speed(self, worker: DeviceWorker) -> float:
+        """Estimated chunks per second of a worker
+
+        Workers that have not completed a chunk yet are estimated from their
+        weight relative to the workers that have
+        """
+        if worker.throughput is not None:
+            return worker.throughput
+        measured = [other for other in self.workers if other.throughput is not None]
+        if not measured:
+            return worker.weight
+        return worker.weight * (
+            sum(other.throughput for other in measured)
+            / sum(other.weight for other in measured)
+        )
+
+    def next_chunk(self, worker: DeviceWorker) -> int:
+        """Pop the next chunk for a worker, stealing if its queue is empty"""
+        with self.lock:
+            if not worker.chunks:
+                victims = [other for other in self.workers if other.chunks]
+                if not victims:
+                    return None
+                victim = max(
+                    victims, key=lambda other: len(other.chunks) / self.speed(other)
+                )
+                share = self.speed(worker) / (self.speed(worker) + self.speed(victim))
+                stolen = max(1, int(len(victim.chunks) * share))
+                worker.chunks.extend(
+                    reversed([victim.chunks.pop() for _ in range(stolen)])
+                )
+            return worker.chunks.popleft()
+
+    def work(
+        self,
+        worker: DeviceWorker,
+        results: queue.Queue,
+        verifier: ThreadPoolExecutor,
+    ) -> None:
+        """Device thread work
+
+        Keeps up to engine.pipeline_depth chunks queued on the device, handing
+        each collected chunk to the verification stage before waiting on the next.
+        Each chunk's profiled events are taken when it is queued and collected
+        """
+        # set once each chunk's verification has been passed on, the end of
+        # work must not be signalled before then
+        handed_over: list[threading.Event] = []
+        state = None
+        try:
+            state = self.engine.setup_device(worker.device)
+            start_time = time.perf_counter()
+            in_flight = deque()
+            while not self.stopped.is_set():
+                while (
+                    len(in_flight) < self.engine.pipeline_depth
+                    and not self.engine.is_interruption_requested()
+                ):
+                    chunk = self.next_chunk(worker)
+                    if chunk is None:
+                        break
+                    enqueued = time.perf_counter()
+                    pending = self.engine.enqueue_chunk(state, chunk)
+                    in_flight.append((chunk, pending, enqueued, state.take_events()))
+                if not in_flight:
+                    break
+                chunk, pending, enqueued, events = in_flight.popleft()
+                candidates = self.engine.collect_chunk(state, pending)
+                collected = time.perf_counter()
+                worker.completed += 1
+                worker.busy_time = collected - start_time
+                timing = ChunkTiming(
+                    chunk,
+                    worker.index,
+                    self.engine.launched_seeds(state),
+                    len(candidates),
+                    enqueued,
+                )
+                timing.add_events(events + state.take_events(), collected)
+                handed_over.append(threading.Event())
+                verifier.submit(self.verify, timing, candidates).add_done_callback(
+                    partial(self.verified, results, chunk, timing, handed_over[-1])
+                )
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            self.stop()
+            results.put(error)
+        finally:
+            if state is not None:
+                state.release()
+            # futures wake wait() before running their done callbacks, so
+            # wait on the callbacks themselves
+            for event in handed_over:
+                event.wait()
+            results.put(None)
+
+    def verify(self, timing: ChunkTiming, candidates: list) -> list:
+        """Verify a chunk's candidates, timing the verification"""
+        start = time.perf_counter()
+        verified = self.engine.verify_chunk(candidates)
+        timing.verify_span = (start, time.perf_counter())
+        timing.results = len(verified)
+        return verified
+
+    def verified(
+        self,
+        results: queue.Queue,
+        chunk: int,
+        timing: ChunkTiming,
+        handed_over: threading.Event,
+        verification: Future,
+    ) -> None:
+        """Pass a verified chunk on to the consumer"""
+        try:
+            if verification.exception() is not None:
+                self.stop()
+                results.put(verification.exception())
+            else:
+                self.telemetry.add(timing)
+                results.put((chunk, verification.result(), timing))
+        finally:
+            handed_over.set()
+
+    def run(self) -> Iterator[tuple[int, list, ChunkTiming]]:
+        """Run every chunk, yielding (chunk, results, timing) as chunks are
+        verified"""
+        results = queue.Queue()
+        verifier = ThreadPoolExecutor(max_workers=1)
+        threads = [
+            threading.Thread(
+                target=self.work, args=(worker, results, verifier), daemon=True
+            )
+            for worker in self.workers
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            running = len(threads)
+            while running:
+                item = results.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            verifier.shutdown()
@@ -0,0 +1,135 @@
+"""Process-wide pool of warm OpenCL device sessions
+
+Creating a context, queues and programs and allocating pinned memory costs
+more than a short search itself on some drivers. Sessions keep all of it alive
+between searches, each search leases a session for its device and returns it
+once done, so back to back searches only pay the setup cost once
+"""
+
+import threading
+from collections import defaultdict
+import numpy as np
+import pyopencl as cl
+
+from .program_cache import build_program
+
+# smallest buffer allocated, smaller requests share this size class
+MIN_BUFFER_SIZE = 256
+
+
+def size_class(size: int) -> int:
+    """Pooled allocation size for a request, the next power of two"""
+    return max(MIN_BUFFER_SIZE, 1 << (max(size, 1) - 1).bit_length())
+
+
+def device_key(device: cl.Device) -> tuple[int, int]:
+    """Key of a device that is the same for every Device object wrapping it"""
+    return (device.platform.int_ptr, device.int_ptr)
+
+
+class DeviceSession:
+    """Context, queues, built kernels and pooled buffers of one device
+
+    A session is used by one search at a time, so its kernels and buffers are
+    never shared between threads
+    """
+
+    def __init__(self, device: cl.Device) -> None:
+        self.device = device
+        self.ctx = cl.Context([device])
+        # profiled so searches can report where each chunk's time went
+        properties = cl.command_queue_properties.PROFILING_ENABLE
+        self.queue = cl.CommandQueue(self.ctx, device, properties)
+        self.transfer_queue = cl.CommandQueue(self.ctx, device, properties)
+        self.kernels: dict[tuple, cl.Kernel] = {}
+        # free buffers by (flags, size class)
+        self.buffers: dict[tuple[int, int], list[cl.Buffer]] = defaultdict(list)
+        # free pinned buffers with their mapped host arrays by size class
+        self.pinned: dict[int, list[tuple[cl.Buffer, np.ndarray]]] = defaultdict(
+            list
+        )
+        self.leased_buffers: list[tuple[tuple[int, int], cl.Buffer]] = []
+        self.leased_pinned: list[tuple[int, tuple[cl.Buffer, np.ndarray]]] = []
+
+    def kernel(self, source: str, options: list[str], name: str) -> cl.Kernel:
+        """A kernel of a program, building the program on first use"""
+        key = (source, tuple(options), name)
+        if key not in self.kernels:
+            program = build_program(self.ctx, self.device, source, options)
+            self.kernels[key] = getattr(program, name)
+        return self.kernels[key]
+
+    def buffer(self, size: int, flags: int = cl.mem_flags.READ_WRITE) -> cl.Buffer:
+        """Lease a device buffer of at least size bytes"""
+        key = (int(flags), size_class(size))
+        free = self.buffers[key]
+        buffer = free.pop() if free else cl.Buffer(self.ctx, flags, key[1])
+        self.leased_buffers.append((key, buffer))
+        return buffer
+
+    def pinned_array(self, shape, dtype) -> np.ndarray:
+        """Lease a host array backed by pinned (ALLOC_HOST_PTR) memory"""
+        size = np.dtype(dtype).itemsize * int(np.prod(shape))
+        key = size_class(size)
+        free = self.pinned[key]
+        if free:
+            pinned = free.pop()
+        else:
+            buffer = cl.Buffer(
+                self.ctx,
+                cl.mem_flags.READ_WRITE | cl.mem_flags.ALLOC_HOST_PTR,
+                key,
+            )
+            array, _ = cl.enqueue_map_buffer(
+                self.transfer_queue,
+                buffer,
+                cl.map_flags.READ | cl.map_flags.WRITE,
+                0,
+                (key,),
+                np.uint8,
+            )
+            pinned = (buffer, array)
+        self.leased_pinned.append((key, pinned))
+        return pinned[1][:size].view(dtype).reshape(shape)
+
+    def release_buffers(self) -> None:
+        """Return every leased buffer to the pool once queued work is done"""
+        self.queue.finish()
+        self.transfer_queue.finish()
+        for key, buffer in self.leased_buffers:
+            self.buffers[key].append(buffer)
+        for key, pinned in self.leased_pinned:
+            self.pinned[key].append(pinned)
+        self.leased_buffers.clear()
+        self.leased_pinned.clear()
+
+
+class SessionPool:
+    """Idle sessions by device, a new session is created when all of a
+    device's sessions are leased"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.idle: dict[tuple[int, int], list[DeviceSession]] = defaultdict(list)
+
+    def acquire(self, device: cl.Device) -> DeviceSession:
+        """Lease a session for a device"""
+        with self.lock:
+            idle = self.idle[device_key(device)]
+            if idle:
+                return idle.pop()
+        return DeviceSession(device)
+
+    def release(self, session: DeviceSession) -> None:
+        """Return a leased session and its buffers to the pool"""
+        session.release_buffers()
+        with self.lock:
+            self.idle[device_key(session.device)].append(session)
+
+    def clear(self) -> None:
+        """Drop every idle session"""
+        with self.lock:
+            self.idle.clear()
+
+
+sessions = SessionPool()
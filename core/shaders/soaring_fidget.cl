@@ -1,9 +1,29 @@
+#ifndef WORK_PER_ITEM
+#define WORK_PER_ITEM 1
+#endif
+
+// fidget pattern advances matched by the sliding window, longer patterns are
+// checked by re-simulating the few starts that match these
+#define WINDOW_ADVANCES 64
+
+#ifdef RUNTIME_ARGS
+#define SEARCH_ARGS , __constant unsigned char *JUMPS, const int JUMP_COUNT, const ulong PATTERN, const int PATTERN_LENGTH, const int BASE_ADVANCE, const int MAX_ADVANCE
+#define SEARCH_ARG_NAMES , JUMPS, JUMP_COUNT, PATTERN, PATTERN_LENGTH, BASE_ADVANCE, MAX_ADVANCE
+#else
+#define SEARCH_ARGS
+#define SEARCH_ARG_NAMES
 #ifndef JUMP_COUNT
 #define JUMP_COUNT 0
 #endif
 #ifndef JUMP_DATA
 #define JUMP_DATA
 #endif
+#ifndef PATTERN
+#define PATTERN 0
+#endif
+#ifndef PATTERN_LENGTH
+#define PATTERN_LENGTH 0
+#endif
 #ifndef BASE_ADVANCE
 #define BASE_ADVANCE 0
 #endif
@@ -11,6 +31,7 @@
 #define MAX_ADVANCE 0
 #endif
 __constant unsigned char JUMPS[JUMP_COUNT] = { JUMP_DATA };
+#endif
 
 struct tinymt {
   uint state[4];
@@ -54,37 +75,81 @@ inline void init(struct tinymt *rng, unsigned int seed) {
   }
 }
 
-__kernel void find_initial_seeds(const uint offset, __global uint *cnt, __global uint *res_g) {
-  unsigned int seed = get_global_id(0) | ((get_global_id(1) + offset) << 16);
+// check every jump from a start advance by re-simulating it
+inline bool matches_from(uint seed, int start SEARCH_ARGS) {
+  struct tinymt rng;
+  init(&rng, seed);
+  for (int i = 0; i < start; i++) {
+    advance(&rng);
+  }
+  for (int i = 0; i < JUMP_COUNT; i++) {
+    for (unsigned char j = 0; j < JUMPS[i]; j++) {
+      if ((next_uint(&rng) % 3) == 0) {
+        return false;
+      }
+    }
+    if ((next_uint(&rng) % 3) != 0) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// writes past capacity are dropped, the host sees the count overflow
+inline void emit_seed(__global uint *cnt, __global uint *res_g, uint capacity, uint seed) {
+  uint i = atomic_inc(&cnt[0]);
+  if (i < capacity) {
+    res_g[i] = seed;
+  }
+}
+
+// shift-and matcher over the fidget predicate next_uint % 3 == 0, which is
+// computed once per advance. Each jump is JUMPS[i] advances without a fidget
+// then one with, PATTERN has bit i set where advance i of the pattern fidgets.
+// Bit i of window is set while the last i + 1 advances match the first i + 1
+// of the pattern, so every start advance is tested at once
+inline void find_initial_seeds_seed(uint seed, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) {
   struct tinymt rng;
   init(&rng, seed);
   for (int i = 0; i < BASE_ADVANCE; i++) {
     advance(&rng);
   }
 
-  for (int start = BASE_ADVANCE; start <= MAX_ADVANCE; start++) {
-    bool valid = true;
-    struct tinymt test_rng;
-    test_rng.state[0] = rng.state[0];
-    test_rng.state[1] = rng.state[1];
-    test_rng.state[2] = rng.state[2];
-    test_rng.state[3] = rng.state[3];
-    next_uint(&rng);
-    for (int i = 0; i < JUMP_COUNT; i++) {
-      for (unsigned char j = 0; j < JUMPS[i]; j++) {
-        if ((next_uint(&test_rng) % 3) == 0) {
-          valid = false;
-          break;
-        }
-      }
-      valid &= (next_uint(&test_rng) % 3) == 0;
-      if (!valid) {
-        break;
-      }
+  const int window_advances = min(PATTERN_LENGTH, WINDOW_ADVANCES);
+  if (window_advances == 0) {
+    if (BASE_ADVANCE <= MAX_ADVANCE) {
+      emit_seed(cnt, res_g, capacity, seed);
     }
-    if (valid) {
-      res_g[atomic_inc(&cnt[0])] = seed;
+    return;
+  }
+  const ulong full = 1ul << (window_advances - 1);
+  const ulong fidget_mask = PATTERN;
+  const ulong no_fidget_mask = ~PATTERN & (full | (full - 1));
+  ulong window = 0;
+  const int last = MAX_ADVANCE + window_advances;
+  for (int adv = BASE_ADVANCE + 1; adv <= last; adv++) {
+    // no new starts begin past MAX_ADVANCE, stop once every window has failed
+    const ulong start_bit = adv <= MAX_ADVANCE + 1;
+    if (!start_bit && !window) {
+      break;
+    }
+    window = ((window << 1) | start_bit)
+           & ((next_uint(&rng) % 3) == 0 ? fidget_mask : no_fidget_mask);
+    if ((window & full)
+        && (PATTERN_LENGTH <= WINDOW_ADVANCES
+            || matches_from(seed, adv - window_advances SEARCH_ARG_NAMES))) {
+      emit_seed(cnt, res_g, capacity, seed);
       break;
     }
   }
-}
\ No newline at end of file
+}
+
+// each work item searches WORK_PER_ITEM seeds strided by the global size
+#define SEED_KERNEL(name) \
+__kernel void name(const uint offset, __global uint *cnt, __global uint *res_g, const uint capacity SEARCH_ARGS) { \
+  for (uint item = 0; item < WORK_PER_ITEM; item++) { \
+    name##_seed(get_global_id(0) + item * get_global_size(0) + offset, cnt, res_g, capacity SEARCH_ARG_NAMES); \
+  } \
+}
+
+SEED_KERNEL(find_initial_seeds)
@@ -3,64 +3,92 @@
 import importlib.resources
 import numpy as np
 import pyopencl as cl
-from qtpy.QtCore import QThread, Signal
+from .engine import SearchEngine, DeviceState, ResultSlot, format_range, parse_range
 from .. import shaders
 
 SHADER_CODE = importlib.resources.read_text(shaders, "soaring_fidget.cl")
+# pattern advances matched by the kernel's sliding window, see soaring_fidget.cl
+WINDOW_ADVANCES = 64
 
 
-class SearchSoaringFidgetThread(QThread):
-    """Interface for soaring_fidget shader"""
+def fidget_pattern(gaps: list[int]) -> tuple[int, int]:
+    """Bitmask of the advances that fidget in the first WINDOW_ADVANCES of the
+    gap pattern, and the pattern's full length in advances"""
+    pattern = 0
+    length = 0
+    for gap in gaps:
+        length += gap + 1
+        if length <= WINDOW_ADVANCES:
+            pattern |= 1 << (length - 1)
+    return pattern, length
 
-    finished = Signal()
-    log = Signal(str)
-    results = Signal(object)
-    init_progress_bar = Signal(int)
-    progress = Signal(int)
 
-    def __init__(self, *args) -> None:
-        super().__init__()
-        self.args = args
+class SoaringFidgetSearch(SearchEngine):
+    """Search for initial seeds that generate target soaring fidgets"""
 
-    def run(self) -> None:
-        """Thread work"""
-        (platform, device, gaps, advance_range) = self.args
-        ctx = cl.Context(
-            dev_type=cl.device_type.ALL,
-            properties=[(cl.context_properties.PLATFORM, platform)],
-        )
-        queue = cl.CommandQueue(ctx, device)
-        program = cl.Program(ctx, SHADER_CODE).build(
-            shaders.build_shader_constants(
-                jump_count=len(gaps),
-                jump_data=",".join(map(str, gaps)),
-                base_advance=advance_range.start,
-                max_advance=advance_range.stop,
-            )
-        )
+    name = "fidget"
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        gaps: list[int],
+        advance_range: range,
+    ) -> None:
+        super().__init__(devices)
+        self.gaps = gaps
+        self.advance_range = advance_range
+
+    @classmethod
+    def from_spec(cls, devices: list[cl.Device], spec: dict) -> "SoaringFidgetSearch":
+        """Construct the search from a JSON job spec"""
+        return cls(devices, spec["gaps"], parse_range(spec["advance_range"]))
 
-        find_initial_seeds = program.find_initial_seeds
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        return {"gaps": self.gaps, "advance_range": format_range(self.advance_range)}
 
-        host_results = np.zeros(150, np.uint32)
-        host_count = np.zeros(1, np.int32)
+    def chunks(self) -> list[int]:
+        """Chunks of 2^24 seeds, offset in the upper 8 bits of the seed"""
+        return list(range(0x100))
 
-        device_results = cl.Buffer(ctx, cl.mem_flags.READ_WRITE, host_results.nbytes)
-        device_count = cl.Buffer(ctx, cl.mem_flags.READ_WRITE, host_count.nbytes)
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device"""
+        state = self.create_state(device)
+        state.kernel = state.build_kernel(
+            SHADER_CODE, self.build_options(state), "find_initial_seeds"
+        )
+        device_jumps = state.upload(np.array(self.gaps, np.uint8))
+        pattern, pattern_length = fidget_pattern(self.gaps)
+        state.search_args = (
+            device_jumps,
+            np.int32(len(self.gaps)),
+            np.uint64(pattern),
+            np.int32(pattern_length),
+            np.int32(self.advance_range.start),
+            np.int32(self.advance_range.stop),
+        )
+        state.allocate_slots(self.pipeline_depth, 150)
+        return state
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> ResultSlot:
+        """Queue the kernel and result count readback for one chunk"""
+        slot = state.take_slot()
+        slot.reset(state.queue)
+        slot.enqueue_count(
+            state,
+            self.enqueue_launches(
+                state,
+                np.uint32(chunk << 24),
+                slot.device_count,
+                slot.device_results,
+                np.uint32(slot.capacity),
+                *state.search_args,
+            ),
+        )
+        state.queue.flush()
+        state.transfer_queue.flush()
+        return slot
 
-        cl.enqueue_copy(queue, device_results, host_results)
-        cl.enqueue_copy(queue, device_count, host_count)
-        # TODO: custom step count/chunk size
-        self.init_progress_bar.emit(0x100)
-        for offset in range(0x100):
-            find_initial_seeds(
-                queue,
-                (0x10000, 0x100),
-                None,
-                np.uint32(offset << 8),
-                device_count,
-                device_results,
-            ).wait()
-            self.progress.emit(offset + 1)
-        cl.enqueue_copy(queue, host_results, device_results)
-        cl.enqueue_copy(queue, host_count, device_count)
-        self.results.emit(host_results[: host_count[0]])
+    def collect_chunk(self, state: DeviceState, pending: ResultSlot) -> list:
+        """Wait for a queued chunk and read back its seeds"""
+        return [int(seed) for seed in pending.read(state)]
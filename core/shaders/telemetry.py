@@ -0,0 +1,196 @@
+"""Per-chunk timings of a search for the log, progress bar and a Chrome trace"""
+
+import json
+import threading
+import time
+from pathlib import Path
+import pyopencl as cl
+
+from ..cache import atomic_write
+
+
+class ChunkTiming:
+    """Where one chunk's time went, spans are (start, end) in seconds on the
+    host's perf_counter clock"""
+
+    def __init__(
+        self, chunk: int, device: int, seeds: int, candidates: int, enqueued: float
+    ) -> None:
+        self.chunk = chunk
+        self.device = device
+        self.seeds = seeds
+        self.candidates = candidates
+        self.results = 0
+        self.enqueued = enqueued
+        self.kernel_spans: list[tuple[float, float]] = []
+        self.transfer_spans: list[tuple[float, float]] = []
+        self.verify_span: tuple[float, float] = None
+
+    def add_events(self, events: list[tuple[str, cl.Event]], collected: float) -> None:
+        """Record the spans of a collected chunk's profiled events
+
+        Device timestamps are shifted so the last event ends when the chunk
+        was collected, the device and host clocks are otherwise unrelated
+        """
+        spans = []
+        for kind, event in events:
+            try:
+                spans.append((kind, event.profile.start, event.profile.end))
+            except cl.Error:
+                # queue without profiling enabled
+                continue
+        if not spans:
+            return
+        offset = collected - max(end for _, _, end in spans) * 1e-9
+        for kind, start, end in spans:
+            (self.kernel_spans if kind == "kernel" else self.transfer_spans).append(
+                (start * 1e-9 + offset, end * 1e-9 + offset)
+            )
+
+    @property
+    def kernel_time(self) -> float:
+        """Seconds the chunk's kernels ran"""
+        return sum(end - start for start, end in self.kernel_spans)
+
+    @property
+    def transfer_time(self) -> float:
+        """Seconds spent reading back the chunk's results"""
+        return sum(end - start for start, end in self.transfer_spans)
+
+    @property
+    def verify_time(self) -> float:
+        """Seconds spent verifying the chunk's candidates on the host"""
+        if self.verify_span is None:
+            return 0.0
+        return self.verify_span[1] - self.verify_span[0]
+
+    @property
+    def seeds_per_second(self) -> float:
+        """Kernel throughput of the chunk, None without kernel timings"""
+        if not self.kernel_time:
+            return None
+        return self.seeds / self.kernel_time
+
+    def describe(self) -> str:
+        """One line summary for the search log"""
+        rate = self.seeds_per_second
+        return (
+            f"Chunk {self.chunk:#x} on device {self.device}: "
+            f"kernel {self.kernel_time * 1000:.1f}ms, "
+            f"transfer {self.transfer_time * 1000:.1f}ms, "
+            f"verify {self.verify_time * 1000:.1f}ms, "
+            f"{self.candidates} candidates, {self.results} results"
+            + ("" if rate is None else f", {format_rate(rate)}")
+        )
+
+
+def format_rate(seeds_per_second: float) -> str:
+    """Human readable seeds per second"""
+    for scale, suffix in ((1e9, "G"), (1e6, "M"), (1e3, "K")):
+        if seeds_per_second >= scale:
+            return f"{seeds_per_second / scale:.1f}{suffix} seeds/s"
+    return f"{seeds_per_second:.0f} seeds/s"
+
+
+class Telemetry:
+    """Timings of every chunk of a search, shared by the device threads"""
+
+    def __init__(self, device_names: list[str]) -> None:
+        self.device_names = device_names
+        self.lock = threading.Lock()
+        self.timings: list[ChunkTiming] = []
+
+    def add(self, timing: ChunkTiming) -> None:
+        """Record a verified chunk"""
+        with self.lock:
+            self.timings.append(timing)
+
+    def seeds_per_second(self) -> float:
+        """Measured throughput of the whole search since its first chunk was
+        queued, None until a chunk has completed"""
+        with self.lock:
+            if not self.timings:
+                return None
+            start = min(timing.enqueued for timing in self.timings)
+            seeds = sum(timing.seeds for timing in self.timings)
+        elapsed = time.perf_counter() - start
+        return seeds / elapsed if elapsed > 0 else None
+
+    def throughput(self, remaining_seeds: int) -> dict:
+        """Measured seeds per second and the seconds left at that rate"""
+        rate = self.seeds_per_second()
+        return {
+            "seeds_per_second": rate,
+            "eta": None if not rate else remaining_seeds / rate,
+        }
+
+    def summary(self) -> str:
+        """One line summary of the whole search for the log"""
+        with self.lock:
+            timings = list(self.timings)
+        rate = self.seeds_per_second()
+        return (
+            f"Searched {sum(timing.seeds for timing in timings)} seeds in "
+            f"{len(timings)} chunks: "
+            f"kernel {sum(timing.kernel_time for timing in timings):.2f}s, "
+            f"transfer {sum(timing.transfer_time for timing in timings):.2f}s, "
+            f"verify {sum(timing.verify_time for timing in timings):.2f}s, "
+            f"{sum(timing.candidates for timing in timings)} candidates"
+            + ("" if rate is None else f", {format_rate(rate)}")
+        )
+
+    def trace(self) -> dict:
+        """Chrome trace (chrome://tracing, Perfetto) of every chunk, one row
+        per device plus one for host verification"""
+        with self.lock:
+            timings = list(self.timings)
+        if not timings:
+            return {"traceEvents": []}
+        origin = min(timing.enqueued for timing in timings)
+        verify_row = len(self.device_names)
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 0,
+                "tid": row,
+                "args": {"name": name},
+            }
+            for row, name in enumerate(
+                [
+                    f"Device {index}: {name}"
+                    for index, name in enumerate(self.device_names)
+                ]
+                + ["Host verification"]
+            )
+        ]
+
+        def span(name: str, row: int, start: float, end: float, args: dict) -> dict:
+            return {
+                "name": name,
+                "ph": "X",
+                "pid": 0,
+                "tid": row,
+                "ts": (start - origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "args": args,
+            }
+
+        for timing in timings:
+            args = {
+                "chunk": timing.chunk,
+                "seeds": timing.seeds,
+                "candidates": timing.candidates,
+                "results": timing.results,
+            }
+            for start, end in timing.kernel_spans:
+                events.append(span("kernel", timing.device, start, end, args))
+            for start, end in timing.transfer_spans:
+                events.append(span("transfer", timing.device, start, end, args))
+            if timing.verify_span is not None:
+                events.append(span("verify", verify_row, *timing.verify_span, args))
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path) -> None:
+        """Write the Chrome trace to a file"""
+        atomic_write(Path(path), json.dumps(self.trace()).encode())
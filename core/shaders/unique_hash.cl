@@ -1,4 +1,4 @@
-// sha256_12 taken from https://github.com/zoogie/bfCL/blob/master/cl/sha256_16.cl
+// specialized from sha256_12 taken from https://github.com/zoogie/bfCL/blob/master/cl/sha256_16.cl
 // which was modified from https://github.com/ARMmbed/mbedtls/blob/development/library/sha256.c
 
 typedef unsigned int uint32_t;
@@ -8,26 +8,6 @@ typedef unsigned short u16;
 typedef unsigned int u32;
 typedef unsigned long u64;
 
-#ifndef GET_UINT32_BE
-#define GET_UINT32_BE(n,b,i)                            \
-{                                                       \
-    (n) = ( (uint32_t) (b)[(i)    ] << 24 )             \
-        | ( (uint32_t) (b)[(i) + 1] << 16 )             \
-        | ( (uint32_t) (b)[(i) + 2] <<  8 )             \
-        | ( (uint32_t) (b)[(i) + 3]       );            \
-}
-#endif
-
-#ifndef PUT_UINT32_BE
-#define PUT_UINT32_BE(n,b,i)                            \
-{                                                       \
-    (b)[(i)    ] = (unsigned char) ( (n) >> 24 );       \
-    (b)[(i) + 1] = (unsigned char) ( (n) >> 16 );       \
-    (b)[(i) + 2] = (unsigned char) ( (n) >>  8 );       \
-    (b)[(i) + 3] = (unsigned char) ( (n)       );       \
-}
-#endif
-
 __constant const uint32_t K[] =
 {
     0x428A2F98, 0x71374491, 0xB5C0FBCF, 0xE9B5DBA5,
@@ -60,12 +40,6 @@ __constant const uint32_t K[] =
 #define F0(x,y,z) ((x & y) | (z & (x | y)))
 #define F1(x,y,z) (z ^ (x & (y ^ z)))
 
-#define R(t)                                    \
-(                                               \
-    W[t] = S1(W[t -  2]) + W[t -  7] +          \
-           S0(W[t - 15]) + W[t - 16]            \
-)
-
 #define P(a,b,c,d,e,f,g,h,x,K)                  \
 {                                               \
     temp1 = h + S3(e) + F1(e,f,g) + K + x;      \
@@ -73,67 +47,125 @@ __constant const uint32_t K[] =
     d += temp1; h = temp1 + temp2;              \
 }
 
-void sha256_12(unsigned char *io)
+// only the 12 byte message (lfcs, ds_type | rand << 16, 0) is ever hashed, so
+// W[2..15] are constants the compiler folds into the schedule
+#define W_CONST(t) ((t) == 3 ? 0x80000000u : (t) == 15 ? 0x60u : 0)
+
+// final H7 is e after round 60 and H6 is e after round 61, rounds 58-61 only
+// need the e chain and rounds 62 and 63 are never run
+#define LAST_FULL_ROUND 57
+#define H7_ROUND 60
+#define H6_ROUND 61
+
+inline u32 bswap32(u32 x)
+{
+    return (x >> 24) | ((x >> 8) & 0xFF00) | ((x << 8) & 0xFF0000) | (x << 24);
+}
+
+// state after round 0, which only depends on W[0] and so on the lfcs
+inline void sha256_unique_round0(const u32 w0, u32 *A)
 {
-    uint32_t temp1, temp2, W[64];
-    uint32_t A[8] = {
-        0x6A09E667,
-        0xBB67AE85,
-        0x3C6EF372,
-        0xA54FF53A,
-        0x510E527F,
-        0x9B05688C,
-        0x1F83D9AB,
-        0x5BE0CD19
-    };
-    unsigned int i;
-
-    GET_UINT32_BE(W[0], io, 0);
-    GET_UINT32_BE(W[1], io, 4);
-    GET_UINT32_BE(W[2], io, 8);
-
-    W[3] = 0x80000000u;
-    W[4] = 0;
-
-    W[5] = 0; W[6] = 0; W[7] = 0;
-    W[8] = 0; W[9] = 0; W[10] = 0; W[11] = 0;
-    W[12] = 0; W[13] = 0; W[14] = 0;
-
-    W[15] = 0x60u;
-
-#pragma unroll 16
-    for (i = 0; i < 16; i += 8)
-    {
-        P(A[0], A[1], A[2], A[3], A[4], A[5], A[6], A[7], W[i + 0], K[i + 0]);
-        P(A[7], A[0], A[1], A[2], A[3], A[4], A[5], A[6], W[i + 1], K[i + 1]);
-        P(A[6], A[7], A[0], A[1], A[2], A[3], A[4], A[5], W[i + 2], K[i + 2]);
-        P(A[5], A[6], A[7], A[0], A[1], A[2], A[3], A[4], W[i + 3], K[i + 3]);
-        P(A[4], A[5], A[6], A[7], A[0], A[1], A[2], A[3], W[i + 4], K[i + 4]);
-        P(A[3], A[4], A[5], A[6], A[7], A[0], A[1], A[2], W[i + 5], K[i + 5]);
-        P(A[2], A[3], A[4], A[5], A[6], A[7], A[0], A[1], W[i + 6], K[i + 6]);
-        P(A[1], A[2], A[3], A[4], A[5], A[6], A[7], A[0], W[i + 7], K[i + 7]);
+    uint32_t temp1, temp2;
+    A[0] = 0x6A09E667; A[1] = 0xBB67AE85; A[2] = 0x3C6EF372; A[3] = 0xA54FF53A;
+    A[4] = 0x510E527F; A[5] = 0x9B05688C; A[6] = 0x1F83D9AB; A[7] = 0x5BE0CD19;
+    P(A[0], A[1], A[2], A[3], A[4], A[5], A[6], A[7], w0, K[0]);
+}
+
+// rounds 1 to H7_ROUND continuing from the round 0 state of an lfcs, leaving
+// the working variables in s and the message schedule in W for
+// sha256_unique_h6, returns the final H7
+inline u32 sha256_unique_h7(const u32 *round0, const u32 w0, const u32 w1,
+                            u32 *s, u32 *W)
+{
+    uint32_t temp1, temp2;
+    uint32_t a = round0[7], b = round0[0], c = round0[1], d = round0[2];
+    uint32_t e = round0[3], f = round0[4], g = round0[5], h = round0[6];
+
+    W[0] = w0;
+    W[1] = w1;
+#pragma unroll
+    for (int t = 2; t < 16; t++) {
+        W[t] = W_CONST(t);
     }
 
-#pragma unroll 48
-    for (i = 16; i < 64; i += 8)
-    {
-        P(A[0], A[1], A[2], A[3], A[4], A[5], A[6], A[7], R(i + 0), K[i + 0]);
-        P(A[7], A[0], A[1], A[2], A[3], A[4], A[5], A[6], R(i + 1), K[i + 1]);
-        P(A[6], A[7], A[0], A[1], A[2], A[3], A[4], A[5], R(i + 2), K[i + 2]);
-        P(A[5], A[6], A[7], A[0], A[1], A[2], A[3], A[4], R(i + 3), K[i + 3]);
-        P(A[4], A[5], A[6], A[7], A[0], A[1], A[2], A[3], R(i + 4), K[i + 4]);
-        P(A[3], A[4], A[5], A[6], A[7], A[0], A[1], A[2], R(i + 5), K[i + 5]);
-        P(A[2], A[3], A[4], A[5], A[6], A[7], A[0], A[1], R(i + 6), K[i + 6]);
-        P(A[1], A[2], A[3], A[4], A[5], A[6], A[7], A[0], R(i + 7), K[i + 7]);
+#pragma unroll
+    for (int t = 1; t <= H7_ROUND; t++) {
+        if (t >= 16) {
+            W[t & 15] = S1(W[(t - 2) & 15]) + W[(t - 7) & 15]
+                      + S0(W[(t - 15) & 15]) + W[t & 15];
+        }
+        temp1 = h + S3(e) + F1(e, f, g) + K[t] + W[t & 15];
+        temp2 = t <= LAST_FULL_ROUND ? S2(a) + F0(a, b, c) : 0;
+        h = g; g = f; f = e; e = d + temp1;
+        d = c; c = b; b = a;
+        // a is left stale past the last full round, only d still reads it
+        if (t <= LAST_FULL_ROUND) {
+            a = temp1 + temp2;
+        }
     }
+    s[0] = a; s[1] = b; s[2] = c; s[3] = d;
+    s[4] = e; s[5] = f; s[6] = g; s[7] = h;
+    return e + 0x5BE0CD19;
+}
+
+// round H6_ROUND after sha256_unique_h7, returns the final H6
+inline u32 sha256_unique_h6(const u32 *s, u32 *W)
+{
+    const int t = H6_ROUND;
+    W[t & 15] = S1(W[(t - 2) & 15]) + W[(t - 7) & 15]
+              + S0(W[(t - 15) & 15]) + W[t & 15];
+    const u32 temp1 = s[7] + S3(s[4]) + F1(s[4], s[5], s[6]) + K[t] + W[t & 15];
+    return s[3] + temp1 + 0x1F83D9AB;
+}
 
-    A[6] += 0x1F83D9AB;
-    A[7] += 0x5BE0CD19;
+// check the last two words of the hash against the targets, continuing from
+// the round 0 state of its lfcs. H7 is final a round before H6 so it is
+// compared first
+inline bool sha256_unique_matches(const u32 *round0, const u32 w0, const u32 w1,
+                                  const u32 h6_target, const u32 h7_target)
+{
+    uint32_t s[8], W[16];
+    return sha256_unique_h7(round0, w0, w1, s, W) == h7_target
+        && sha256_unique_h6(s, W) == h6_target;
+}
 
-    PUT_UINT32_BE(A[6], io, 0);
-    PUT_UINT32_BE(A[7], io, 4);
+// index of the target a hash belongs to, -1 if none. Targets are kept in an
+// open addressed table of (h7, h6, ds_type, target + 1) entries indexed by the
+// low bits of h7, so most hashes are rejected on H7 alone like a single search
+inline int sha256_unique_lookup(const u32 *round0, const u32 w0, const u32 w1,
+                                const u32 ds_type, __global const uint4 *table,
+                                const u32 table_mask)
+{
+    uint32_t s[8], W[16];
+    const u32 h7 = sha256_unique_h7(round0, w0, w1, s, W);
+    u32 slot = h7 & table_mask;
+    uint4 entry = table[slot];
+    while (entry.w && entry.x != h7) {
+        slot = (slot + 1) & table_mask;
+        entry = table[slot];
+    }
+    if (!entry.w) {
+        return -1;
+    }
+    const u32 h6 = sha256_unique_h6(s, W);
+    for (; entry.w; slot = (slot + 1) & table_mask, entry = table[slot]) {
+        if (entry.x == h7 && entry.y == h6 && entry.z == ds_type) {
+            return entry.w - 1;
+        }
+    }
+    return -1;
 }
 
+#ifndef WORK_PER_ITEM
+#define WORK_PER_ITEM 1
+#endif
+
+#ifdef RUNTIME_ARGS
+#define SEARCH_ARGS , const u32 DS_TYPE, const u32 TARGET_LOW, const u32 TARGET_HIGH
+#define SEARCH_ARG_NAMES , DS_TYPE, TARGET_LOW, TARGET_HIGH
+#else
+#define SEARCH_ARGS
+#define SEARCH_ARG_NAMES
 #ifndef DS_TYPE
 #define DS_TYPE 0
 #endif
@@ -143,22 +175,79 @@ void sha256_12(unsigned char *io)
 #ifndef TARGET_HIGH
 #define TARGET_HIGH 0
 #endif
+#endif
 
-__kernel void find_unique(const u32 start, __global u32 *out)
+// a hit is stored as ((lfcs + 1) << 16) | rand so the result word is only
+// zero while nothing has been found
+//
+// each work item hashes WORK_PER_ITEM consecutive rand values of one lfcs,
+// sharing its round 0 state. Queued launches return immediately once any hit
+// has been stored
+__kernel void find_unique(const u32 start, __global ulong *out SEARCH_ARGS)
 {
     if (*out) {
         return;
     }
-    u32 gid = get_global_id(0);
-
-    u32 io[3];
-    io[0] = start + (gid >> 16);
-    io[1] = ((u32)DS_TYPE) | (gid << 16);
-    io[2] = 0;
-
-    sha256_12((u8*)io);
+    const u32 offset = get_global_offset(0);
+    const u32 first = offset + (get_global_id(0) - offset) * WORK_PER_ITEM;
+    const u32 lfcs = start + (first >> 16);
+    const u32 w0 = bswap32(lfcs);
+    // the hash words are read back little endian
+    const u32 h6_target = bswap32(TARGET_LOW);
+    const u32 h7_target = bswap32(TARGET_HIGH);
+    u32 round0[8];
+    sha256_unique_round0(w0, round0);
+
+    for (u32 item = 0; item < WORK_PER_ITEM; item++) {
+        const u32 rand = (first + item) & 0xFFFF;
+        if (sha256_unique_matches(round0, w0, bswap32(((u32)DS_TYPE) | (rand << 16)),
+                                  h6_target, h7_target)) {
+            *out = ((ulong)(lfcs + 1) << 16) | rand;
+        }
+    }
+}
 
-    if (io[0] == TARGET_LOW && io[1] == TARGET_HIGH){
-        *out = gid;
+// new 3DS lfcs values end here, old 3DS ones run to 0x0B000000
+#define NEW_3DS_DS_TYPE 2
+#define NEW_3DS_LFCS_END 0x05000000
+
+// batch search of many targets, hits are stored as (lfcs, rand, ds_type,
+// target) rows after count. Each rand value is hashed once per DS_TYPE set in
+// ds_types, a bitmask of the console types the targets may have. Queued
+// launches return immediately once every target has been found
+__kernel void find_unique_batch(const u32 start, __global u32 *count,
+                                __global uint4 *results, const u32 capacity,
+                                const u32 target_count,
+                                __global const uint4 *table,
+                                const u32 table_mask, const u32 ds_types)
+{
+    if (*count >= target_count) {
+        return;
     }
-}
\ No newline at end of file
+    const u32 offset = get_global_offset(0);
+    const u32 first = offset + (get_global_id(0) - offset) * WORK_PER_ITEM;
+    const u32 lfcs = start + (first >> 16);
+    const u32 w0 = bswap32(lfcs);
+    const u32 types = lfcs < NEW_3DS_LFCS_END
+                    ? ds_types : ds_types & ~(1u << NEW_3DS_DS_TYPE);
+    u32 round0[8];
+    sha256_unique_round0(w0, round0);
+
+    for (u32 ds_type = 0; ds_type < 4; ds_type++) {
+        if (!((types >> ds_type) & 1)) {
+            continue;
+        }
+        for (u32 item = 0; item < WORK_PER_ITEM; item++) {
+            const u32 rand = (first + item) & 0xFFFF;
+            const int target = sha256_unique_lookup(
+                round0, w0, bswap32(ds_type | (rand << 16)), ds_type, table,
+                table_mask);
+            if (target >= 0) {
+                const u32 index = atomic_inc(count);
+                if (index < capacity) {
+                    results[index] = (uint4)(lfcs, rand, ds_type, target);
+                }
+            }
+        }
+    }
+}
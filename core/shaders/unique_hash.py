@@ -3,74 +3,461 @@
 import hashlib
 import importlib.resources
 import struct
+from pathlib import Path
 import numpy as np
 import pyopencl as cl
-from qtpy.QtCore import QThread, Signal
+from .engine import SearchEngine, DeviceState, ResultSlot, parse_int
 from .. import shaders
 
 SHADER_CODE = importlib.resources.read_text(shaders, "unique_hash.cl")
+CHUNK_SIZE = 0x800
+OLD_3DS_TYPE = 0
+NEW_3DS_TYPE = 2
+# end of the lfcs range of each console's DS_TYPE
+LFCS_END = {OLD_3DS_TYPE: 0x0B000000, NEW_3DS_TYPE: 0x05000000}
+INPUT_BIN_KEY = (0x59FC817E6446EA6190347B20E9BDCE52).to_bytes(16, "big")
+INPUT_BIN_SIZE = 0x70
+UNIQUE_HASH_SALT = 0x55D
 
 
-class SearchUniqueHashThread(QThread):
-    """Interface for unique_hash shader"""
+def read_input_bin(data: bytes) -> tuple[int, int]:
+    """Decrypt an input.bin, returning the (low, high) words of its console
+    hash, GenHashConsoleUnique(0)"""
+    # pylint: disable-next=import-outside-toplevel
+    from Crypto.Cipher import AES
 
-    finished = Signal()
-    log = Signal(str)
-    results = Signal(object)
-    init_progress_bar = Signal(int)
-    progress = Signal(int)
+    if len(data) != INPUT_BIN_SIZE:
+        raise ValueError(f"input.bin must be {INPUT_BIN_SIZE:#x} bytes")
+    nonce = data[:8] + b"\x00" * 4
+    cipher = AES.new(INPUT_BIN_KEY, AES.MODE_CCM, nonce)
+    dec = cipher.decrypt(data[8:0x60])
+    final = dec[:12] + nonce[:8] + dec[12:]
+    return struct.unpack("<II", final[4 : 4 + 8])
 
-    def __init__(self, *args) -> None:
-        super().__init__()
-        self.args = args
 
-    def run(self) -> None:
-        """Thread work"""
-        (platform, device, n3ds_flag, low, high) = self.args
-        ctx = cl.Context(
-            dev_type=cl.device_type.ALL,
-            properties=[(cl.context_properties.PLATFORM, platform)],
+def find_input_bins(directory) -> list[Path]:
+    """Every input.bin sized .bin file under a directory"""
+    return sorted(
+        path
+        for path in Path(directory).rglob("*.bin")
+        if path.is_file() and path.stat().st_size == INPUT_BIN_SIZE
+    )
+
+
+def console_hash(
+    lfcs: int, rand: int, ds_type: int, salt: int = 0
+) -> tuple[int, int]:
+    """Last two words of the sha256 of a console's (lfcs, ds_type | rand << 16,
+    salt) message"""
+    digest = hashlib.sha256(
+        lfcs.to_bytes(4, "little")
+        + ((rand << 16) | ds_type).to_bytes(4, "little")
+        + salt.to_bytes(4, "little")
+    ).digest()
+    return struct.unpack("<" + "I" * 8, digest)[-2:]
+
+
+def unique_hash(lfcs: int, rand: int, ds_type: int) -> int:
+    """Unique hash of the console an lfcs and rand were found for"""
+    low, high = console_hash(lfcs, rand, ds_type, UNIQUE_HASH_SALT)
+    return low ^ high
+
+
+def sweep_chunks(lfcs_end: int, lfcs_start: int = None) -> list[int]:
+    """Starting LFCS of each chunk below lfcs_end, sweeping outward from
+    lfcs_start or the middle of the range"""
+    center = (
+        lfcs_end >> 1 if lfcs_start is None else min(max(lfcs_start, 0), lfcs_end - 1)
+    )
+    center -= center % CHUNK_SIZE
+    starts = []
+    above, below = center, center - CHUNK_SIZE
+    while above < lfcs_end or below >= 0:
+        if above < lfcs_end:
+            starts.append(above)
+            above += CHUNK_SIZE
+        if below >= 0:
+            starts.append(below)
+            below -= CHUNK_SIZE
+    return starts
+
+
+class UniqueHashSearch(SearchEngine):
+    """Search for the unique hash of a console from its input.bin hash"""
+
+    name = "unique_hash"
+    # kernels queued after a hit return immediately, so keeping several chunks
+    # in flight costs nothing once the hash is found
+    pipeline_depth = 3
+    chunk_seeds = CHUNK_SIZE << 16
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        n3ds_flag: bool,
+        low: int,
+        high: int,
+        lfcs_start: int = None,
+    ) -> None:
+        super().__init__(devices)
+        self.n3ds_flag = n3ds_flag
+        self.low = low
+        self.high = high
+        self.lfcs_start = lfcs_start
+        # the hash is unique, stop the sweep as soon as it is found
+        self.max_results = 1
+
+    @classmethod
+    def from_spec(cls, devices: list[cl.Device], spec: dict) -> "UniqueHashSearch":
+        """Construct the search from a JSON job spec
+
+        lfcs_start is the LFCS the sweep starts from, the middle of the range
+        if not given
+        """
+        return cls(
+            devices,
+            bool(spec.get("new_3ds", False)),
+            parse_int(spec["low"]),
+            parse_int(spec["high"]),
+            (
+                parse_int(spec["lfcs_start"])
+                if spec.get("lfcs_start") is not None
+                else None
+            ),
+        )
+
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        return {
+            "new_3ds": self.n3ds_flag,
+            "low": self.low,
+            "high": self.high,
+            "lfcs_start": self.lfcs_start,
+        }
+
+    def chunks(self) -> list[int]:
+        """Starting LFCS of each chunk, sweeping outward from lfcs_start"""
+        return sweep_chunks(
+            LFCS_END[NEW_3DS_TYPE if self.n3ds_flag else OLD_3DS_TYPE],
+            self.lfcs_start,
+        )
+
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device"""
+        state = self.create_state(device)
+        state.kernel = state.build_kernel(
+            SHADER_CODE, self.build_options(state), "find_unique"
+        )
+        state.search_args = (
+            np.uint32(NEW_3DS_TYPE if self.n3ds_flag else OLD_3DS_TYPE),
+            np.uint32(self.low),
+            np.uint32(self.high),
+        )
+        # single result word shared by every chunk on the device, mirrored
+        # into pinned host memory after each chunk
+        state.device_result = state.buffer(8)
+        cl.enqueue_fill_buffer(state.queue, state.device_result, np.uint64(0), 0, 8)
+        state.host_result = state.pinned_array((1,), np.uint64)
+        state.found = False
+        return state
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> cl.Event:
+        """Queue the kernel and a non-blocking result word readback for one chunk"""
+        kernel_event = self.enqueue_launches(
+            state, np.uint32(chunk), state.device_result, *state.search_args
+        )
+        read_event = cl.enqueue_copy(
+            state.transfer_queue,
+            state.host_result,
+            state.device_result,
+            wait_for=[kernel_event],
+            is_blocking=False,
         )
-        queue = cl.CommandQueue(ctx, device)
-        program = cl.Program(ctx, SHADER_CODE).build(
-            shaders.build_shader_constants(
-                ds_type=2 if n3ds_flag else 0,
-                target_low=low,
-                target_high=high,
+        state.record("transfer", read_event)
+        state.queue.flush()
+        state.transfer_queue.flush()
+        return read_event
+
+    def collect_chunk(
+        self, state: DeviceState, pending: cl.Event
+    ) -> list[tuple[int, int]]:
+        """Wait for a queued chunk's result word and return the (lfcs, rand)
+        found if this is the first chunk to see it"""
+        pending.wait()
+        result = int(state.host_result[0])
+        if result and not state.found:
+            state.found = True
+            return [((result >> 16) - 1, result & 0xFFFF)]
+        return []
+
+    def run(self):
+        """Search work"""
+        found = False
+        for event, value in self.search():
+            if event != "results":
+                yield event, value
+                continue
+            lfcs, rand = value
+            found = True
+            yield "results", unique_hash(
+                lfcs, rand, NEW_3DS_TYPE if self.n3ds_flag else OLD_3DS_TYPE
             )
+        # the sweep ends early once the hash is found, fill the progress bar
+        # only after search() has reported its last completed chunk
+        if found:
+            yield "progress", len(self.chunks())
+
+
+class HashTarget:
+    """Console hash of one input.bin in a batch search, new_3ds is None when
+    the console type is unknown and both are searched"""
+
+    def __init__(
+        self, low: int, high: int, new_3ds: bool = None, name: str = None
+    ) -> None:
+        self.low = low
+        self.high = high
+        self.new_3ds = new_3ds
+        self.name = name
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "HashTarget":
+        """Construct the target from its part of a JSON job spec"""
+        return cls(
+            parse_int(spec["low"]),
+            parse_int(spec["high"]),
+            spec.get("new_3ds"),
+            spec.get("name"),
         )
 
-        find_unique = program.find_unique
-
-        host_result = np.zeros(1, np.uint32)
-        device_result = cl.Buffer(ctx, cl.mem_flags.READ_WRITE, host_result.nbytes)
-        cl.enqueue_copy(queue, device_result, host_result)
-        # TODO: custom lfcs starting point
-        LFCS_RANGE = (0, 0x05000000 if n3ds_flag else 0x0B000000)
-        LFCS_HALF_RANGE = (LFCS_RANGE[1] - LFCS_RANGE[0]) >> 1
-        CHUNK_SIZE = 0x800
-        self.init_progress_bar.emit(LFCS_HALF_RANGE)
-        for offset in range(0, LFCS_HALF_RANGE, CHUNK_SIZE):
-            for sign in (1, -1):
-                if sign == -1:
-                    offset += CHUNK_SIZE
-                start = LFCS_RANGE[0] + LFCS_HALF_RANGE + sign * offset
-                find_unique(
-                    queue, (CHUNK_SIZE << 16,), None, np.uint32(start), device_result
+    def spec(self) -> dict:
+        """JSON job spec of the target, the inverse of from_spec"""
+        return {
+            "low": self.low,
+            "high": self.high,
+            "new_3ds": self.new_3ds,
+            "name": self.name,
+        }
+
+    @property
+    def ds_types(self) -> list[int]:
+        """DS_TYPE values the console may have"""
+        if self.new_3ds is None:
+            return [OLD_3DS_TYPE, NEW_3DS_TYPE]
+        return [NEW_3DS_TYPE if self.new_3ds else OLD_3DS_TYPE]
+
+
+class UniqueHashBatchSearch(SearchEngine):
+    """Search for the unique hashes of many consoles in one LFCS sweep
+
+    Every digest is looked up in a device hash table of the targets, the
+    sweep continues until each target has been found. Results are
+    (target index, unique hash, lfcs, DS_TYPE)
+    """
+
+    name = "unique_hash_batch"
+    pipeline_depth = 3
+    chunk_seeds = CHUNK_SIZE << 16
+
+    def __init__(
+        self,
+        devices: list[cl.Device],
+        targets: list[HashTarget],
+        lfcs_start: int = None,
+    ) -> None:
+        super().__init__(devices)
+        if not targets:
+            raise ValueError("No targets to search for")
+        self.targets = targets
+        self.lfcs_start = lfcs_start
+        # targets by console hash, the same input.bin may be given twice
+        self.hash_targets: dict[tuple[int, int], list[int]] = {}
+        for index, target in enumerate(targets):
+            self.hash_targets.setdefault((target.low, target.high), []).append(index)
+        self.max_results = len(targets)
+
+    @classmethod
+    def from_spec(
+        cls, devices: list[cl.Device], spec: dict
+    ) -> "UniqueHashBatchSearch":
+        """Construct the search from a JSON job spec
+
+        targets is a list of {low, high, new_3ds, name} console hashes, or
+        directory a folder whose input.bin files are decrypted into targets
+        with new_3ds applied to each. new_3ds may be null to search both
+        console types. lfcs_start is the LFCS the sweep starts from
+        """
+        if spec.get("directory") is not None:
+            targets = [
+                HashTarget(
+                    *read_input_bin(path.read_bytes()),
+                    spec.get("new_3ds"),
+                    str(path),
                 )
-                cl.enqueue_copy(queue, host_result, device_result)
-                if host_result[0]:
-                    lfcs = start | int(host_result[0] >> 16)
-                    rand = int(host_result[0]) & 0xFFFF
-                    salt = 0x55D
-                    m = hashlib.sha256()
-                    m.update(
-                        (lfcs).to_bytes(4, "little")
-                        + ((rand << 16) | (2 if n3ds_flag else 0)).to_bytes(4, "little")
-                        + (salt).to_bytes(4, "little")
+                for path in find_input_bins(spec["directory"])
+            ]
+        else:
+            targets = [HashTarget.from_spec(target) for target in spec["targets"]]
+        return cls(
+            devices,
+            targets,
+            (
+                parse_int(spec["lfcs_start"])
+                if spec.get("lfcs_start") is not None
+                else None
+            ),
+        )
+
+    def spec(self) -> dict:
+        """JSON job spec of the search, the inverse of from_spec"""
+        return {
+            "targets": [target.spec() for target in self.targets],
+            "lfcs_start": self.lfcs_start,
+        }
+
+    @property
+    def ds_types(self) -> int:
+        """Bitmask of the DS_TYPE values any target may have"""
+        return sum(
+            {1 << ds_type for target in self.targets for ds_type in target.ds_types}
+        )
+
+    def chunks(self) -> list[int]:
+        """Starting LFCS of each chunk, sweeping outward from lfcs_start over
+        the widest LFCS range of the targets' console types"""
+        return sweep_chunks(
+            max(
+                LFCS_END[ds_type]
+                for target in self.targets
+                for ds_type in target.ds_types
+            ),
+            self.lfcs_start,
+        )
+
+    def hash_table(self) -> np.ndarray:
+        """Open addressed table of (h7, h6, ds_type, target + 1) entries
+        indexed by the low bits of h7, at most half full, with one entry per
+        console hash and DS_TYPE pointing at its first target"""
+        entries = [
+            (high, low, ds_type, indices[0] + 1)
+            for (low, high), indices in self.hash_targets.items()
+            for ds_type in sorted(
+                {
+                    ds_type
+                    for index in indices
+                    for ds_type in self.targets[index].ds_types
+                }
+            )
+        ]
+        size = max(16, 1 << (2 * len(entries) - 1).bit_length())
+        table = np.zeros((size, 4), np.uint32)
+        mask = len(table) - 1
+        for entry in entries:
+            # the kernel compares the hash words big endian
+            h7, h6 = (
+                int.from_bytes(word.to_bytes(4, "little"), "big")
+                for word in entry[:2]
+            )
+            slot = h7 & mask
+            while table[slot, 3]:
+                slot = (slot + 1) & mask
+            table[slot] = (h7, h6, entry[2], entry[3])
+        return table
+
+    def setup_device(self, device: cl.Device) -> DeviceState:
+        """Build the programs and buffers needed to search on a device"""
+        state = self.create_state(device)
+        state.kernel = state.build_kernel(
+            SHADER_CODE, self.build_options(state), "find_unique_batch"
+        )
+        table = self.hash_table()
+        # hits are kept for the whole search, each chunk only reads back
+        # the rows added since the last
+        state.hits = ResultSlot(state, 2 * len(self.hash_targets) + 16, 4)
+        state.hits.reset(state.queue)
+        state.reported = 0
+        # kernel of the last chunk queued, hits are read back after it since
+        # any chunk in flight may have added to the shared count
+        state.last_kernel: cl.Event = None
+        state.search_args = (
+            state.hits.device_count,
+            state.hits.device_results,
+            np.uint32(state.hits.capacity),
+            np.uint32(len(self.hash_targets)),
+            state.upload(table),
+            np.uint32(len(table) - 1),
+            np.uint32(self.ds_types),
+        )
+        return state
+
+    def enqueue_chunk(self, state: DeviceState, chunk: int) -> cl.Event:
+        """Queue the kernel and a non-blocking hit count readback for one chunk"""
+        kernel_event = self.enqueue_launches(
+            state, np.uint32(chunk), *state.search_args
+        )
+        state.last_kernel = kernel_event
+        count_event = cl.enqueue_copy(
+            state.transfer_queue,
+            state.hits.host_count,
+            state.hits.device_count,
+            wait_for=[kernel_event],
+            is_blocking=False,
+        )
+        state.record("transfer", count_event)
+        state.queue.flush()
+        state.transfer_queue.flush()
+        return count_event
+
+    def collect_chunk(self, state: DeviceState, pending: cl.Event) -> np.ndarray:
+        """Wait for a queued chunk's hit count and read back the (lfcs, rand,
+        ds_type, target) hits that are new
+
+        The count may include hits of any chunk queued so far, whose rows are
+        only written once its kernel is done, so a hit waits for every queued
+        kernel before its rows are read
+        """
+        state.hits.count_event = pending
+        count = state.hits.wait_count()
+        hits = state.hits.host_results
+        if count <= state.reported:
+            return hits[:0].copy()
+        state.record(
+            "transfer",
+            cl.enqueue_copy(
+                state.transfer_queue,
+                hits[state.reported : count],
+                state.hits.device_results,
+                src_offset=state.reported * hits.itemsize * 4,
+                wait_for=[state.last_kernel],
+            ),
+        )
+        new_hits = hits[state.reported : count].copy()
+        state.reported = count
+        return new_hits
+
+    def verify_chunk(self, candidates: np.ndarray) -> list[tuple[int, int, int, int]]:
+        """Re-hash each hit on the cpu and compute its unique hash, a hit is
+        a result of every target with its console hash"""
+        results = []
+        for lfcs, rand, ds_type, index in candidates.tolist():
+            target = self.targets[index]
+            if console_hash(lfcs, rand, ds_type) != (target.low, target.high):
+                continue
+            for duplicate in self.hash_targets[(target.low, target.high)]:
+                if ds_type in self.targets[duplicate].ds_types:
+                    results.append(
+                        (duplicate, unique_hash(lfcs, rand, ds_type), lfcs, ds_type)
                     )
-                    low, high = struct.unpack("<" + "I" * 8, m.digest())[-2:]
-                    self.results.emit(low ^ high)
-                    self.progress.emit(LFCS_HALF_RANGE)
-                    return
-            self.progress.emit(offset + CHUNK_SIZE)
+        return results
+
+    def run(self):
+        """Search work"""
+        found = set()
+        for event, value in self.search():
+            yield event, value
+            if event == "results":
+                found.add(value[0])
+        # as for a single search, fill the progress bar once every target has
+        # been found and search() is done reporting
+        if len(found) == len(self.targets):
+            yield "progress", len(self.chunks())
@@ -0,0 +1,96 @@
+"""Host verifiers compiled ahead of time, with the numba jit as fallback
+
+The jit verifiers compile on first use, a multi second stall right when the
+first result of a search should appear. `python -m core build-verifiers`
+compiles single threaded versions into an extension module beside this file,
+which searches use until warm_up() has compiled the parallel jit versions on a
+background thread
+"""
+
+import functools
+import importlib
+import os
+import threading
+import numpy as np
+
+MODULE_NAME = "_verifiers"
+# exported name: (module, jit function, function compiled ahead of time, signature)
+EXPORTS = {
+    "test_seeds": (
+        "iv_search",
+        "test_seeds",
+        "test_seeds_serial",
+        "int64[:, :](uint32[:], uint64, uint64, int64, int64)",
+    ),
+    "find_matching_advances_batch": (
+        "pokemon_blink",
+        "find_matching_advances_batch",
+        "find_matching_advances_batch_serial",
+        "int64[:, :](uint32[:], int64[:], int64, int64, int64)",
+    ),
+    "find_matching_advances": (
+        "pokemon_blink",
+        "find_matching_advances",
+        "find_matching_advances",
+        "int64[:](uint32, int64[:], int64, int64, int64)",
+    ),
+}
+
+jit_ready = threading.Event()
+
+
+def export_function(name: str, compiled: bool = False):
+    """The jit function of an export, or the function compiled ahead of time"""
+    module, function, compiled_function, _ = EXPORTS[name]
+    module = importlib.import_module(f".{module}", __package__)
+    return getattr(module, compiled_function if compiled else function)
+
+
+@functools.cache
+def compiled_module():
+    """The ahead-of-time compiled extension module, None if it was not built"""
+    try:
+        return importlib.import_module(f".{MODULE_NAME}", __package__)
+    except ImportError:
+        return None
+
+
+def verifier(name: str):
+    """The fastest version of a verifier that runs without compiling
+
+    This is the jit function once warmed up, otherwise the ahead-of-time
+    compiled function if built, otherwise the jit function compiling on use
+    """
+    if not jit_ready.is_set() and compiled_module() is not None:
+        return getattr(compiled_module(), name)
+    return export_function(name)
+
+
+def compile_jit() -> None:
+    """Compile the jit verifiers for the argument types searches pass"""
+    seeds = np.zeros(1, np.uint32)
+    blinks = np.zeros(1, np.int64)
+    export_function("test_seeds")(seeds, 0, 0, 0, 1)
+    export_function("find_matching_advances_batch")(seeds, blinks, 0, 0, 1)
+    export_function("find_matching_advances")(0, blinks, 0, 0, 1)
+    jit_ready.set()
+
+
+def warm_up() -> threading.Thread:
+    """Compile the jit verifiers on a background thread"""
+    thread = threading.Thread(target=compile_jit, daemon=True)
+    thread.start()
+    return thread
+
+
+def build(output_dir: str = None) -> str:
+    """Compile the verifiers into an extension module, returning its path"""
+    # pylint: disable-next=import-outside-toplevel
+    from numba.pycc import CC
+
+    cc = CC(MODULE_NAME)
+    cc.output_dir = output_dir or os.path.dirname(__file__)
+    for name, (*_, signature) in EXPORTS.items():
+        cc.export(name, signature)(export_function(name, compiled=True).py_func)
+    cc.compile()
+    return os.path.join(cc.output_dir, cc.output_file)
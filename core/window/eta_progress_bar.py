@@ -4,11 +4,30 @@ import time
 from qtpy.QtWidgets import QProgressBar
 
 
+def format_eta(eta: float) -> str:
+    """Format seconds remaining as [hh:][mm:]ss.ss"""
+    eta_minutes, eta_seconds = divmod(eta, 60)
+    eta_hours, eta_minutes = divmod(eta_minutes, 60)
+    return (
+        (f"{eta_hours:02.00f}:" if eta_hours > 0 else "")
+        + (f"{eta_minutes:02.00f}:" if eta_minutes > 0 else "")
+        + f"{eta_seconds:05.02f}"
+        + ("s" if eta_hours == 0 and eta_minutes == 0 else "")
+    )
+
+
 class ETAProgressBar(QProgressBar):
-    """Progress bar with a time estimation"""
+    """Progress bar with a time estimation
+
+    The estimate comes from the measured seeds/s once the search reports its
+    throughput, otherwise from the rate progress has been made at. The latest
+    log message is shown as the tooltip
+    """
 
     def __init__(self, parent=None) -> None:
         self.start_time: float = None
+        self.seeds_per_second: float = None
+        self.eta: float = None
         super().__init__(parent)
 
     def setValue(self, value: int) -> None:
@@ -17,18 +36,33 @@ class ETAProgressBar(QProgressBar):
             value = 1
         if self.start_time is None:
             self.start_time = time.time()
-        elapsed_time = time.time() - self.start_time
-        eta = (self.maximum() - value) * elapsed_time / value
-        eta_minutes, eta_seconds = divmod(eta, 60)
-        eta_hours, eta_minutes = divmod(eta_minutes, 60)
-        eta_str = (
-            (f"{eta_hours:02.00f}:" if eta_hours > 0 else "")
-            + (f"{eta_minutes:02.00f}:" if eta_minutes > 0 else "")
-            + f"{eta_seconds:05.02f}"
-            + ("s" if eta_hours == 0 and eta_minutes == 0 else "")
+        if self.eta is None:
+            elapsed_time = time.time() - self.start_time
+            eta = (self.maximum() - value) * elapsed_time / value
+        else:
+            eta = self.eta
+        self.setFormat(
+            f"{value/self.maximum()*100:.00f}% Estimated time: {format_eta(eta)}"
+            + (
+                ""
+                if self.seeds_per_second is None
+                else f" ({self.seeds_per_second / 1e6:.1f}M seeds/s)"
+            )
         )
-        self.setFormat(f"{value/self.maximum()*100:.00f}% Estimated time: {eta_str}")
 
     def setMaximum(self, maximum: int) -> None:
         QProgressBar.setMaximum(self, maximum)
         self.start_time = None
+        self.seeds_per_second = None
+        self.eta = None
+
+    def set_throughput(self, throughput: dict) -> None:
+        """Show the measured seeds/s and estimate the time left from it"""
+        self.seeds_per_second = throughput["seeds_per_second"]
+        self.eta = throughput["eta"]
+        if self.value() >= 0:
+            self.setValue(self.value())
+
+    def log(self, message: str) -> None:
+        """Show a search log message on hover"""
+        self.setToolTip(message)
@@ -15,6 +15,9 @@ from qtpy.QtWidgets import (
     QTextEdit,
 )
 
+from ..base_stats import BASE_STATS, STAT_NAMES
+from ..iv_calculator import MAX_LEVEL, invert, stat_lines
+
 
 class IVCalculatorWindow(QDialog):
     """IV Calculator Window"""
@@ -32,13 +35,28 @@ class IVCalculatorWindow(QDialog):
         self.strict = strict
         self.nature_combo = QComboBox()
         self.nature_combo.addItems([nature.capitalize() for nature in NATURES_EN])
+        self.species_combo = QComboBox()
+        self.species_combo.addItems(BASE_STATS.names)
+        self.species_combo.setCurrentIndex(BASE_STATS.index("Aerodactyl"))
+        self.level_spin_box = QSpinBox()
+        self.level_spin_box.setRange(1, MAX_LEVEL)
+        self.level_spin_box.setValue(20)
+        self.level_spin_box.setPrefix("Level ")
         self.data_entry = QTextEdit()
+        self.data_entry.setPlaceholderText(
+            "Stats, then one row of stat gains per level up"
+        )
 
         self.results_widget = QWidget()
         self.results_layout = QGridLayout(self.results_widget)
-        for i, stat in enumerate(("HP", "Atk", "Def", "SpA", "SpD", "Spe")):
+        self.result_labels: list[QLabel] = []
+        for i, stat in enumerate(STAT_NAMES):
             self.results_layout.addWidget(QLabel(stat), i, 0)
+            self.result_labels.append(QLabel())
+            self.results_layout.addWidget(self.result_labels[i], i, 1)
 
+        self.main_layout.addWidget(self.species_combo)
+        self.main_layout.addWidget(self.level_spin_box)
         self.main_layout.addWidget(self.nature_combo)
         self.main_layout.addWidget(self.data_entry)
         self.main_layout.addWidget(self.calculate_button)
@@ -61,115 +79,34 @@ class IVCalculatorWindow(QDialog):
             return tuple(iv_range[0] for iv_range in self.iv_ranges)
         raise Exception("IVs could not be calculated to precise values")
 
-    @staticmethod
-    def calc_stat(
-        stat_index: int,
-        base_stat: np.uint16,
-        iv: np.uint8,
-        level: np.uint8,
-        nature: np.uint8,
-    ):
-        """Calcuate a stat value"""
-        iv_map = (-1, 0, 1, 3, 4, 2)
-        stat = np.uint16(
-            np.uint16((np.uint16(2) * base_stat + iv) * level) // np.uint16(100)
-        )
-        nature_boost = nature // np.uint8(5)
-        nature_decrease = nature % np.uint8(5)
-        if stat_index == 0:
-            stat += np.uint16(level) + np.uint16(10)
-        else:
-            stat += np.uint16(5)
-            if nature_boost != nature_decrease:
-                if iv_map[stat_index] == nature_boost:
-                    stat = np.uint16(stat * np.float32(1.1))
-                elif iv_map[stat_index] == nature_decrease:
-                    stat = np.uint16(stat * np.float32(0.9))
-        return stat
-
-    @staticmethod
-    def calc_ivs(
-        base_stats: np.array, stats: np.array, level: np.uint8, nature: np.uint8
-    ) -> tuple[range, range, range, range, range, range]:
-        """Calculate possible ivs"""
-        min_ivs = np.ones(6, np.uint8) * 31
-        max_ivs = np.zeros(6, np.uint8)
-        for i in range(6):
-            for iv in range(32):
-                stat = IVCalculatorWindow.calc_stat(
-                    i, base_stats[i], np.uint8(iv), np.uint8(level), np.uint8(nature)
-                )
-                if stat == stats[i]:
-                    min_ivs[i] = min(iv, min_ivs[i])
-                    max_ivs[i] = max(iv, max_ivs[i])
-        return tuple(
-            range(min_iv, max_iv + 1) for min_iv, max_iv in zip(min_ivs, max_ivs)
-        )
-
     def calculate(self) -> None:
         """Calculate IVs"""
-        self.iv_ranges = [
-            range(32),
-            range(32),
-            range(32),
-            range(32),
-            range(32),
-            range(32),
-        ]
-        nature = np.int8(self.nature_combo.currentIndex())
-        rows = [row for row in self.data_entry.toPlainText().split("\n") if row]
-        stats = np.array(tuple(map(int, rows[0].split(" "))), np.uint16)
-        # aerodactyl
-        level = np.uint8(20)
-        base_stats = np.array(
-            (
-                80,
-                105,
-                65,
-                60,
-                75,
-                130,
-            ),
-            np.uint16,
-        )
-
-        def try_intersect(x, y):
-            try:
-                return range(max(x[0], y[0]), min(x[-1], y[-1]) + 1)
-            except IndexError:
-                return range(32, 0)
-
-        self.iv_ranges = [
-            try_intersect(x, y)
-            for x, y in zip(
-                self.iv_ranges,
-                IVCalculatorWindow.calc_ivs(base_stats, stats, level, nature),
+        try:
+            stats, levels = stat_lines(
+                self.data_entry.toPlainText(), self.level_spin_box.value()
+            )
+        except ValueError:
+            stats, levels = np.empty((0, 6), np.int32), np.empty(0, np.int32)
+        if not len(stats) or levels[-1] > MAX_LEVEL:
+            self.iv_ranges = [range(32, 0)] * 6
+        else:
+            minimum, maximum = invert(
+                BASE_STATS.base_stats[self.species_combo.currentIndex()],
+                stats,
+                levels,
+                self.nature_combo.currentIndex(),
             )
-        ]
-        for row in rows[1:]:
-            level += 1
-            stat_changes = tuple(map(int, row.split(" ")))
-            stats += np.array(stat_changes, np.uint16)
-
             self.iv_ranges = [
-                try_intersect(x, y)
-                for x, y in zip(
-                    self.iv_ranges,
-                    IVCalculatorWindow.calc_ivs(base_stats, stats, level, nature),
-                )
+                range(min_iv, max_iv + 1) for min_iv, max_iv in zip(minimum, maximum)
             ]
-        for i, iv_range in enumerate(self.iv_ranges):
+        for label, iv_range in zip(self.result_labels, self.iv_ranges):
             if len(iv_range) == 0:
-                self.results_layout.addWidget(QLabel("Invalid"), i, 1)
+                label.setText("Invalid")
             else:
-                self.results_layout.addWidget(
-                    QLabel(
-                        f"{iv_range.start}-{iv_range.stop - 1}"
-                        if len(iv_range) > 1
-                        else f"{iv_range.start}"
-                    ),
-                    i,
-                    1,
+                label.setText(
+                    f"{iv_range.start}-{iv_range.stop - 1}"
+                    if len(iv_range) > 1
+                    else f"{iv_range.start}"
                 )
         self.confirm_button.setDisabled(
             any(len(iv_range) != 1 for iv_range in self.iv_ranges) and self.strict
@@ -2,7 +2,7 @@
 
 from qtpy.QtWidgets import (
     QVBoxLayout,
-    QListWidget,
+    QListView,
     QPushButton,
     QHBoxLayout,
     QVBoxLayout,
@@ -13,6 +13,7 @@ from qtpy.QtWidgets import (
     QLineEdit,
     QDialog,
     QApplication,
+    QFileDialog,
 )
 from qtpy.QtGui import QRegularExpressionValidator, QKeySequence
 from qtpy import QtCore
@@ -20,23 +21,58 @@ from qtpy import QtCore
 from .range_widget import RangeWidget
 from .opencl_selector import OpenCLSelector
 from .eta_progress_bar import ETAProgressBar
-from .iv_calc_window import IVCalculatorWindow
-from ..shaders.iv_search import SearchIVThread
+from .result_model import ResultModel, rows_text
+from .search_thread import offer_resume, SearchIVThread
 
 
-class SeedList(QListWidget):
-    """List for seed results"""
+def open_iv_calculator(parent: QWidget, strict: bool) -> QDialog:
+    """Create the iv calculator, imported on first use as it loads numba"""
+    # pylint: disable-next=import-outside-toplevel
+    from .iv_calc_window import IVCalculatorWindow
+
+    return IVCalculatorWindow(parent, strict)
+
+
+def partial_result_formatter(base_seed: int):
+    """Format (seed, advance) rows of a partial search with the time since
+    base_seed"""
+
+    def format_result(result) -> str:
+        total_seconds_since_base = (int(result[0]) - base_seed) // 1000
+        seconds = total_seconds_since_base % 60
+        total_minutes = total_seconds_since_base // 60
+        minutes = total_minutes % 60
+        hours = total_minutes // 60
+        return (
+            f"{result[0]:08X} ({hours:02d}:{minutes:02d}:{seconds:02d})"
+            f" | Advance: {result[1]}"
+        )
+
+    return format_result
+
+
+class SeedList(QListView):
+    """Virtualized list for seed results, rows are only formatted when shown"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.result_model = ResultModel(self)
+        self.setModel(self.result_model)
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QListView.SelectionMode.ExtendedSelection)
 
     def keyPressEvent(self, event: QtCore.QEvent) -> None:
         """Run on key press with widget focused"""
         if event.matches(QKeySequence.Copy):
-            current_item = self.currentItem()
-            if current_item is not None:
-                text = current_item.text()
-                if "|" in text:
-                    # hacky, only copies the seed and not the extra info
-                    text = text.split(" (")[0]
-                QApplication.clipboard().setText(text)
+            # only the seeds of the selected rows, not the extra info
+            selected = sorted(index.row() for index in self.selectedIndexes())
+            if selected:
+                seeds = self.result_model.rows()[selected, :1]
+                QApplication.clipboard().setText(
+                    rows_text(seeds, [(16, 8)]).decode().rstrip("\n")
+                )
+        else:
+            super().keyPressEvent(event)
 
 
 class IVSearchTab(QWidget):
@@ -48,76 +84,75 @@ class IVSearchTab(QWidget):
         self.setup_widgets()
         self.search_thread = None
 
-    def display_result(self, result) -> None:
-        """Display the result of the search to a list"""
-        base_seed = (
-            int(seed_str, 16) if (seed_str := self.base_seed_input.text()) else 0
+    def export_results(self) -> None:
+        """Save every result as CSV"""
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Results", "results.csv", "CSV (*.csv)"
         )
-        if self.full_search.isChecked():
-            self.result_list.addItem(f"{result:08X}")
-        else:
-            total_seconds_since_base = (result[0] - base_seed) // 1000
-            seconds = total_seconds_since_base % 60
-            total_minutes = total_seconds_since_base // 60
-            minutes = total_minutes % 60
-            hours = total_minutes // 60
-            self.result_list.addItem(
-                f"{result[0]:08X} ({hours:02d}:{minutes:02d}:{seconds:02d}) | Advance: {result[1]}"
-            )
+        if not path:
+            return
+        results = self.result_list.result_model.rows()
+        with open(path, "wb") as f:
+            f.write(b"seed,advance\n" + rows_text(results, [(16, 8), (10, None)]))
+
+    def search_finished(self) -> None:
+        """Reset the search button once the search thread is done"""
+        self.search_thread = None
+        self.search_button.setText("Start Search")
 
     def search_button_work(self) -> None:
-        """Starts search thread"""
-        platform, device = (
-            self.opencl_selector.get_platform(),
-            self.opencl_selector.get_device(),
-        )
-        assert platform is not None and device is not None
+        """Starts search thread, or stops it if one is running"""
+        if self.search_thread is not None:
+            self.search_thread.requestInterruption()
+            self.search_thread.wait()
+            return
+        devices = self.opencl_selector.get_devices()
+        if devices is None:
+            return
         full_search = self.full_search.isChecked()
         base_seed = (
             int(seed_str, 16) if (seed_str := self.base_seed_input.text()) else 0
         )
-        if self.search_thread is not None:
-            self.search_button.setText("Start Search")
-
-            self.search_thread.requestInterruption()
-            self.search_thread.wait()
-            self.search_thread = None
-        else:
-            self.result_list.clear()
-            self.search_button.setText("Stop Search")
-            self.search_button.setEnabled(False)
-
-            self.search_thread = SearchIVThread(
-                platform,
-                device,
-                [widget.value() for widget in self.iv_widgets_1],
-                (
-                    [widget.value() for widget in self.iv_widgets_2]
-                    if full_search
-                    else None
-                ),
-                (
-                    [widget.value() for widget in self.iv_max_widgets_1]
-                    if not full_search
-                    else None
-                ),
-                self.advance_range_1.get_range(),
-                self.advance_range_2.get_range() if full_search else None,
-                0 if full_search else base_seed,
-                0x100 if full_search else 0x4,
-            )
-            self.search_thread.results.connect(self.display_result)
-            self.search_thread.init_progress_bar.connect(
-                self.search_progress_bar.setMaximum
-            )
-            self.search_thread.progress.connect(self.search_progress_bar.setValue)
-            self.search_thread.finished.connect(
-                lambda: self.search_button.setText("Start Search")
-            )
-            self.search_thread.started.connect(
-                lambda: self.search_button.setEnabled(True)
+        if full_search:
+            self.result_list.result_model.reset(
+                2, lambda result: f"{result[0]:08X} | Advance: {result[1]}"
             )
-            self.search_thread.start()
+        else:
+            self.result_list.result_model.reset(2, partial_result_formatter(base_seed))
+        self.search_button.setText("Stop Search")
+        self.search_button.setEnabled(False)
+
+        self.search_thread = SearchIVThread(
+            devices,
+            [widget.value() for widget in self.iv_widgets_1],
+            (
+                [widget.value() for widget in self.iv_widgets_2]
+                if full_search
+                else None
+            ),
+            (
+                [widget.value() for widget in self.iv_max_widgets_1]
+                if not full_search
+                else None
+            ),
+            self.advance_range_1.get_range(),
+            self.advance_range_2.get_range() if full_search else None,
+            0 if full_search else base_seed,
+            0x100 if full_search else 0x4,
+        )
+        # results arrive as one array per chunk
+        self.search_thread.engine.batch_results = True
+        self.search_thread.result_batch.connect(self.result_list.result_model.append)
+        self.search_thread.init_progress_bar.connect(
+            self.search_progress_bar.setMaximum
+        )
+        self.search_thread.progress.connect(self.search_progress_bar.setValue)
+        self.search_thread.throughput.connect(self.search_progress_bar.set_throughput)
+        self.search_thread.log.connect(self.search_progress_bar.log)
+        self.search_thread.finished.connect(self.search_finished)
+        self.search_thread.started.connect(lambda: self.search_button.setEnabled(True))
+        offer_resume(self, self.search_thread)
+        self.search_thread.start()
 
     def full_search_changed(self) -> None:
         """Enable/disable full search"""
@@ -137,7 +172,7 @@ class IVSearchTab(QWidget):
 
         def iv_calc_1_work() -> None:
             full_search = self.full_search.isChecked()
-            iv_calc_window = IVCalculatorWindow(self, full_search)
+            iv_calc_window = open_iv_calculator(self, full_search)
             if iv_calc_window.exec_() == QDialog.Accepted:
                 iv_info = iv_calc_window.get_ivs()
                 if full_search:
@@ -149,7 +184,7 @@ class IVSearchTab(QWidget):
                         self.iv_max_widgets_1[i].setValue(iv_range.stop - 1)
 
         def iv_calc_2_work() -> None:
-            iv_calc_window = IVCalculatorWindow(self, True)
+            iv_calc_window = open_iv_calculator(self, True)
             if iv_calc_window.exec_() == QDialog.Accepted:
                 iv_info = iv_calc_window.get_ivs()
                 for i, iv in enumerate(iv_info):
@@ -198,6 +233,8 @@ class IVSearchTab(QWidget):
         self.search_button.clicked.connect(self.search_button_work)
         self.search_progress_bar = ETAProgressBar()
         self.result_list = SeedList()
+        self.export_button = QPushButton("Export Results")
+        self.export_button.clicked.connect(self.export_results)
 
         self.main_layout.addWidget(self.full_search)
         self.main_layout.addWidget(self.advance_range_1)
@@ -211,3 +248,4 @@ class IVSearchTab(QWidget):
         self.main_layout.addWidget(self.search_button)
         self.main_layout.addWidget(self.search_progress_bar)
         self.main_layout.addWidget(self.result_list)
+        self.main_layout.addWidget(self.export_button)
@@ -1,47 +1,96 @@
 """OpenCL platform/device selector widget"""
 
+from qtpy.QtCore import Signal
 from qtpy.QtWidgets import (
     QComboBox,
     QHBoxLayout,
+    QMessageBox,
     QWidget,
 )
-import pyopencl as cl
+
+from ..devices import DeviceDiscovery, load_snapshot
 
 
 class OpenCLSelector(QWidget):
-    """QWidget for selecting OpenCL platform/device"""
+    """QWidget for selecting OpenCL platform/device
+
+    Lists the devices saved by the previous run until the background
+    discovery finishes. Selections are kept as device ids and resolved
+    against the discovered devices, so a reordered or changed device list
+    never maps a selection onto a different device
+    """
+
+    discovered = Signal(object)
 
     def __init__(self) -> None:
         super().__init__()
-        self.platforms = cl.get_platforms()
-        self.devices = None
+        self.snapshot = load_snapshot()
 
         self.main_layout = QHBoxLayout(self)
         self.platforms_selector = QComboBox()
-        self.platforms_selector.addItem("Select Platform", None)
-        for platform in self.platforms:
-            self.platforms_selector.addItem(platform.name, platform)
-
         self.platforms_selector.activated.connect(self.on_platform_change)
         self.devices_selector = QComboBox()
-        self.devices_selector.addItem("Select Device", None)
-        self.devices_selector.setEnabled(False)
         self.main_layout.addWidget(self.platforms_selector)
         self.main_layout.addWidget(self.devices_selector)
+        self.populate_platforms()
+
+        self.discovered.connect(self.on_discovered)
+        self.discovery = DeviceDiscovery(self.discovered.emit)
+
+    def populate_platforms(self) -> None:
+        """List the platforms of the current snapshot"""
+        self.platforms_selector.clear()
+        self.platforms_selector.addItem("Select Platform", None)
+        for index, platform in enumerate(self.snapshot):
+            self.platforms_selector.addItem(platform["name"], [index])
+        if len(self.snapshot) > 1:
+            self.platforms_selector.addItem(
+                "All Platforms", list(range(len(self.snapshot)))
+            )
+        self.devices_selector.clear()
+        self.devices_selector.addItem("Select Device", None)
+        self.devices_selector.setEnabled(False)
+
+    def on_discovered(self, snapshot: list[dict]) -> None:
+        """Relist the platforms if they changed since the previous run"""
+        if snapshot != self.snapshot:
+            self.snapshot = snapshot
+            self.populate_platforms()
 
     def on_platform_change(self, index: int) -> None:
         """Handle platform change"""
-        self.devices = self.platforms_selector.itemData(index).get_devices()
+        platforms = self.platforms_selector.itemData(index)
         self.devices_selector.clear()
         self.devices_selector.addItem("Select Device", None)
-        for device in self.devices:
-            self.devices_selector.addItem(device.name, device)
+        if platforms is None:
+            self.devices_selector.setEnabled(False)
+            return
+        devices = [
+            (device["id"], device["name"])
+            for platform in platforms
+            for device in self.snapshot[platform]["devices"]
+        ]
+        for device, name in devices:
+            self.devices_selector.addItem(name, [device])
+        if len(devices) > 1:
+            self.devices_selector.addItem(
+                "All Devices", [device for device, _ in devices]
+            )
         self.devices_selector.setEnabled(True)
 
-    def get_platform(self) -> cl.Platform:
-        """Get selected platform"""
-        return self.platforms_selector.currentData()
-
-    def get_device(self) -> cl.Device:
-        """Get selected device"""
-        return self.devices_selector.currentData()
+    def get_devices(self) -> list:
+        """Get selected devices, searches are sharded across all of them"""
+        ids = self.devices_selector.currentData()
+        if ids is None:
+            return None
+        try:
+            return self.discovery.get_devices(ids)
+        except LookupError as error:
+            QMessageBox.warning(
+                self,
+                "Devices Changed",
+                f"{error}\nThe device list has been refreshed, select again.",
+            )
+            self.snapshot = self.discovery.snapshot
+            self.populate_platforms()
+            return None
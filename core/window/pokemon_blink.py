@@ -18,12 +18,11 @@ from qtpy.QtWidgets import (
 from qtpy.QtGui import QRegularExpressionValidator
 from qtpy.QtCore import Qt
 from qtpy import QtCore
-from numba_pokemon_prngs.mersenne_twister import TinyMersenneTwister
 
 from .range_widget import RangeWidget
 from .opencl_selector import OpenCLSelector
 from .eta_progress_bar import ETAProgressBar
-from ..shaders.pokemon_blink import PokemonBlinkFidgetThread
+from .search_thread import offer_resume, PokemonBlinkFidgetThread
 
 
 class PokemonBlinkTab(QWidget):
@@ -83,35 +82,51 @@ class PokemonBlinkTab(QWidget):
             self.blink_button.setText("Start Blinks")
 
     def display_result(self, result) -> None:
-        """Display the result of the search to a label"""
-        assert len(result[0]) == 1, f"Expected 1 result, got {result[0]}"
+        """Add a (seed, starting advance) result to the result label"""
+        seed, advance = result
+        text = self.result_label.text()
+        if text:
+            text += "\n\n"
         if self.search_type.currentIndex() == 2:
-            self.result_label.setText(
-                f"Starting Advance: {result[0][0]}\nResult Advance: {result[0][0] + len(self.blinks)-1+1}"
+            text += (
+                f"Starting Advance: {advance}\n"
+                f"Result Advance: {advance + len(self.blinks)-1+1}"
             )
         else:
-            initial_state = TinyMersenneTwister(result[0][0]).state
-            self.result_label.setText(
-                f"Initial Seed: {result[0][0]:08X}\n"
+            # pylint: disable-next=import-outside-toplevel
+            from numba_pokemon_prngs.mersenne_twister import TinyMersenneTwister
+
+            initial_state = TinyMersenneTwister(seed).state
+            text += (
+                f"Initial Seed: {seed:08X}\n"
                 f"Initial State: {initial_state[3]:08X} {initial_state[2]:08X} {initial_state[1]:08X} {initial_state[0]:08X}\n"
-                + f"Starting Advance: {result[1]}\n"
-                + f"Result Advance: {result[1] + len(self.blinks)-1+1}"
+                + f"Starting Advance: {advance}\n"
+                + f"Result Advance: {advance + len(self.blinks)-1+1}"
             )
+        self.result_label.setText(text)
+
+    def search_finished(self) -> None:
+        """Reset the search button once the search thread is done"""
+        self.search_thread = None
+        self.on_search_type_changed(self.search_type.currentIndex())
 
     def search_button_work(self) -> None:
-        """Starts search thread"""
-        platform, device = (
-            self.opencl_selector.get_platform(),
-            self.opencl_selector.get_device(),
-        )
-        assert platform is not None and device is not None
+        """Starts search thread, or stops it if one is running"""
+        if self.search_thread is not None:
+            self.search_thread.requestInterruption()
+            self.search_thread.wait()
+            return
+        devices = self.opencl_selector.get_devices()
+        if devices is None:
+            return
 
         base_seed = (
             int(seed_str, 16) if (seed_str := self.base_seed_input.text()) else 0
         )
+        self.result_label.setText("")
+        self.search_button.setText("Stop Search")
         self.search_thread = PokemonBlinkFidgetThread(
-            platform,
-            device,
+            devices,
             self.blinks[1:],
             self.leeway_spinbox.value(),
             self.advance_range.get_range(),
@@ -119,11 +134,18 @@ class PokemonBlinkTab(QWidget):
             0x100 if self.search_type.currentIndex() == 0 else 0x4,
             self.search_type.currentIndex() == 2,
         )
+        self.search_thread.engine.max_results = self.max_results_spinbox.value() or None
         self.search_thread.results.connect(self.display_result)
         self.search_thread.init_progress_bar.connect(
             self.search_progress_bar.setMaximum
         )
         self.search_thread.progress.connect(self.search_progress_bar.setValue)
+        self.search_thread.throughput.connect(
+            self.search_progress_bar.set_throughput
+        )
+        self.search_thread.log.connect(self.search_progress_bar.log)
+        self.search_thread.finished.connect(self.search_finished)
+        offer_resume(self, self.search_thread)
         self.search_thread.start()
 
     def on_search_type_changed(self, index: int) -> None:
@@ -151,6 +173,11 @@ class PokemonBlinkTab(QWidget):
         self.leeway_spinbox.setValue(10)
         self.leeway_layout.addWidget(QLabel("±"))
         self.leeway_layout.addWidget(self.leeway_spinbox)
+        self.max_results_spinbox = QSpinBox()
+        self.max_results_spinbox.setSpecialValueText("All")
+        self.max_results_spinbox.setValue(1)
+        self.leeway_layout.addWidget(QLabel("Stop After:"))
+        self.leeway_layout.addWidget(self.max_results_spinbox)
 
         self.base_seed_input_holder = QWidget()
         self.base_seed_input_layout = QHBoxLayout(self.base_seed_input_holder)
@@ -0,0 +1,92 @@
+"""List model over search results batched into numpy arrays"""
+
+from collections.abc import Callable
+import numpy as np
+from qtpy.QtCore import QAbstractListModel, QModelIndex, Qt
+
+DIGITS = np.frombuffer(b"0123456789ABCDEF", np.uint8)
+
+
+def column_text(values: np.ndarray, base: int, width: int = None) -> np.ndarray:
+    """ASCII digits of each value as an (n, width) array, decimal columns
+    have their leading zeros replaced by 0 bytes"""
+    values = values.astype(np.uint64)
+    if width is None:
+        width = len(np.base_repr(int(values.max(initial=0)), base))
+    powers = np.uint64(base) ** np.arange(width - 1, -1, -1, dtype=np.uint64)
+    digits = values[:, None] // powers % np.uint64(base)
+    text = DIGITS[digits]
+    if base == 10:
+        leading = np.cumsum(digits != 0, axis=1) == 0
+        leading[:, -1] = False
+        text[leading] = 0
+    return text
+
+
+def rows_text(rows: np.ndarray, columns: list[tuple[int, int]]) -> bytes:
+    """Rows as comma separated lines, columns are (base, width) pairs with a
+    width of None for variable width
+
+    Built with whole array operations so exporting a large result set never
+    formats rows one at a time
+    """
+    rows = rows.reshape(len(rows), -1)
+    separator = np.full((len(rows), 1), ord(","), np.uint8)
+    parts = []
+    for column, (base, width) in enumerate(columns):
+        if column:
+            parts.append(separator)
+        parts.append(column_text(rows[:, column], base, width))
+    parts.append(np.full((len(rows), 1), ord("\n"), np.uint8))
+    text = np.hstack(parts)
+    return text[text != 0].tobytes()
+
+
+class ResultModel(QAbstractListModel):
+    """Results kept in a growable (rows, columns) array, each row is only
+    formatted to a string when a view displays it"""
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.results = np.empty((0, 1), np.int64)
+        self.count = 0
+        self.formatter: Callable[[np.ndarray], str] = str
+
+    def reset(self, columns: int, formatter: Callable[[np.ndarray], str]) -> None:
+        """Drop every result, later batches have columns values per row"""
+        self.beginResetModel()
+        self.results = np.empty((1024, columns), np.int64)
+        self.count = 0
+        self.formatter = formatter
+        self.endResetModel()
+
+    def rows(self) -> np.ndarray:
+        """Every result as a (rows, columns) array"""
+        return self.results[: self.count]
+
+    def append(self, batch: np.ndarray) -> None:
+        """Add a batch of results, one per row"""
+        batch = np.asarray(batch, np.int64).reshape(-1, self.results.shape[1])
+        if not len(batch):
+            return
+        end = self.count + len(batch)
+        if end > len(self.results):
+            grown = np.empty(
+                (max(end, 2 * len(self.results)), self.results.shape[1]), np.int64
+            )
+            grown[: self.count] = self.rows()
+            self.results = grown
+        self.beginInsertRows(QModelIndex(), self.count, end - 1)
+        self.results[self.count : end] = batch
+        self.count = end
+        self.endInsertRows()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        """Number of results"""
+        return 0 if parent.isValid() else self.count
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        """Formatted result of a row"""
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.formatter(self.results[index.row()])
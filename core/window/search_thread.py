@@ -0,0 +1,92 @@
+"""QThread adapters over the Qt-free search engines"""
+
+import importlib
+from qtpy.QtCore import QThread, Signal
+from qtpy.QtWidgets import QMessageBox, QWidget
+
+
+class SearchThread(QThread):
+    """Runs a search engine and forwards its events as signals
+
+    Engines are imported on first use, pyopencl and numba are not needed to
+    show the window
+    """
+
+    # (module in core.shaders, class name) of the engine
+    engine_class: tuple[str, str] = None
+
+    finished = Signal()
+    log = Signal(str)
+    results = Signal(object)
+    result_batch = Signal(object)
+    init_progress_bar = Signal(int)
+    progress = Signal(int)
+    started = Signal()
+    throughput = Signal(object)
+
+    def __init__(self, *args) -> None:
+        super().__init__()
+        module, name = self.engine_class
+        module = importlib.import_module(f"...shaders.{module}", __name__)
+        self.engine = getattr(module, name)(*args)
+
+    def requestInterruption(self) -> None:
+        """Request interruption of both the thread and the engine"""
+        super().requestInterruption()
+        self.engine.request_interruption()
+
+    def run(self) -> None:
+        """Thread work"""
+        try:
+            for event, value in self.engine.run():
+                signal = getattr(self, event)
+                if value is None:
+                    signal.emit()
+                else:
+                    signal.emit(value)
+        finally:
+            self.finished.emit()
+
+
+def offer_resume(parent: QWidget, thread: SearchThread) -> None:
+    """Ask to resume a search from its checkpoint if a previous run left one"""
+    if thread.engine.has_checkpoint():
+        thread.engine.resume = (
+            QMessageBox.question(
+                parent,
+                "Resume Search",
+                "This search was stopped before it finished, "
+                "resume from where it left off?",
+            )
+            == QMessageBox.Yes
+        )
+
+
+class SearchIVThread(SearchThread):
+    """Interface for iv_search shader"""
+
+    engine_class = ("iv_search", "IVSearch")
+
+
+class PokemonBlinkFidgetThread(SearchThread):
+    """Interface for pokemon_blink shader"""
+
+    engine_class = ("pokemon_blink", "PokemonBlinkSearch")
+
+
+class SearchSoaringFidgetThread(SearchThread):
+    """Interface for soaring_fidget shader"""
+
+    engine_class = ("soaring_fidget", "SoaringFidgetSearch")
+
+
+class SearchUniqueHashThread(SearchThread):
+    """Interface for unique_hash shader"""
+
+    engine_class = ("unique_hash", "UniqueHashSearch")
+
+
+class SearchUniqueHashBatchThread(SearchThread):
+    """Interface for unique_hash shader searching many consoles"""
+
+    engine_class = ("unique_hash", "UniqueHashBatchSearch")
@@ -10,13 +10,15 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
     QListWidget,
+    QHBoxLayout,
+    QSpinBox,
 )
 from qtpy.QtCore import Qt
 
 from .range_widget import RangeWidget
 from .opencl_selector import OpenCLSelector
 from .eta_progress_bar import ETAProgressBar
-from ..shaders.soaring_fidget import SearchSoaringFidgetThread
+from .search_thread import offer_resume, SearchSoaringFidgetThread
 
 
 class SoaringFidgetTab(QWidget):
@@ -67,25 +69,41 @@ class SoaringFidgetTab(QWidget):
             self.fidget_button.setText("Start Fidgets")
 
     def display_result(self, result) -> None:
-        """Display the result of the search to a label"""
-        self.result_label.setText(f"Result: {result[0]:08X}")
+        """Add a seed found by the search to the result label"""
+        self.result_label.setText(f"{self.result_label.text()}\n{result:08X}")
+
+    def search_finished(self) -> None:
+        """Reset the search button once the search thread is done"""
+        self.search_thread = None
+        self.search_button.setText("Find Seed")
 
     def search_button_work(self) -> None:
-        """Starts search thread"""
-        platform, device = (
-            self.opencl_selector.get_platform(),
-            self.opencl_selector.get_device(),
-        )
-        assert platform is not None and device is not None
+        """Starts search thread, or stops it if one is running"""
+        if self.search_thread is not None:
+            self.search_thread.requestInterruption()
+            self.search_thread.wait()
+            return
+        devices = self.opencl_selector.get_devices()
+        if devices is None:
+            return
 
+        self.result_label.setText("Result:")
+        self.search_button.setText("Stop Search")
         self.search_thread = SearchSoaringFidgetThread(
-            platform, device, self.fidget_gaps[1:], self.advance_range.get_range()
+            devices, self.fidget_gaps[1:], self.advance_range.get_range()
         )
+        self.search_thread.engine.max_results = self.max_results_spinbox.value() or None
         self.search_thread.results.connect(self.display_result)
         self.search_thread.init_progress_bar.connect(
             self.search_progress_bar.setMaximum
         )
         self.search_thread.progress.connect(self.search_progress_bar.setValue)
+        self.search_thread.throughput.connect(
+            self.search_progress_bar.set_throughput
+        )
+        self.search_thread.log.connect(self.search_progress_bar.log)
+        self.search_thread.finished.connect(self.search_finished)
+        offer_resume(self, self.search_thread)
         self.search_thread.start()
 
     def setup_widgets(self) -> None:
@@ -94,6 +112,13 @@ class SoaringFidgetTab(QWidget):
         self.advance_range = RangeWidget(0, 200, "Advance Range")
         self.advance_range.min_entry.setValue(40)
         self.advance_range.max_entry.setValue(100)
+        self.max_results_widget = QWidget()
+        self.max_results_layout = QHBoxLayout(self.max_results_widget)
+        self.max_results_spinbox = QSpinBox()
+        self.max_results_spinbox.setSpecialValueText("All")
+        self.max_results_spinbox.setValue(1)
+        self.max_results_layout.addWidget(QLabel("Stop After:"))
+        self.max_results_layout.addWidget(self.max_results_spinbox)
         self.fidget_gaps_widget = QListWidget()
         self.info_progress_bar = QProgressBar()
         self.fidget_button = QPushButton("Start Fidgets")
@@ -108,6 +133,7 @@ class SoaringFidgetTab(QWidget):
         )
 
         self.main_layout.addWidget(self.advance_range)
+        self.main_layout.addWidget(self.max_results_widget)
         self.main_layout.addWidget(self.fidget_gaps_widget)
         self.main_layout.addWidget(self.info_progress_bar)
         self.main_layout.addWidget(self.fidget_button)
@@ -1,6 +1,6 @@
 """Widget for the unique hash tab in the main window"""
 
-import struct
+import os
 from qtpy.QtWidgets import (
     QVBoxLayout,
     QLabel,
@@ -8,14 +8,23 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
     QFileDialog,
-    QCheckBox,
+    QComboBox,
+    QLineEdit,
 )
+from qtpy.QtGui import QRegularExpressionValidator
 from qtpy.QtCore import Qt
-from Crypto.Cipher import AES
+from qtpy import QtCore
 
 from .opencl_selector import OpenCLSelector
 from .eta_progress_bar import ETAProgressBar
-from ..shaders.unique_hash import SearchUniqueHashThread
+from .search_thread import (
+    offer_resume,
+    SearchUniqueHashThread,
+    SearchUniqueHashBatchThread,
+)
+
+# console types of the console combo box, None searches both
+CONSOLE_TYPES = {"Old 3DS": False, "New 3DS": True, "Old or New 3DS": None}
 
 
 class UniqueHashTab(QWidget):
@@ -26,11 +35,39 @@ class UniqueHashTab(QWidget):
         self.opencl_selector = opencl_selector
         self.setup_widgets()
         self.search_thread = None
-        self.hash_0 = None
+        # (path, (low, high)) of each selected input.bin
+        self.hashes: list[tuple[str, tuple[int, int]]] = []
+        self.hash_directory = ""
 
     def display_result(self, result) -> None:
         """Display the result of the search to a label"""
-        self.result_label.setText(f"Result: {result:08X}")
+        if isinstance(result, int):
+            self.result_label.setText(f"Result: {result:08X}")
+            return
+        index, unique_hash, _lfcs, ds_type = result
+        path = os.path.relpath(self.hashes[index][0], self.hash_directory)
+        self.result_label.setText(
+            self.result_label.text()
+            + f"\n{path}: {unique_hash:08X} ({'New' if ds_type else 'Old'} 3DS)"
+        )
+
+    def select_bins(self, filenames: list[str], directory: str) -> None:
+        """Decrypt the console hashes of selected input.bin files"""
+        # pylint: disable-next=import-outside-toplevel
+        from ..shaders.unique_hash import read_input_bin
+
+        self.hash_directory = directory
+        self.hashes = []
+        for filename in filenames:
+            with open(filename, "rb") as f:
+                self.hashes.append((filename, read_input_bin(f.read())))
+        self.select_label.setText(
+            f"{len(self.hashes)} input.bin files selected"
+            if len(self.hashes) != 1
+            else os.path.basename(filenames[0])
+        )
+        self.search_button.setEnabled(bool(self.hashes))
+        self.search_progress_bar.reset()
 
     def select_bin_work(self) -> None:
         """Open file selector for input.bin"""
@@ -38,36 +75,66 @@ class UniqueHashTab(QWidget):
             self, "Select input.bin", "", "bin files (*.bin)"
         )
         if filename:
-            with open(filename, "rb") as f:
-                enc = f.read()
-            key = (0x59FC817E6446EA6190347B20E9BDCE52).to_bytes(16, "big")
-            assert len(enc) == 0x70
-            nonce = enc[:8] + b"\x00" * 4
-            cipher = AES.new(key, AES.MODE_CCM, nonce)
-            dec = cipher.decrypt(enc[8:0x60])
-            nonce = nonce[:8]
-            final = dec[:12] + nonce + dec[12:]
-            # GenHashConsoleUnique(0)
-            self.hash_0 = struct.unpack("<II", final[4 : 4 + 8])
-            self.search_button.setEnabled(True)
-            self.search_progress_bar.reset()
+            self.select_bins([filename], os.path.dirname(filename))
+
+    def select_directory_work(self) -> None:
+        """Open directory selector for a folder of input.bin files, searched
+        for all at once"""
+        directory = QFileDialog.getExistingDirectory(self, "Select input.bin folder")
+        if directory:
+            # pylint: disable-next=import-outside-toplevel
+            from ..shaders.unique_hash import find_input_bins
+
+            self.select_bins(list(map(str, find_input_bins(directory))), directory)
+
+    def search_finished(self) -> None:
+        """Reset the search button once the search thread is done"""
+        self.search_thread = None
+        self.search_button.setText("Find Hash")
 
     def search_button_work(self) -> None:
-        """Starts search thread"""
-        platform, device = (
-            self.opencl_selector.get_platform(),
-            self.opencl_selector.get_device(),
-        )
-        assert platform is not None and device is not None
+        """Starts search thread, or stops it if one is running"""
+        if self.search_thread is not None:
+            self.search_thread.requestInterruption()
+            self.search_thread.wait()
+            return
+        devices = self.opencl_selector.get_devices()
+        if devices is None:
+            return
 
-        self.search_thread = SearchUniqueHashThread(
-            platform, device, self.new_3ds_checkbox.isChecked(), *self.hash_0
+        lfcs_start = (
+            int(lfcs_str, 16) if (lfcs_str := self.lfcs_start_input.text()) else None
         )
+        new_3ds = CONSOLE_TYPES[self.console_combo.currentText()]
+        self.search_button.setText("Stop Search")
+        self.result_label.setText("Result:")
+        if len(self.hashes) == 1 and new_3ds is not None:
+            self.search_thread = SearchUniqueHashThread(
+                devices, new_3ds, *self.hashes[0][1], lfcs_start
+            )
+        else:
+            # pylint: disable-next=import-outside-toplevel
+            from ..shaders.unique_hash import HashTarget
+
+            self.search_thread = SearchUniqueHashBatchThread(
+                devices,
+                [
+                    HashTarget(low, high, new_3ds, filename)
+                    for filename, (low, high) in self.hashes
+                ],
+                lfcs_start,
+            )
         self.search_thread.results.connect(self.display_result)
         self.search_thread.init_progress_bar.connect(
             self.search_progress_bar.setMaximum
         )
         self.search_thread.progress.connect(self.search_progress_bar.setValue)
+        self.search_thread.throughput.connect(
+            self.search_progress_bar.set_throughput
+        )
+        self.search_thread.log.connect(self.search_progress_bar.log)
+        self.search_thread.finished.connect(self.search_finished)
+        offer_resume(self, self.search_thread)
         self.search_thread.start()
 
     def setup_widgets(self) -> None:
@@ -75,7 +142,16 @@ class UniqueHashTab(QWidget):
         self.main_layout = QVBoxLayout(self)
         self.select_bin = QPushButton("Select input.bin")
         self.select_bin.clicked.connect(self.select_bin_work)
-        self.new_3ds_checkbox = QCheckBox("New 3DS")
+        self.select_directory = QPushButton("Select input.bin folder")
+        self.select_directory.clicked.connect(self.select_directory_work)
+        self.select_label = QLabel("No input.bin selected")
+        self.console_combo = QComboBox()
+        self.console_combo.addItems(CONSOLE_TYPES)
+        self.lfcs_start_input = QLineEdit()
+        self.lfcs_start_input.setPlaceholderText("Starting LFCS (optional)")
+        self.lfcs_start_input.setValidator(
+            QRegularExpressionValidator(QtCore.QRegularExpression("[0-9a-fA-F]{0,8}"))
+        )
         self.search_button = QPushButton("Find Hash")
         self.search_button.setEnabled(False)
         self.search_button.clicked.connect(self.search_button_work)
@@ -86,7 +162,10 @@ class UniqueHashTab(QWidget):
         )
 
         self.main_layout.addWidget(self.select_bin)
-        self.main_layout.addWidget(self.new_3ds_checkbox)
+        self.main_layout.addWidget(self.select_directory)
+        self.main_layout.addWidget(self.select_label)
+        self.main_layout.addWidget(self.console_combo)
+        self.main_layout.addWidget(self.lfcs_start_input)
         self.main_layout.addWidget(self.search_button)
         self.main_layout.addWidget(self.search_progress_bar)
         self.main_layout.addWidget(self.result_label)
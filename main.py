@@ -3,6 +3,7 @@
 import sys
 import qdarkstyle
 from core.window.main_window import MainWindow
+from core.shaders.verifiers import warm_up
 from qtpy.QtWidgets import QApplication
 
 if __name__ == "__main__":
@@ -12,5 +13,6 @@ if __name__ == "__main__":
     app.setStyleSheet(qdarkstyle.load_stylesheet())
     window.show()
     window.setFocus()
+    warm_up()
 
     sys.exit(app.exec())
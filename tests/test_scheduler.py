@@ -0,0 +1,79 @@
+"""Tests for the chunk scheduler"""
+
+import threading
+import time
+
+from core.shaders.scheduler import ChunkScheduler
+
+
+class FakeDevice:
+    """Stand-in for a cl.Device"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class FakeState:
+    """Stand-in for a DeviceState"""
+
+    def release(self) -> None:
+        """Nothing to release"""
+
+    def take_events(self) -> list:
+        """No profiled events"""
+        return []
+
+
+class SlowVerifierEngine:
+    """Engine whose chunks are instant on the device but slow to verify, so
+    device threads finish while verifications are still running"""
+
+    pipeline_depth = 2
+
+    def __init__(self, devices: list[FakeDevice], delay: float) -> None:
+        self.devices = devices
+        self.delay = delay
+        self.interruption_requested = threading.Event()
+
+    def is_interruption_requested(self) -> bool:
+        return self.interruption_requested.is_set()
+
+    def setup_device(self, _device: FakeDevice) -> FakeState:
+        return FakeState()
+
+    def launched_seeds(self, _state: FakeState) -> int:
+        return 1
+
+    def enqueue_chunk(self, _state: FakeState, chunk: int) -> int:
+        return chunk
+
+    def collect_chunk(self, _state: FakeState, pending: int) -> list[int]:
+        return [pending]
+
+    def verify_chunk(self, candidates: list[int]) -> list[int]:
+        time.sleep(self.delay)
+        return [candidate * 2 for candidate in candidates]
+
+
+class SlowHandoverScheduler(ChunkScheduler):
+    """Scheduler whose verified chunks take a while to be handed over, widening
+    the gap between a verification finishing and its result being queued"""
+
+    def verified(self, *args) -> None:
+        time.sleep(0.05)
+        super().verified(*args)
+
+
+def test_every_chunk_reaches_consumer_with_slow_verifier():
+    """The last chunks' results are yielded even when their verification
+    finishes after the device threads have run out of work"""
+    for devices in (1, 3):
+        engine = SlowVerifierEngine(
+            [FakeDevice(f"device {index}") for index in range(devices)], 0.02
+        )
+        chunks = list(range(12))
+        results = {
+            chunk: verified
+            for chunk, verified, _ in SlowHandoverScheduler(engine, chunks).run()
+        }
+        assert results == {chunk: [chunk * 2] for chunk in chunks}
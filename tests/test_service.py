@@ -0,0 +1,77 @@
+"""Tests for the job service"""
+
+import asyncio
+
+from core.service import JobService
+from core.shaders.engine import SearchEngine
+
+
+class CountingSearch(SearchEngine):
+    """Engine yielding a result per chunk over many chunks, stopping early
+    once max_results have been found, limit is its own built-in cap"""
+
+    name = "counting"
+    limit: int = None
+
+    def __init__(self, devices: list) -> None:
+        super().__init__(devices)
+        self.max_results = self.limit
+
+    @classmethod
+    def from_spec(cls, devices: list, spec: dict) -> "CountingSearch":
+        return cls(devices)
+
+    def spec(self) -> dict:
+        return {}
+
+    def run(self):
+        for chunk in range(100):
+            if self.max_results is not None and chunk >= self.max_results:
+                break
+            yield "results", chunk
+            yield "progress", chunk + 1
+
+
+class LimitedSearch(CountingSearch):
+    """Engine that stops at its first result, as a unique hash search does"""
+
+    name = "limited"
+    limit = 1
+
+
+def run_job(search: str, max_results: int = None) -> tuple[list, SearchEngine]:
+    """Results of one job run through run_batch, and the engine it ran on"""
+
+    async def run():
+        service = JobService(
+            [None], {"counting": CountingSearch, "limited": LimitedSearch}
+        )
+        job = service.submit(search, {}, max_results=max_results)
+        batch = service.take_batch()
+        await asyncio.to_thread(
+            service.run_batch, None, batch, asyncio.get_running_loop()
+        )
+        # let the results handed back to the loop reach the job
+        await asyncio.sleep(0)
+        results = []
+        while not job.events.empty():
+            event, value = job.events.get_nowait()
+            if event == "results":
+                results.append(value)
+        return results, job.engine
+
+    return asyncio.run(run())
+
+
+def test_run_batch_keeps_engine_limit():
+    """A job without max_results keeps the engine's built-in limit, and a job
+    limit only ever lowers it"""
+    results, engine = run_job("limited")
+    assert (results, engine.max_results) == ([0], 1)
+    results, engine = run_job("limited", 5)
+    assert (results, engine.max_results) == ([0], 1)
+    results, engine = run_job("counting")
+    assert (len(results), engine.max_results) == (100, None)
+    results, engine = run_job("counting", 3)
+    assert (results, engine.max_results) == ([0, 1, 2], 3)
+    assert not engine.checkpointing